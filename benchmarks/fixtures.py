@@ -0,0 +1,135 @@
+"""
+Builds small random-weight models and synthetic source records, so the benchmarks run without the real models in the
+metadata_models volume and without network access.
+"""
+import os
+import random
+import string
+from typing import List
+
+import torch
+from transformers import BertConfig, BertForSequenceClassification, BertTokenizerFast
+
+SESAR_MATERIAL_CLASSES = [
+    "Biology", "EarthMaterial", "Gas", "Ice", "Liquid", "Material", "Mineral", "NotApplicable", "Organic Material",
+    "Other", "Particulate", "Rock", "Sediment", "Soil", "experimentalMaterial",
+]
+OPENCONTEXT_MATERIAL_CLASSES = [
+    "mat:anthropogenicmetal", "mat:anyanthropogenicmeterial", "mat:biogenicnonorganicmaterial", "mat:mineral",
+    "mat:organicmaterial", "mat:otheranthropogenicmaterial", "mat:rock",
+]
+OPENCONTEXT_SAMPLE_CLASSES = [
+    "architectural element", "clothing", "coin", "container", "domestic item", "object", "ornament",
+    "parts of lived things", "photograph", "sherd", "tile", "utility item", "weapon", "weight",
+]
+
+# words that the synthetic records are made of, and that make up the vocabulary together with single characters
+_WORDS = [
+    "rock", "sediment", "soil", "water", "core", "sample", "material", "bone", "animal", "coin", "sherd", "pottery",
+    "basalt", "granite", "shale", "sand", "clay", "mud", "gravel", "ash", "leather", "metal", "glass", "tile",
+    "dredge", "grab", "cruise", "section", "piece", "fragment", "trench", "locus", "temple", "fort", "area", "unit",
+    "marine", "volcanic", "sedimentary", "igneous", "organic", "mineral", "fluid", "gas", "ice", "frozen",
+]
+_SESAR_SAMPLE_TYPES = ["Individual Sample", "Core", "Core Section", "Dredge", "Grab", "Individual Sample>Cylinder"]
+_SESAR_MATERIALS = ["Rock", "Sediment", "Soil", "Mineral", "Biology", "Organic Material"]
+_SESAR_PROGRAMS = ["TN300", "IODP 344", "AT26-10", ""]
+_SESAR_LOCATION_TYPES = ["outcrop", "seafloor", "wetland", "river bank"]
+_OPENCONTEXT_CATEGORIES = ["Object", "Animal Bone", "Pottery", "Coin", "Architectural Element"]
+
+
+def _vocabulary() -> List[str]:
+    characters = list(string.ascii_lowercase) + list(string.digits) + list(string.punctuation)
+    return (
+        ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+        + characters
+        + _WORDS
+        + ["##" + character for character in string.ascii_lowercase + string.digits]
+    )
+
+
+def build_model(directory: str, class_names: List[str], max_sequence_len: int = 256, seed: int = 0) -> dict:
+    """
+    Writes a randomly initialized BertForSequenceClassification and its tokenizer to the directory
+
+    :return: the model config json, with the directory as both BERT_MODEL and FINE_TUNED_MODEL
+    """
+    os.makedirs(directory, exist_ok=True)
+    vocab_path = os.path.join(directory, "vocab.txt")
+    with open(vocab_path, "w") as vocab_file:
+        vocab_file.write("\n".join(_vocabulary()))
+    BertTokenizerFast(vocab_path).save_pretrained(directory)
+    torch.manual_seed(seed)
+    bert_config = BertConfig(
+        vocab_size=len(_vocabulary()),
+        hidden_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=2,
+        intermediate_size=128,
+        max_position_embeddings=512,
+        num_labels=len(class_names),
+    )
+    BertForSequenceClassification(bert_config).save_pretrained(directory)
+    return {
+        "BERT_MODEL": directory,
+        "FINE_TUNED_MODEL": directory,
+        "CLASS_NAMES": class_names,
+        "MAX_SEQUENCE_LEN": max_sequence_len,
+    }
+
+
+def build_fasttext_model(path: str, seed: int = 0):
+    """Trains a tiny supervised fastText model on synthetic context strings and saves it to the path"""
+    import fasttext
+
+    rng = random.Random(seed)
+    labels = ["Marine_water_body", "Terrestrial_environment", "Lake_river_or_stream_bottom", "Subsurface"]
+    training_path = path + ".train.txt"
+    with open(training_path, "w") as training_file:
+        for _ in range(500):
+            label = rng.choice(labels)
+            words = " ".join(rng.choice(_WORDS) for _ in range(6))
+            training_file.write(f"__label__{label} {label.lower().replace('_', ' ')} {words}\n")
+    model = fasttext.train_supervised(training_path, epoch=5, dim=16, thread=1, seed=seed, verbose=0)
+    model.save_model(path)
+    os.remove(training_path)
+
+
+def _text(rng: random.Random, word_count: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(word_count))
+
+
+def sesar_record(rng: random.Random, index: int) -> dict:
+    """Returns a synthetic SESAR source record.  The index makes the record's model input text unique, so the caches
+    don't hide the model time."""
+    return {
+        "@id": f"https://data.geosamples.org/sample/igsn/BEN{index:06d}",
+        "igsn": f"BEN{index:06d}",
+        "description": {
+            "sampleType": rng.choice(_SESAR_SAMPLE_TYPES),
+            "material": rng.choice(_SESAR_MATERIALS),
+            "collectionMethod": rng.choice(["Dredge", "Coring", "Grab", "Manual"]),
+            "description": f"{_text(rng, rng.randint(3, 30))} sample {index}",
+            "supplementMetadata": {
+                "cruiseFieldPrgrm": rng.choice(_SESAR_PROGRAMS),
+                "primaryLocationType": rng.choice(_SESAR_LOCATION_TYPES),
+                "locality": _text(rng, rng.randint(1, 5)),
+                "geologicalUnit": _text(rng, 2),
+            },
+        },
+    }
+
+
+def opencontext_record(rng: random.Random, index: int) -> dict:
+    """Returns a synthetic OpenContext source record, unique by index"""
+    early = rng.randint(-3000, 1800)
+    return {
+        "uri": f"http://opencontext.org/subjects/bench-{index}",
+        "label": f"Bench {index}",
+        "project label": f"{_text(rng, 2)} excavations",
+        "context label": "/".join(_text(rng, 2) for _ in range(rng.randint(2, 5))) + f"/locus {index}",
+        "item category": rng.choice(_OPENCONTEXT_CATEGORIES),
+        "early bce/ce": float(early),
+        "late bce/ce": float(early + rng.randint(0, 500)),
+        "Consists of": [{"id": "http://vocab.getty.edu/aat/0", "label": rng.choice(_WORDS)}],
+        "Has type": [{"id": "http://vocab.getty.edu/aat/1", "label": rng.choice(_WORDS)}],
+    }
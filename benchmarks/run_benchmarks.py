@@ -0,0 +1,307 @@
+"""
+Measures the throughput and latency of the prediction paths against small random-weight models.
+
+Usage:
+    python -m benchmarks.run_benchmarks [--output benchmark_results.json] [--iterations 200] [--baseline old.json]
+
+Each benchmark runs its prediction path over freshly generated synthetic records, so the prediction and tokenization
+caches always miss, and reports the throughput along with the mean, p50 and p99 latency of a call.  The models are
+used without micro batching, so the sequential calls don't wait out the batching window.  The results are written as
+JSON together with the versions they were measured with; passing the results of an earlier run as --baseline prints
+the throughput change of every benchmark.
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import torch
+import transformers
+from starlette.testclient import TestClient
+
+from benchmarks import fixtures
+from isamples_metadata.taxonomy.Model import Model
+from isamples_metadata.taxonomy.isamplesfasttext import SampledFeaturePredictor
+from isamples_metadata.taxonomy.metadata_models import (
+    OpenContextMaterialPredictor,
+    OpenContextSamplePredictor,
+    SESARMaterialPredictor,
+)
+
+
+# the benchmark groups that can be selected with --groups
+GROUPS = ("model", "predictors", "endpoints", "fasttext")
+
+
+def measure(fn: Callable[[Any], Any], inputs: List[Any], items_per_call: int = 1, warmup: int = 5) -> dict:
+    """Calls fn on each of the inputs, after warming up on the first few, and returns the timing statistics"""
+    for item in inputs[:warmup]:
+        fn(item)
+    latencies = []
+    start = time.perf_counter()
+    for item in inputs:
+        call_start = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "calls": len(inputs),
+        "items": len(inputs) * items_per_call,
+        "throughput_per_second": len(inputs) * items_per_call / elapsed,
+        "mean_ms": float(latencies_ms.mean()),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+    }
+
+
+class RecordSource:
+    """Hands out synthetic records that are never repeated within a run"""
+
+    def __init__(self, seed: int):
+        self._rng = random.Random(seed)
+        self._indices = itertools.count()
+
+    def sesar(self, count: int) -> List[dict]:
+        return [fixtures.sesar_record(self._rng, next(self._indices)) for _ in range(count)]
+
+    def opencontext(self, count: int) -> List[dict]:
+        return [fixtures.opencontext_record(self._rng, next(self._indices)) for _ in range(count)]
+
+
+def _batches(items: List[Any], batch_size: int) -> List[List[Any]]:
+    return [items[start:start + batch_size] for start in range(0, len(items), batch_size)]
+
+
+def _sesar_texts(records: List[dict]) -> List[str]:
+    from isamples_metadata.taxonomy.SESARClassifierInput import SESARClassifierInput
+
+    texts = []
+    for record in records:
+        sesar_input = SESARClassifierInput(record)
+        sesar_input.parse_thing()
+        texts.append(sesar_input.get_material_text())
+    return texts
+
+
+def model_benchmarks(model: Model, records: RecordSource, iterations: int, batch_size: int) -> Iterator[tuple]:
+    yield "model_predict", measure(model.predict, _sesar_texts(records.sesar(iterations)))
+    yield f"model_predict_batch_{batch_size}", measure(
+        model.predict_batch,
+        _batches(_sesar_texts(records.sesar(iterations * batch_size)), batch_size),
+        items_per_call=batch_size,
+    )
+
+
+def predictor_benchmarks(
+    sesar: SESARMaterialPredictor,
+    oc_material: OpenContextMaterialPredictor,
+    oc_sample: OpenContextSamplePredictor,
+    records: RecordSource,
+    iterations: int,
+) -> Iterator[tuple]:
+    yield "sesar_predict_material_type", measure(sesar.predict_material_type, records.sesar(iterations))
+    yield "opencontext_predict_material_type", measure(
+        oc_material.predict_material_type, records.opencontext(iterations)
+    )
+    yield "opencontext_predict_sample_type", measure(oc_sample.predict_sample_type, records.opencontext(iterations))
+
+
+def endpoint_benchmarks(
+    client: TestClient, records: RecordSource, iterations: int, batch_size: int
+) -> Iterator[tuple]:
+    def post(path: str) -> Callable[[dict], None]:
+        def call(body: dict):
+            response = client.post(path, json=body)
+            response.raise_for_status()
+
+        return call
+
+    yield "endpoint_sesar", measure(
+        post("/sesar"), [{"type": "material", "source_record": record} for record in records.sesar(iterations)]
+    )
+    yield "endpoint_sesar_batch", measure(
+        post("/sesar/batch"),
+        [
+            {"type": "material", "source_records": batch}
+            for batch in _batches(records.sesar(iterations * batch_size), batch_size)
+        ],
+        items_per_call=batch_size,
+    )
+    yield "endpoint_opencontext_material", measure(
+        post("/opencontext"),
+        [{"type": "material", "source_record": record} for record in records.opencontext(iterations)],
+    )
+    yield "endpoint_opencontext_sample", measure(
+        post("/opencontext"),
+        [{"type": "sample", "source_record": record} for record in records.opencontext(iterations)],
+    )
+
+
+def fasttext_benchmarks(
+    predictor: SampledFeaturePredictor, client: TestClient, records: RecordSource, iterations: int, batch_size: int
+) -> Iterator[tuple]:
+    def contexts(count: int) -> List[List[str]]:
+        return [
+            [record["description"]["description"], record["description"]["supplementMetadata"]["locality"]]
+            for record in records.sesar(count)
+        ]
+
+    yield "fasttext_predict_sampled_feature", measure(predictor.predict_sampled_feature, contexts(iterations))
+
+    def call(context: List[str]):
+        client.post("/smithsonian", json={"type": "context", "input": context}).raise_for_status()
+
+    yield "endpoint_smithsonian", measure(call, contexts(iterations))
+    yield f"fasttext_predict_sampled_features_batch_{batch_size}", measure(
+        predictor.predict_sampled_features,
+        _batches(contexts(iterations * batch_size), batch_size),
+        items_per_call=batch_size,
+    )
+
+    def call_batch(batch: List[List[str]]):
+        client.post("/smithsonian/batch", json={"type": "context", "inputs": batch, "top_k": 3}).raise_for_status()
+
+    yield "endpoint_smithsonian_batch", measure(
+        call_batch, _batches(contexts(iterations * batch_size), batch_size), items_per_call=batch_size
+    )
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, cwd=os.path.dirname(__file__)
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _environment(args: argparse.Namespace) -> dict:
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "transformers": transformers.__version__,
+        "iterations": args.iterations,
+        "batch_size": args.batch_size,
+        "seed": args.seed,
+        "groups": args.groups,
+    }
+
+
+def run_benchmarks(
+    iterations: int, batch_size: int, seed: int, work_directory: str, groups: Sequence[str] = GROUPS
+) -> Dict[str, dict]:
+    """Builds the fixture models in the work directory and returns the results of the benchmarks of the groups, keyed
+    by name"""
+    import main
+
+    sesar_model = Model(
+        fixtures.build_model(os.path.join(work_directory, "sesar"), fixtures.SESAR_MATERIAL_CLASSES, seed=seed),
+        "SESAR-material",
+    )
+    oc_material_model = Model(
+        fixtures.build_model(
+            os.path.join(work_directory, "oc_material"), fixtures.OPENCONTEXT_MATERIAL_CLASSES, seed=seed
+        ),
+        "OPENCONTEXT-material",
+    )
+    oc_sample_model = Model(
+        fixtures.build_model(os.path.join(work_directory, "oc_sample"), fixtures.OPENCONTEXT_SAMPLE_CLASSES, seed=seed),
+        "OPENCONTEXT-sample",
+    )
+    sesar = SESARMaterialPredictor(sesar_model)
+    oc_material = OpenContextMaterialPredictor(oc_material_model)
+    oc_sample = OpenContextSamplePredictor(oc_sample_model)
+    # the fastText model is only trained if it's benchmarked
+    sampled_feature = SampledFeaturePredictor("Smithsonian", None)
+    if "fasttext" in groups:
+        import fasttext
+
+        fasttext_path = os.path.join(work_directory, "sampled_feature.bin")
+        fixtures.build_fasttext_model(fasttext_path, seed=seed)
+        sampled_feature = SampledFeaturePredictor("Smithsonian", fasttext.load_model(fasttext_path))
+    main.app.dependency_overrides.update({
+        main.get_sesar_material_type_predictor: lambda: sesar,
+        main.get_opencontext_material_type_predictor: lambda: oc_material,
+        main.get_opencontext_sample_type_predictor: lambda: oc_sample,
+        main.get_smithsonian_sampled_feature_predictor: lambda: sampled_feature,
+    })
+    records = RecordSource(seed)
+    results = {}
+    try:
+        client = TestClient(main.app)
+        benchmarks = {
+            "model": lambda: model_benchmarks(sesar_model, records, iterations, batch_size),
+            "predictors": lambda: predictor_benchmarks(sesar, oc_material, oc_sample, records, iterations),
+            "endpoints": lambda: endpoint_benchmarks(client, records, iterations, batch_size),
+            "fasttext": lambda: fasttext_benchmarks(sampled_feature, client, records, iterations, batch_size),
+        }
+        for name, result in itertools.chain.from_iterable(benchmarks[group]() for group in groups):
+            logging.info(
+                "%s: %.1f items/sec, p50 %.2f ms, p99 %.2f ms",
+                name,
+                result["throughput_per_second"],
+                result["p50_ms"],
+                result["p99_ms"],
+            )
+            results[name] = result
+    finally:
+        main.app.dependency_overrides.clear()
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict]) -> List[str]:
+    """Returns a line per benchmark with its throughput change relative to the baseline"""
+    lines = []
+    for name, result in results.items():
+        if name not in baseline:
+            lines.append(f"{name}: not in the baseline")
+            continue
+        change = result["throughput_per_second"] / baseline[name]["throughput_per_second"] - 1
+        lines.append(
+            f"{name}: {result['throughput_per_second']:.1f} items/sec ({change:+.1%}), "
+            f"p99 {result['p99_ms']:.2f} ms (was {baseline[name]['p99_ms']:.2f} ms)"
+        )
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the prediction paths with small random-weight models")
+    parser.add_argument("--output", default="benchmark_results.json", help="path to write the JSON results to")
+    parser.add_argument("--iterations", type=int, default=200, help="calls per benchmark")
+    parser.add_argument("--batch-size", type=int, default=16, help="records per call of the batch benchmarks")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--threads", type=int, help="torch intra-op threads, defaults to torch's choice")
+    parser.add_argument("--baseline", help="results of an earlier run to compare against")
+    parser.add_argument("--groups", nargs="+", choices=GROUPS, default=list(GROUPS), help="benchmarks to run")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    with tempfile.TemporaryDirectory() as work_directory:
+        results = run_benchmarks(args.iterations, args.batch_size, args.seed, work_directory, args.groups)
+    with open(args.output, "w") as output_file:
+        json.dump({"environment": _environment(args), "results": results}, output_file, indent=2)
+    logging.info("Wrote the results to %s", args.output)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+        for line in compare(results, baseline):
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
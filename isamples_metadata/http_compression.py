@@ -0,0 +1,321 @@
+"""
+ASGI middleware that decodes gzip and zstd compressed request bodies while they're received, and compresses the
+responses with the content coding negotiated from the Accept-Encoding header.
+
+Request bodies are decompressed a bounded chunk at a time as the app reads them, so a large bulk upload is never held
+fully decompressed in memory.  Streaming responses are compressed and flushed chunk by chunk.
+"""
+import zlib
+from typing import Iterator, Optional, Tuple, Type, Union
+
+import anyio
+import zstandard
+from fastapi import HTTPException
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from isamples_metadata.response_encoding import parse_accept
+
+# the most decompressed bytes handed to the app in one message, so a small compressed chunk can't expand into a huge one
+DECOMPRESSED_CHUNK_SIZE = 65536
+# zstandard's decompressobj has no output limit, so the input is fed to it a block at a time, and a zstd block
+# decompresses to at most 128 KiB
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_ZSTD_BLOCK_HEADER_SIZE = 3
+_ZSTD_CHECKSUM_SIZE = 4
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+# the content codings the server decodes and encodes, in order of preference
+SUPPORTED_CODINGS = ("zstd", "gzip")
+
+
+class _IncompleteBodyError(ValueError):
+    pass
+
+
+def _check_complete(content_coding: str, eof: bool, unused_data: bytes):
+    if not eof:
+        raise _IncompleteBodyError(f"the {content_coding} stream is truncated")
+    if unused_data:
+        raise _IncompleteBodyError(f"data follows the end of the {content_coding} stream")
+
+
+class _GzipDecoder:
+    errors: Tuple[Type[Exception], ...] = (zlib.error, _IncompleteBodyError)
+
+    def __init__(self):
+        # 16 + MAX_WBITS reads the gzip header and trailer
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decode(self, data: bytes) -> Iterator[bytes]:
+        chunk = self._decompressor.decompress(data, DECOMPRESSED_CHUNK_SIZE)
+        if chunk:
+            yield chunk
+        while self._decompressor.unconsumed_tail:
+            chunk = self._decompressor.decompress(self._decompressor.unconsumed_tail, DECOMPRESSED_CHUNK_SIZE)
+            if chunk:
+                yield chunk
+
+    def check_complete(self):
+        """Raises _IncompleteBodyError unless the body was a single whole gzip stream"""
+        _check_complete("gzip", self._decompressor.eof, self._decompressor.unused_data)
+
+
+class _ZstdBlockSplitter:
+    """Splits a zstd frame after each of its blocks, reading the frame and block headers as they arrive.  Whatever
+    follows the frame, or a stream that doesn't start with a zstd frame, is passed on whole for the decompressor to
+    reject."""
+
+    def __init__(self):
+        self._header = bytearray()
+        # the magic number and the frame header descriptor, which gives the size of the rest of the frame header
+        self._header_size = 5
+        self._in_frame_header = True
+        # the bytes left of the current block's content, or of the checksum
+        self._remaining = 0
+        self._in_block = False
+        self._last_block = False
+        self._checksum = False
+        self._passthrough = False
+
+    def _read_frame_header(self):
+        if bytes(self._header[:4]) != _ZSTD_MAGIC:
+            self._passthrough = True
+            return
+        descriptor = self._header[4]
+        single_segment = descriptor & 0x20
+        content_size_bytes = (1 if single_segment else 0, 2, 4, 8)[descriptor >> 6]
+        header_size = 5 + (0 if single_segment else 1) + (0, 1, 2, 4)[descriptor & 0x03] + content_size_bytes
+        self._checksum = bool(descriptor & 0x04)
+        if len(self._header) < header_size:
+            self._header_size = header_size
+            return
+        self._in_frame_header = False
+        self._header_size = _ZSTD_BLOCK_HEADER_SIZE
+
+    def _read_block_header(self):
+        block_header = int.from_bytes(self._header, "little")
+        self._last_block = bool(block_header & 1)
+        # an RLE block's content is the single byte it repeats
+        self._remaining = 1 if (block_header >> 1) & 0x03 == 1 else block_header >> 3
+        self._in_block = True
+
+    def _end_block(self):
+        self._in_block = False
+        if self._last_block:
+            self._remaining = _ZSTD_CHECKSUM_SIZE if self._checksum else 0
+            self._passthrough = not self._checksum
+
+    def _read_header(self, data: bytes, position: int) -> int:
+        end = min(len(data), position + self._header_size - len(self._header))
+        self._header += data[position:end]
+        if len(self._header) == self._header_size:
+            if self._in_frame_header:
+                self._read_frame_header()
+            else:
+                self._read_block_header()
+            if not self._in_frame_header:
+                self._header.clear()
+        return end
+
+    def split(self, data: bytes) -> Iterator[bytes]:
+        """Yields the data in pieces that each hold at most the end of one block"""
+        start = position = 0
+        while position < len(data) and not self._passthrough:
+            if self._remaining > 0:
+                step = min(self._remaining, len(data) - position)
+                position += step
+                self._remaining -= step
+                if self._remaining == 0 and not self._in_block:
+                    # the checksum ends the frame
+                    self._passthrough = True
+            else:
+                position = self._read_header(data, position)
+            if self._in_block and self._remaining == 0:
+                yield data[start:position]
+                start = position
+                self._end_block()
+        if start < len(data):
+            yield data[start:]
+
+
+class _ZstdDecoder:
+    errors: Tuple[Type[Exception], ...] = (zstandard.ZstdError, _IncompleteBodyError)
+
+    def __init__(self):
+        self._decompressor = zstandard.ZstdDecompressor().decompressobj()
+        self._splitter = _ZstdBlockSplitter()
+
+    def decode(self, data: bytes) -> Iterator[bytes]:
+        for piece in self._splitter.split(data):
+            output = self._decompressor.decompress(piece)
+            for start in range(0, len(output), DECOMPRESSED_CHUNK_SIZE):
+                yield output[start:start + DECOMPRESSED_CHUNK_SIZE]
+
+    def check_complete(self):
+        """Raises _IncompleteBodyError unless the body was a single whole zstd frame"""
+        _check_complete("zstd", self._decompressor.eof, self._decompressor.unused_data)
+
+
+class _GzipEncoder:
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def encode(self, data: bytes, final: bool) -> bytes:
+        # a sync flush hands the client everything compressed so far, without resetting the compression history
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class _ZstdEncoder:
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def encode(self, data: bytes, final: bool) -> bytes:
+        flush_mode = zstandard.COMPRESSOBJ_FLUSH_FINISH if final else zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        return self._compressor.compress(data) + self._compressor.flush(flush_mode)
+
+
+def create_decoder(content_coding: str) -> Optional[Union[_GzipDecoder, _ZstdDecoder]]:
+    """Returns a decoder of the content coding, or None if it isn't supported"""
+    if content_coding in ("gzip", "x-gzip"):
+        return _GzipDecoder()
+    if content_coding == "zstd":
+        return _ZstdDecoder()
+    return None
+
+
+def create_encoder(content_coding: str) -> Union[_GzipEncoder, _ZstdEncoder]:
+    return _ZstdEncoder() if content_coding == "zstd" else _GzipEncoder()
+
+
+def negotiate_content_coding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Returns the supported content coding the Accept-Encoding header ranks highest, or None for the identity"""
+    qualities = dict(parse_accept(accept_encoding))
+    best_coding = None
+    best_quality = 0.0
+    for coding in SUPPORTED_CODINGS:
+        quality = qualities.get(coding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best_coding, best_quality = coding, quality
+    return best_coding
+
+
+class _DecodingReceive:
+    """Wraps the ASGI receive callable, handing the app the decompressed request body a chunk at a time"""
+
+    def __init__(self, receive: Receive, decoder: Union[_GzipDecoder, _ZstdDecoder]):
+        self._receive = receive
+        self._decoder = decoder
+        self._chunks: Iterator[bytes] = iter(())
+        self._more_body = True
+
+    def _decode(self, data: bytes, final: bool) -> Iterator[bytes]:
+        yield from self._decoder.decode(data)
+        if final:
+            self._decoder.check_complete()
+
+    def _next_chunk(self) -> Optional[bytes]:
+        try:
+            return next(self._chunks, None)
+        except self._decoder.errors as e:
+            raise HTTPException(400, f"Unable to decompress the request body: {e}")
+
+    async def __call__(self) -> Message:
+        while True:
+            chunk = self._next_chunk()
+            if chunk is not None:
+                # a large message decompresses into many chunks, let the other requests run between them
+                await anyio.sleep(0)
+                return {"type": "http.request", "body": chunk, "more_body": True}
+            if not self._more_body:
+                return {"type": "http.request", "body": b"", "more_body": False}
+            message = await self._receive()
+            if message["type"] != "http.request":
+                return message
+            self._more_body = message.get("more_body", False)
+            self._chunks = self._decode(message.get("body", b""), final=not self._more_body)
+
+
+class _CompressingSend:
+    """Wraps the ASGI send callable, compressing the response body unless it's too small to be worth it"""
+
+    def __init__(self, send: Send, content_coding: str, minimum_size: int):
+        self._send = send
+        self._content_coding = content_coding
+        self._minimum_size = minimum_size
+        self._start: Optional[Message] = None
+        self._encoder: Optional[Union[_GzipEncoder, _ZstdEncoder]] = None
+
+    async def __call__(self, message: Message):
+        if message["type"] == "http.response.start":
+            # the headers depend on whether the body gets compressed, which the first body message decides
+            self._start = message
+        elif message["type"] != "http.response.body":
+            await self._send(message)
+        elif self._start is not None:
+            await self._send_first_body(self._start, message)
+            self._start = None
+        elif self._encoder is not None:
+            more_body = message.get("more_body", False)
+            body = self._encoder.encode(message.get("body", b""), final=not more_body)
+            await self._send({"type": "http.response.body", "body": body, "more_body": more_body})
+        else:
+            await self._send(message)
+
+    async def _send_first_body(self, start: Message, message: Message):
+        headers = MutableHeaders(raw=start["headers"])
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if "content-encoding" in headers or (not more_body and len(body) < self._minimum_size):
+            await self._send(start)
+            await self._send(message)
+            return
+        encoder = self._encoder = create_encoder(self._content_coding)
+        body = encoder.encode(body, final=not more_body)
+        headers["Content-Encoding"] = self._content_coding
+        headers.add_vary_header("Accept-Encoding")
+        if more_body:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(len(body))
+        await self._send(start)
+        await self._send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+
+class CompressionMiddleware:
+    """Decodes compressed request bodies and compresses the responses"""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024):
+        """
+        :param app: the wrapped ASGI app
+        :param minimum_size: the smallest response body, in bytes, that gets compressed
+        """
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        content_coding = headers.get("content-encoding", "identity").strip().lower()
+        if content_coding != "identity":
+            decoder = create_decoder(content_coding)
+            if decoder is None:
+                response = JSONResponse(
+                    {"detail": f"Unsupported Content-Encoding {content_coding}, supported are {SUPPORTED_CODINGS}"},
+                    status_code=415,
+                )
+                await response(scope, receive, send)
+                return
+            # the app sees the decompressed body, whose length isn't known up front
+            scope = dict(scope)
+            scope["headers"] = [
+                (name, value) for name, value in scope["headers"] if name not in (b"content-encoding", b"content-length")
+            ]
+            receive = _DecodingReceive(receive, decoder)
+        response_coding = negotiate_content_coding(headers.get("accept-encoding"))
+        if response_coding is not None:
+            send = _CompressingSend(send, response_coding, self.minimum_size)
+        await self.app(scope, receive, send)
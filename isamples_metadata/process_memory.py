@@ -0,0 +1,38 @@
+import os
+from typing import Optional
+
+# /proc/self/smaps_rollup fields, reported in kB
+_SMAPS_FIELDS = {
+    "Rss": "rss",
+    "Pss": "pss",
+    "Shared_Clean": "shared_clean",
+    "Shared_Dirty": "shared_dirty",
+    "Private_Clean": "private_clean",
+    "Private_Dirty": "private_dirty",
+}
+
+
+def process_memory(smaps_rollup_path: str = "/proc/self/smaps_rollup") -> Optional[dict]:
+    """
+    Returns the memory usage of the current process in bytes, split into the memory that is unique to it and the
+    memory that it shares with other processes, e.g. model weights inherited copy-on-write from a preloading parent.
+
+    :param smaps_rollup_path: the path to read the memory usage from
+    :return: dict of memory usage, or None if the platform doesn't provide smaps_rollup
+    """
+    if not os.path.exists(smaps_rollup_path):
+        return None
+    values = {}
+    with open(smaps_rollup_path) as smaps_rollup:
+        for line in smaps_rollup:
+            parts = line.split()
+            field = parts[0].rstrip(":")
+            if field in _SMAPS_FIELDS:
+                values[_SMAPS_FIELDS[field]] = int(parts[1]) * 1024
+    return {
+        "pid": os.getpid(),
+        "rss": values.get("rss", 0),
+        "pss": values.get("pss", 0),
+        "unique": values.get("private_clean", 0) + values.get("private_dirty", 0),
+        "shared": values.get("shared_clean", 0) + values.get("shared_dirty", 0),
+    }
@@ -0,0 +1,87 @@
+"""
+Encodes the prediction responses that the server builds itself, without validating them again.
+
+The encoding is negotiated from the Accept header: JSON by default, encoded with orjson, or MessagePack if the client
+prefers it.  In the compact layout every prediction is encoded as a [value, confidence, stage]
+array rather than an object.
+"""
+from typing import Any, Callable, List, Optional, Tuple
+
+import msgpack
+import orjson
+from pydantic import BaseModel
+from starlette.responses import Response
+
+from isamples_metadata.taxonomy.metadata_models import PredictionResult
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+# the media types clients ask for MessagePack by
+_MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack")
+
+
+def _encodable(obj: Any) -> Any:
+    # the models are converted one level at a time, so the models nested in them get here too.  A model's __dict__
+    # holds its field values, and is far cheaper to get than model_dump() or dict(model).
+    if isinstance(obj, BaseModel):
+        return obj.__dict__
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not serializable")
+
+
+def _compact_encodable(obj: Any) -> Any:
+    if isinstance(obj, PredictionResult):
+        return [obj.value, obj.confidence, obj.stage]
+    return _encodable(obj)
+
+
+def parse_accept(accept: Optional[str]) -> List[Tuple[str, float]]:
+    """Returns the media ranges of the Accept header with their quality values, in the order of the header"""
+    media_ranges = []
+    for media_range in (accept or "").split(","):
+        media_type, *parameters = [part.strip() for part in media_range.split(";")]
+        if media_type == "":
+            continue
+        quality = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        media_ranges.append((media_type.lower(), quality))
+    return media_ranges
+
+
+def negotiate_media_type(accept: Optional[str]) -> str:
+    """Returns MSGPACK_MEDIA_TYPE if the Accept header prefers MessagePack over JSON, otherwise JSON_MEDIA_TYPE, which
+    is also the answer to clients that accept neither"""
+    json_quality = msgpack_quality = 0.0
+    for media_type, quality in parse_accept(accept):
+        if media_type in (JSON_MEDIA_TYPE, "application/*", "*/*"):
+            json_quality = max(json_quality, quality)
+        if media_type in _MSGPACK_MEDIA_TYPES:
+            msgpack_quality = max(msgpack_quality, quality)
+    return MSGPACK_MEDIA_TYPE if msgpack_quality > json_quality else JSON_MEDIA_TYPE
+
+
+class ResponseEncoding:
+    """The negotiated encoding of a response"""
+
+    def __init__(self, media_type: str = JSON_MEDIA_TYPE, compact: bool = False):
+        self.media_type = media_type
+        self.compact = compact
+
+    def encode(self, content: Any) -> bytes:
+        """Encodes content made of lists, dicts, tuples, scalars and pydantic models"""
+        default: Callable[[Any], Any] = _compact_encodable if self.compact else _encodable
+        if self.media_type == MSGPACK_MEDIA_TYPE:
+            return msgpack.packb(content, default=default)
+        return orjson.dumps(content, default=default)
+
+    def response(self, content: Any) -> Response:
+        return Response(self.encode(content), media_type=self.media_type, headers={"Vary": "Accept"})
+
+
+def negotiate_encoding(accept: Optional[str], compact: bool = False) -> ResponseEncoding:
+    return ResponseEncoding(negotiate_media_type(accept), compact)
@@ -1,10 +1,85 @@
 from abc import abstractmethod
+from typing import Dict, Iterable, List, Mapping, Sequence, Tuple
+
+
+def construct_map_order(description_field: Mapping[str, Sequence[str]]) -> List[str]:
+    # construct order of keys
+    # by using description_field dict
+    # this is to enforce consistent text field for future purposes
+    field_order = []
+    for key, subkeys in description_field.items():
+        if len(subkeys) == 0:
+            field_order.append(key)
+        else:
+            for subkey in subkeys:
+                field_order.append(key + "_" + subkey)
+    return field_order
+
+
+def join_text(values: List[str]) -> str:
+    """Joins the field values of a text with " , ".  The texts have always ended in a space, and they key the
+    prediction caches, so the space is kept."""
+    return " , ".join(values) + " " if len(values) > 0 else ""
+
+
+class ExtractionPlan:
+    """The informative fields that a ClassifierInput subclass extracts from a record, compiled once per class rather
+    than per record: the order the fields are joined in, the sets of plain and nested field names, the description map
+    key of every nested field, and the fields that make up each label type's text."""
+
+    def __init__(
+        self,
+        description_field: Mapping[str, Sequence[str]],
+        material_excluded_fields: Iterable[str],
+        sample_excluded_fields: Iterable[str],
+    ):
+        """
+        :param description_field: dict of each informative field to its informative subfields, empty for a field
+                                  without subfields
+        :param material_excluded_fields: the fields left out of the material text
+        :param sample_excluded_fields: the fields left out of the sample text
+        """
+        self.field_order: Tuple[str, ...] = tuple(construct_map_order(description_field))
+        self.plain_fields = frozenset(key for key, subkeys in description_field.items() if len(subkeys) == 0)
+        self.subfield_keys: Dict[str, Dict[str, str]] = {
+            key: {subkey: key + "_" + subkey for subkey in subkeys}
+            for key, subkeys in description_field.items()
+            if len(subkeys) > 0
+        }
+        material_excluded = frozenset(material_excluded_fields)
+        sample_excluded = frozenset(sample_excluded_fields)
+        self.material_fields = tuple(field for field in self.field_order if field not in material_excluded)
+        sample_fields = tuple(field for field in self.field_order if field not in sample_excluded)
+        # when both texts are made of the same fields they're only built once
+        self.same_texts = sample_fields == self.material_fields
+        self.sample_fields = self.material_fields if self.same_texts else sample_fields
+
+    def fields(self, label_type: str) -> Tuple[str, ...]:
+        return self.material_fields if label_type == "material" else self.sample_fields
+
+    def extract(self, fields: Mapping) -> dict:
+        """Returns the description map of the informative fields and subfields of the record's fields"""
+        description_map = {}
+        for key, value in fields.items():
+            if key in self.plain_fields:
+                description_map[key] = value
+            else:
+                subfield_keys = self.subfield_keys.get(key)
+                if subfield_keys is not None:
+                    for sub_key in value:
+                        map_key = subfield_keys.get(sub_key)
+                        if map_key is not None:
+                            description_map[map_key] = value[sub_key]
+        return description_map
 
 
 class ClassifierInput:
     """Takes thing object to convert it into data that the classifier
     requires as input"""
 
+    # the fields that the subclass extracts from its records
+    PLAN: ExtractionPlan
+
     def __init__(self, thing):
         self.thing = thing
         # fields to fill in through parsing the thing object
@@ -12,11 +87,25 @@ class ClassifierInput:
         self.gold_material, self.gold_sample = None, None
         self.material_text, self.sample_text = "", ""
 
+    @classmethod
     @abstractmethod
+    def extract_description_map(cls, thing) -> dict:
+        """Return the map of the informative fields of the thing"""
+        pass
+
+    @classmethod
+    @abstractmethod
+    def join_fields(cls, description_map, fields: Sequence[str]) -> str:
+        """Return the text of the fields of the description_map, in the order given"""
+        pass
+
     def build_text(self, description_map, labelType):
         """Return the concatenated text of informative fields in the
         description_map"""
-        pass
+        return self.join_fields(description_map, self.PLAN.fields(labelType))
+
+    def construct_map_order(self, description_field):
+        return construct_map_order(description_field)
 
     @abstractmethod
     def parse_thing(self):
@@ -26,6 +115,38 @@ class ClassifierInput:
         """
         pass
 
+    def _parse_texts(self):
+        """Extract the description map and build both texts from it"""
+        self.description_map = self.extract_description_map(self.thing)
+        self.material_text = self.build_text(self.description_map, "material")
+        if self.PLAN.same_texts:
+            self.sample_text = self.material_text
+        else:
+            self.sample_text = self.build_text(self.description_map, "sample")
+
+    @classmethod
+    def extract_texts(
+        cls, things: Iterable[dict], label_types: Sequence[str] = ("material", "sample")
+    ) -> Dict[str, List[str]]:
+        """
+        Batch variant of parse_thing that only builds the texts, without the gold labels and without an instance per
+        record
+
+        :param things: the records to extract the texts of
+        :param label_types: the label types to build the texts of, material and/or sample
+        :return: dict of label type to the texts of the records
+        """
+        fields = [cls.PLAN.fields(label_type) for label_type in label_types]
+        texts: List[List[str]] = [[] for _ in label_types]
+        for thing in things:
+            description_map = cls.extract_description_map(thing)
+            previous_fields, previous_text = None, ""
+            for label_fields, label_texts in zip(fields, texts):
+                if label_fields is not previous_fields:
+                    previous_fields, previous_text = label_fields, cls.join_fields(description_map, label_fields)
+                label_texts.append(previous_text)
+        return dict(zip(label_types, texts))
+
     def get_material_text(self):
         return self.material_text
 
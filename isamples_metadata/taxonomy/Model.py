@@ -1,43 +1,234 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import List, Optional, Sequence, Tuple, cast
+
+import numpy as np
 import torch
-from transformers import BertTokenizer, BertForSequenceClassification
+from transformers import BertTokenizerFast
+
+from isamples_metadata.taxonomy.backends import (
+    InferenceBackend,
+    create_backend,
+    onnx_model_path,
+    torchscript_model_path,
+)
+from isamples_metadata.taxonomy.batching import MicroBatcher, deduplicate
+from isamples_metadata.taxonomy.bounded_cache import BoundedCache
+from isamples_metadata.taxonomy.metrics import (
+    INPUT_TOKENS,
+    STAGE_SECONDS,
+    TRUNCATED_INPUTS,
+    count_cache_lookups,
+    count_model_inputs,
+    model_label,
+)
+
+# Valid values of the optional PADDING model config key:
+#   max_length: every text is padded to MAX_SEQUENCE_LEN (the default)
+#   longest: texts are padded to the longest text in the batch
+#   bucket: texts are padded to the smallest of PADDING_BUCKETS that fits the longest text in the batch, which keeps
+#           the number of distinct input shapes small
+PADDING_MODES = ("max_length", "longest", "bucket")
+DEFAULT_PADDING_BUCKETS = [16, 32, 64, 128, 256, 512]
+# Default of the optional TOKENIZATION_CACHE_SIZE model config key, the number of texts whose token ids are kept
+DEFAULT_TOKENIZATION_CACHE_SIZE = 10000
+
+
+def fingerprint(config):
+    """Returns a digest of the model config and of the files of the tokenizer and the fine-tuned model.  Files are
+    identified by path, size and modification time, so the fingerprint changes whenever a model is replaced."""
+    digest = hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8"))
+    for model_path in sorted(
+        {config["BERT_MODEL"], config["FINE_TUNED_MODEL"], onnx_model_path(config), torchscript_model_path(config)}
+    ):
+        if os.path.isfile(model_path):
+            stat = os.stat(model_path)
+            digest.update(f"{model_path}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+        if not os.path.isdir(model_path):
+            # a huggingface hub model name, the config already identifies it
+            continue
+        for dirpath, dirnames, filenames in os.walk(model_path):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                file_path = os.path.join(dirpath, filename)
+                stat = os.stat(file_path)
+                digest.update(f"{os.path.relpath(file_path, model_path)}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+    return digest.hexdigest()
 
 
 class Model:
-    def __init__(self, config):
+    def __init__(
+        self,
+        config,
+        name="model",
+        backend: Optional[InferenceBackend] = None,
+        max_concurrent_forward_passes: int = 1,
+    ):
+        """
+        :param config: the model config json
+        :param name: the name of the model, used in logging and in the persistent prediction cache
+        :param backend: the backend running the forward pass, created from the config's BACKEND if not passed
+        :param max_concurrent_forward_passes: the most forward passes that may run at once, each of which already uses
+                                              all of torch's intra-op threads
+        """
+        if max_concurrent_forward_passes < 1:
+            raise ValueError(f"max_concurrent_forward_passes must be at least 1, got {max_concurrent_forward_passes}")
         self.config = config
-        device_name = "cpu"
-        if torch.cuda.is_available():
-            device_name = "cuda:0"
-        elif torch.backends.mps.is_available():
-            device_name = "mps:0"
-        self.device = torch.device(device_name)
-        self.tokenizer = BertTokenizer.from_pretrained(self.config["BERT_MODEL"])
-        classifier = BertForSequenceClassification.from_pretrained(
-            self.config["FINE_TUNED_MODEL"], num_labels=len(self.config["CLASS_NAMES"])
-        )
-        classifier = classifier.eval()
-        self.classifier = classifier.to(self.device)
+        self.name = name
+        self.metrics_label = model_label(name)
+        self.fingerprint = fingerprint(config)
+        # distinguishes this model's entries in the shared prediction cache
+        self.identity = uuid.uuid4().hex
+        self.max_sequence_len = self.config["MAX_SEQUENCE_LEN"]
+        self.padding = self.config.get("PADDING", "max_length")
+        if self.padding not in PADDING_MODES:
+            raise ValueError(f"Invalid PADDING {self.padding}, valid values are {PADDING_MODES}")
+        self.padding_buckets = sorted(
+            bucket for bucket in self.config.get("PADDING_BUCKETS", DEFAULT_PADDING_BUCKETS)
+            if bucket < self.max_sequence_len
+        ) + [self.max_sequence_len]
+        # the Rust-backed tokenizer encodes batches natively
+        self.tokenizer = BertTokenizerFast.from_pretrained(self.config["BERT_MODEL"])
+        self._token_ids_cache = BoundedCache(self.config.get("TOKENIZATION_CACHE_SIZE", DEFAULT_TOKENIZATION_CACHE_SIZE))
+        self.backend = backend if backend is not None else create_backend(config)
+        self._batcher = None
+        # the executor threads and the micro batcher call predict_batch concurrently, and without a limit their
+        # forward passes would oversubscribe the cores
+        self._forward_slots = threading.BoundedSemaphore(max_concurrent_forward_passes)
+        self._timings_lock = threading.Lock()
+        self._timings = {
+            "batches": 0, "texts": 0, "duplicate_texts": 0, "tokenization_seconds": 0.0, "forward_seconds": 0.0
+        }
+
+    def enable_micro_batching(self, max_batch_size, max_wait_ms):
+        """Merge concurrent predict calls into shared forward passes of up to max_batch_size texts, waiting at
+        most max_wait_ms for a batch to fill up"""
+        self._batcher = MicroBatcher(self.predict_batch, max_batch_size, max_wait_ms, self.name)
+
+    def padded_length(self, longest):
+        """Returns the length to pad a batch to, given the token count of its longest text"""
+        if self.padding == "longest":
+            return longest
+        elif self.padding == "bucket":
+            for bucket in self.padding_buckets:
+                if longest <= bucket:
+                    return bucket
+        return self.max_sequence_len
 
     def predict(self, text):
-        encoded_text = self.tokenizer.encode_plus(
-            text,
-            max_length=self.config["MAX_SEQUENCE_LEN"],
-            add_special_tokens=True,
-            padding="max_length",
-            truncation=True,
-            return_tensors="pt",
-        )
-        input_ids = encoded_text["input_ids"].to(self.device)
-        attention_mask = encoded_text["attention_mask"].to(self.device)
-        with torch.no_grad():
-            logits = self.classifier(input_ids, attention_mask)[0]
+        if self._batcher is not None:
+            return self._batcher.predict(text)
+        return self.predict_batch([text])[0]
+
+    def encode(self, texts: Sequence[str]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Returns the padded input ids and attention mask of the texts, only tokenizing the texts that aren't in
+        the token ids cache"""
+        token_ids: List[Optional[List[int]]] = [self._token_ids_cache.get(text) for text in texts]
+        missing_indices = [index for index, ids in enumerate(token_ids) if ids is None]
+        count_cache_lookups(self.metrics_label, "tokenization", len(texts) - len(missing_indices), len(missing_indices))
+        if len(missing_indices) > 0:
+            encoded_texts = self.tokenizer(
+                [texts[index] for index in missing_indices],
+                max_length=self.max_sequence_len,
+                add_special_tokens=True,
+                truncation=True,
+            )
+            for index, ids in zip(missing_indices, encoded_texts["input_ids"]):
+                token_ids[index] = ids
+                self._token_ids_cache.put(texts[index], ids)
+        encoded_ids = cast(List[List[int]], token_ids)
+        longest = max(len(ids) for ids in encoded_ids)
+        input_ids = np.full((len(texts), self.padded_length(longest)), self.tokenizer.pad_token_id, dtype=np.int64)
+        attention_mask = np.zeros(input_ids.shape, dtype=np.int64)
+        input_tokens = INPUT_TOKENS.labels(self.metrics_label)
+        truncated = 0
+        for row, ids in enumerate(encoded_ids):
+            input_ids[row, :len(ids)] = ids
+            attention_mask[row, :len(ids)] = 1
+            input_tokens.observe(len(ids))
+            if len(ids) >= self.max_sequence_len:
+                truncated += 1
+        if truncated > 0:
+            TRUNCATED_INPUTS.labels(self.metrics_label).inc(truncated)
+        return torch.from_numpy(input_ids), torch.from_numpy(attention_mask)
+
+    def predict_batch(self, texts):
+        """Returns the top 3 (label, probability) predictions for each of the texts, computed in one forward pass.
+        Identical texts are tokenized and run through the model once, and share the predictions."""
+        if len(texts) == 0:
+            return []
+        start = time.perf_counter()
+        unique_texts, positions = deduplicate(texts)
+        input_ids, attention_mask = self.encode(unique_texts)
+        tokenized = time.perf_counter()
+        with self._forward_slots:
+            forward_start = time.perf_counter()
+            logits = self.backend.logits(input_ids, attention_mask)
+            forward_done = time.perf_counter()
         # convert logits into probability
-        prob = logits.softmax(dim=-1)[0]
-        # get the top 3 high confidence predictions
-        top_probs, indices = torch.topk(prob, 3)
-        # convert integer labels to text labels
-        indices = [x.item() for x in indices]
-        labels = [self.config["CLASS_NAMES"][x] for x in indices]
-        # convert torch tensor to float type
-        probs = [x.item() for x in top_probs]
-        return [(label, prob) for label, prob in zip(labels, probs)]
+        probs = logits.softmax(dim=-1)
+        # get the top 3 high confidence predictions for every text
+        top_probs, indices = torch.topk(probs, 3, dim=-1)
+        predictions = []
+        for row_probs, row_indices in zip(top_probs.tolist(), indices.tolist()):
+            # convert integer labels to text labels
+            labels = [self.config["CLASS_NAMES"][x] for x in row_indices]
+            predictions.append([(label, prob) for label, prob in zip(labels, row_probs)])
+        self._record_timings(
+            len(unique_texts),
+            len(texts) - len(unique_texts),
+            tokenized - start,
+            forward_done - forward_start,
+            time.perf_counter() - forward_done,
+        )
+        return [predictions[position] for position in positions]
+
+    def warm_up(self, batch_sizes: Sequence[int]):
+        """Runs forward passes of synthetic inputs at each of the batch sizes and each length a batch can be padded to,
+        so the first requests don't pay for the lazy initialization of kernels and allocator pools.  The warm-up
+        bypasses the caches and isn't recorded in the statistics or metrics."""
+        self.tokenizer(["warm up"], max_length=self.max_sequence_len, truncation=True)
+        lengths = self.padding_buckets if self.padding == "bucket" else [self.max_sequence_len]
+        for batch_size in batch_sizes:
+            for length in lengths:
+                input_ids = torch.full((batch_size, length), self.tokenizer.unk_token_id, dtype=torch.int64)
+                attention_mask = torch.ones((batch_size, length), dtype=torch.int64)
+                with self._forward_slots:
+                    self.backend.logits(input_ids, attention_mask).softmax(dim=-1)
+
+    def _record_timings(
+        self, text_count, duplicate_count, tokenization_seconds, forward_seconds, postprocessing_seconds
+    ):
+        logging.debug(
+            "%s: tokenized %d texts (%d duplicates skipped) in %.1f ms, forward pass took %.1f ms",
+            self.name,
+            text_count,
+            duplicate_count,
+            tokenization_seconds * 1000,
+            forward_seconds * 1000,
+        )
+        count_model_inputs(self.metrics_label, text_count, duplicate_count)
+        STAGE_SECONDS.labels(self.metrics_label, "tokenization").observe(tokenization_seconds)
+        STAGE_SECONDS.labels(self.metrics_label, "forward").observe(forward_seconds)
+        STAGE_SECONDS.labels(self.metrics_label, "postprocessing").observe(postprocessing_seconds)
+        with self._timings_lock:
+            self._timings["batches"] += 1
+            self._timings["texts"] += text_count
+            self._timings["duplicate_texts"] += duplicate_count
+            self._timings["tokenization_seconds"] += tokenization_seconds
+            self._timings["forward_seconds"] += forward_seconds
+
+    def stats(self) -> dict:
+        """Returns the cumulative tokenization and forward pass timings, the fraction of the texts that were duplicates
+        within their batch, and the token ids cache statistics"""
+        with self._timings_lock:
+            stats: dict = dict(self._timings)
+        total_texts = stats["texts"] + stats["duplicate_texts"]
+        stats["dedup_ratio"] = stats["duplicate_texts"] / total_texts if total_texts > 0 else 0.0
+        stats["tokenization_cache"] = self._token_ids_cache.stats()
+        return stats
@@ -1,92 +1,67 @@
-from isamples_metadata.taxonomy.ClassifierInput import ClassifierInput
+from typing import Sequence
+
+from isamples_metadata.taxonomy.ClassifierInput import ClassifierInput, ExtractionPlan, join_text
 
 
 class OpenContextClassifierInput(ClassifierInput):
     """Takes OpenContext thing object to convert it into data that the classifier
     requires as input"""
 
+    # the informative fields, none of which have subfields
+    PLAN = ExtractionPlan(
+        {
+            "Has type": [],
+            "Consists of": [],
+            "early bce/ce": [],
+            "late bce/ce": [],
+            "project label": [],
+            "item category": [],
+            "context label": [],
+            "Temporal Coverage_label": [],
+            "Has taxonomic identifier_label": [],
+            "Has anatomical identification_label": [],
+        },
+        # the gold label field of each label type is left out of its text.  The records' gold label fields have no
+        # _label subfield, so this leaves the texts the same.
+        material_excluded_fields=["Consists of_label"],
+        sample_excluded_fields=["Has type_label"],
+    )
+
     def __init__(self, thing):
         super().__init__(thing)
         # gold label field of SESAR
         self.OC_material_field = "Consists of_label"
         self.OC_sample_field = "Has type_label"
 
-    def build_text(self, description_map, labelType, field_order):
-        """Return the concatenated text of informative fields in the
-        description_map"""
-        concatenated_text = ""
-        for field in field_order:
+    @classmethod
+    def extract_description_map(cls, thing) -> dict:
+        return cls.PLAN.extract(thing)
+
+    @classmethod
+    def join_fields(cls, description_map, fields: Sequence[str]) -> str:
+        values = []
+        for field in fields:
             if field in description_map:
-                # key would be one of the description_field defined in parse_thing
+                # key would be one of the description_field defined in PLAN
                 # e.g. key : item category / value : record's key value such as "Animal Bone"
-                key = field
-                value = str(description_map[key])
+                value = str(description_map[field])
                 if value == "":
                     continue
-                elif key == "context label":
-                    splitted = value.split("/")
-                    splitted = " , ".join(splitted)
-                    concatenated_text += splitted + " , "
-                elif labelType == "material" and key != self.OC_material_field:
-                    concatenated_text += value + " , "
-                elif labelType == "sample" and key != self.OC_sample_field:
-                    concatenated_text += value + " , "
-        return concatenated_text[:-2]  # remove the last comma
-
-    def construct_map_order(self, description_field):
-        # construct order of keys
-        # by using description_field dict
-        # this is to enforce consistent text field for future purposes
-        field_order = []
-        for key, subkeys in description_field.items():
-            if len(subkeys) == 0:
-                field_order.append(key)
-            else:
-                for subkey in subkeys:
-                    field_order.append(key + "_" + subkey)
-        return field_order
+                elif field == "context label":
+                    values.append(" , ".join(value.split("/")))
+                else:
+                    values.append(value)
+        return join_text(values)
 
     def parse_thing(self):
         """Return a map that stores the informative fields,
         the concatenated text versions for the material label classifier
         and the sample label classifier, and the gold labels
         """
-        # define the informative fields to extract
-        description_field = {
-            "Has type": [],
-            "Consists of": [],
-            "early bce/ce": [],
-            "late bce/ce": [],
-            "project label": [],
-            "item category": [],
-            "context label": [],
-            "Temporal Coverage_label": [],
-            "Has taxonomic identifier_label": [],
-            "Has anatomical identification_label": [],
-        }
-        field_order = self.construct_map_order(description_field)
-        description_map = {}  # saves value of description_field
-        # parse the thing and extract data from informative fields
-        for key, value in self.thing.items():
-            if key in description_field:
-                # gold label fields
-                if key == "Has type":
-                    self.gold_sample = value[0]
-
-                elif key == "Consists of":
-                    self.gold_material = value[0]
-
-                # fields that do not have subfields
-                if len(description_field[key]) == 0:
-                    description_map[key] = value
-
-                # fields that have subfields
-                else:
-                    for sub_key in value[0]:
-                        if sub_key in description_field[key]:
-                            description_map[key + "_" + sub_key] = value[0][sub_key]
-
-        # build the concatenated text from the description_map
-        self.material_text = self.build_text(description_map, "material", field_order)
-        self.sample_text = self.build_text(description_map, "sample", field_order)
-        self.description_map = description_map  # save the description_map
+        # gold label fields
+        if "Has type" in self.thing:
+            self.gold_sample = self.thing["Has type"][0]
+        if "Consists of" in self.thing:
+            self.gold_material = self.thing["Consists of"][0]
+        # parse the thing and build the concatenated texts from its informative fields
+        self._parse_texts()
@@ -1,4 +1,6 @@
-from isamples_metadata.taxonomy.ClassifierInput import ClassifierInput
+from typing import Sequence
+
+from isamples_metadata.taxonomy.ClassifierInput import ClassifierInput, ExtractionPlan, join_text
 
 
 class SESARClassifierInput(ClassifierInput):
@@ -73,53 +75,10 @@ class SESARClassifierInput(ClassifierInput):
         "NotApplicable": "Material",
     }
 
-    def __init__(self, thing):
-        super().__init__(thing)
-        # gold label field of SESAR
-        self.SESAR_material_field = "material"
-        self.SESAR_sample_field = "sampleType"
-
-    def build_text(self, description_map, labelType, field_order):
-        """Return the concatenated text of informative fields in the
-        description_map"""
-        concatenated_text = ""
-        # use the order of the fields to build text
-        # to have consistent text content
-        for field in field_order:
-            if field in description_map:
-                key, value = field, description_map[field]
-                if key == "igsnPrefix":
-                    continue
-                elif value == "":
-                    # empty field
-                    continue
-                elif labelType == "material" and key != self.SESAR_material_field:
-                    concatenated_text += value + " , "
-                elif labelType == "sample" and key != self.SESAR_sample_field:
-                    concatenated_text += value + " , "
-
-        return concatenated_text[:-2]  # remove the last comma
-
-    def construct_map_order(self, description_field):
-        # construct order of keys
-        # by using description_field dict
-        # this is to enforce consistent text field for future purposes
-        field_order = []
-        for key, subkeys in description_field.items():
-            if len(subkeys) == 0:
-                field_order.append(key)
-            else:
-                for subkey in subkeys:
-                    field_order.append(key + "_" + subkey)
-        return field_order
-
-    def parse_thing(self):
-        """Return a map that stores the informative fields,
-        the concatenated text versions for the material label classifier
-        and the sample label classifier, and the gold labels
-        """
-        # define the informative fields to extract
-        description_field = {
+    # the informative fields, fieldName and purpose are nested in supplementMetadata.  purpose is listed twice, so
+    # its value appears twice in the texts, as it always has.
+    PLAN = ExtractionPlan(
+        {
             "supplementMetadata": [
                 "geologicalAge",
                 "classificationComment",
@@ -138,28 +97,42 @@ class SESARClassifierInput(ClassifierInput):
             "sampleType": [],
             "description": [],
             "collectionMethodDescr": [],
-        }
-        field_order = self.construct_map_order(description_field)
+        },
+        # the gold label field of each label type is left out of its text
+        material_excluded_fields=["igsnPrefix", "material"],
+        sample_excluded_fields=["igsnPrefix", "sampleType"],
+    )
+
+    def __init__(self, thing):
+        super().__init__(thing)
+        # gold label field of SESAR
+        self.SESAR_material_field = "material"
+        self.SESAR_sample_field = "sampleType"
 
-        description_map = {}  # saves value of description_field
-        # parse the thing and extract data from informative fields
-        for key, value in self.thing["description"].items():
-            # gold label fields
-            if key == self.SESAR_sample_field:
-                self.gold_sample = value
-            if key == self.SESAR_material_field:
-                self.gold_material = value
-            if key in description_field:
-                # fields that do not have subfields
-                if len(description_field[key]) == 0:
-                    description_map[key] = value
-                # fields that have subfields
-                else:
-                    for sub_key in value:
-                        if sub_key in description_field[key]:
-                            description_map[key + "_" + sub_key] = value[sub_key]
+    @classmethod
+    def extract_description_map(cls, thing) -> dict:
+        return cls.PLAN.extract(thing["description"])
 
-        # build the concatenated text from the description_map
-        self.material_text = self.build_text(description_map, "material", field_order)
-        self.sample_text = self.build_text(description_map, "sample", field_order)
-        self.description_map = description_map  # save the description_map
+    @classmethod
+    def join_fields(cls, description_map, fields: Sequence[str]) -> str:
+        # use the order of the fields to build text
+        # to have consistent text content
+        values = []
+        for field in fields:
+            value = description_map.get(field, "")
+            # skip empty fields
+            if value != "":
+                values.append(value)
+        return join_text(values)
+
+    def parse_thing(self):
+        """Return a map that stores the informative fields,
+        the concatenated text versions for the material label classifier
+        and the sample label classifier, and the gold labels
+        """
+        description = self.thing["description"]
+        # gold label fields
+        self.gold_sample = description.get(self.SESAR_sample_field)
+        self.gold_material = description.get(self.SESAR_material_field)
+        # parse the thing and build the concatenated texts from its informative fields
+        self._parse_texts()
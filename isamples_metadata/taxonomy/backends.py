@@ -0,0 +1,162 @@
+import hashlib
+import json
+import logging
+import os
+from abc import abstractmethod
+from typing import Optional
+
+import torch
+from transformers import BertForSequenceClassification
+
+# Valid values of the optional BACKEND model config key:
+#   torch: eager PyTorch execution of the fine-tuned model (the default)
+#   onnxruntime: ONNX Runtime execution of the model exported by export_onnx.py, read from ONNX_MODEL (defaults to
+#                model.onnx in the FINE_TUNED_MODEL directory)
+BACKENDS = ("torch", "onnxruntime")
+
+# Valid values of the optional QUANTIZATION model config key, for the torch backend:
+#   none: the classifier runs in fp32 (the default)
+#   dynamic_int8: the weights of the linear layers are quantized to int8 at load time, and activations are quantized
+#                 on the fly.  The int8 kernels only exist for the CPU, so this always runs on the CPU.
+QUANTIZATION_MODES = ("none", "dynamic_int8")
+
+ONNX_MODEL_FILENAME = "model.onnx"
+# The torch backend loads the TorchScript artifact written by export_torchscript.py when it exists, read from
+# TORCHSCRIPT_MODEL (defaults to a file in the FINE_TUNED_MODEL directory named after the QUANTIZATION), and falls back
+# to building the classifier with transformers when it doesn't
+TORCHSCRIPT_MODEL_FILENAMES = {"none": "model.torchscript.pt", "dynamic_int8": "model.dynamic_int8.torchscript.pt"}
+# The name of the file in a TorchScript artifact that holds the source_fingerprint of the model it was compiled from.
+# An artifact whose fingerprint doesn't match the current fine-tuned model is ignored.
+SOURCE_FINGERPRINT_FILE = "source_fingerprint"
+
+
+class InferenceBackend:
+    """Runs the forward pass of a fine-tuned sequence classifier"""
+
+    @abstractmethod
+    def logits(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        """Return the (batch size, number of classes) logits for the tokenized batch"""
+        pass
+
+
+class TorchBackend(InferenceBackend):
+    def __init__(self, config):
+        device_name = "cpu"
+        if torch.cuda.is_available():
+            device_name = "cuda:0"
+        elif torch.backends.mps.is_available():
+            device_name = "mps:0"
+        self.quantization = config.get("QUANTIZATION", "none")
+        if self.quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Invalid QUANTIZATION {self.quantization}, valid values are {QUANTIZATION_MODES}")
+        if self.quantization == "dynamic_int8":
+            device_name = "cpu"
+        self.device = torch.device(device_name)
+        compiled_classifier = self._load_compiled(config)
+        self.compiled = compiled_classifier is not None
+        if compiled_classifier is not None:
+            self.classifier = compiled_classifier
+            return
+        classifier = BertForSequenceClassification.from_pretrained(
+            config["FINE_TUNED_MODEL"], num_labels=len(config["CLASS_NAMES"])
+        )
+        classifier = classifier.eval()
+        if self.quantization == "dynamic_int8":
+            classifier = torch.ao.quantization.quantize_dynamic(classifier, {torch.nn.Linear}, dtype=torch.qint8)
+        self.classifier = classifier.to(self.device)
+
+    def _load_compiled(self, config) -> Optional[torch.jit.ScriptModule]:
+        """Returns the TorchScript artifact of the config, or None if there's none or it's out of date"""
+        artifact_path = torchscript_model_path(config)
+        if not os.path.isfile(artifact_path):
+            return None
+        logging.info("Loading the TorchScript model at %s", artifact_path)
+        extra_files = {SOURCE_FINGERPRINT_FILE: ""}
+        classifier = torch.jit.load(artifact_path, map_location=self.device, _extra_files=extra_files)
+        if extra_files[SOURCE_FINGERPRINT_FILE] != source_fingerprint(config).encode("utf-8"):
+            logging.warning(
+                "The TorchScript model at %s wasn't compiled from the current %s, loading that instead.  Re-run "
+                "export_torchscript to compile it.",
+                artifact_path,
+                config["FINE_TUNED_MODEL"],
+            )
+            return None
+        return classifier.eval()
+
+    def logits(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            if self.compiled:
+                # the traced module returns the logits tensor itself
+                return self.classifier(input_ids.to(self.device), attention_mask.to(self.device)).cpu()
+            return self.classifier(input_ids.to(self.device), attention_mask.to(self.device))[0].cpu()
+
+
+def torchscript_model_path(config) -> str:
+    filename = TORCHSCRIPT_MODEL_FILENAMES.get(config.get("QUANTIZATION", "none"), TORCHSCRIPT_MODEL_FILENAMES["none"])
+    return config.get("TORCHSCRIPT_MODEL", os.path.join(config["FINE_TUNED_MODEL"], filename))
+
+
+def source_fingerprint(config) -> str:
+    """Returns a digest of the fine-tuned model's files, and of the config keys that shape the compiled classifier.
+    Files are identified by path, size and modification time like Model.fingerprint does, so checking an artifact
+    doesn't read the weights.  The exported ONNX and TorchScript artifacts are left out, since they may live in the
+    same directory."""
+    digest = hashlib.sha256(
+        json.dumps(
+            {"CLASS_NAMES": config["CLASS_NAMES"], "QUANTIZATION": config.get("QUANTIZATION", "none")}, sort_keys=True
+        ).encode("utf-8")
+    )
+    model_path = config["FINE_TUNED_MODEL"]
+    digest.update(model_path.encode("utf-8"))
+    if not os.path.isdir(model_path):
+        # a huggingface hub model name, the name identifies it
+        return digest.hexdigest()
+    artifacts = {os.path.join(model_path, filename) for filename in TORCHSCRIPT_MODEL_FILENAMES.values()}
+    artifacts |= {os.path.join(model_path, ONNX_MODEL_FILENAME), onnx_model_path(config), torchscript_model_path(config)}
+    artifacts = {os.path.abspath(artifact) for artifact in artifacts}
+    for dirpath, dirnames, filenames in os.walk(model_path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            file_path = os.path.join(dirpath, filename)
+            if os.path.abspath(file_path) in artifacts:
+                continue
+            stat = os.stat(file_path)
+            digest.update(f"{os.path.relpath(file_path, model_path)}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def onnx_model_path(config) -> str:
+    return config.get("ONNX_MODEL", os.path.join(config["FINE_TUNED_MODEL"], ONNX_MODEL_FILENAME))
+
+
+class OnnxRuntimeBackend(InferenceBackend):
+    def __init__(self, config):
+        # only required for this backend, so only imported when it's used
+        import onnxruntime
+
+        session_options = onnxruntime.SessionOptions()
+        session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # optional thread counts, onnxruntime picks them based on the number of cores when unset
+        if "ONNX_INTRA_OP_THREADS" in config:
+            session_options.intra_op_num_threads = config["ONNX_INTRA_OP_THREADS"]
+        if "ONNX_INTER_OP_THREADS" in config:
+            session_options.inter_op_num_threads = config["ONNX_INTER_OP_THREADS"]
+        self.session = onnxruntime.InferenceSession(
+            onnx_model_path(config), session_options, providers=["CPUExecutionProvider"]
+        )
+
+    def logits(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        outputs = self.session.run(
+            ["logits"], {"input_ids": input_ids.numpy(), "attention_mask": attention_mask.numpy()}
+        )
+        return torch.from_numpy(outputs[0])
+
+
+def create_backend(config) -> InferenceBackend:
+    """Return the inference backend selected by the BACKEND key of the model config"""
+    backend = config.get("BACKEND", "torch")
+    if backend == "torch":
+        return TorchBackend(config)
+    elif backend == "onnxruntime":
+        return OnnxRuntimeBackend(config)
+    raise ValueError(f"Invalid BACKEND {backend}, valid values are {BACKENDS}")
@@ -0,0 +1,302 @@
+"""
+Classifies a full-collection dump of source records offline, without going through the HTTP server.
+
+Usage:
+    python -m isamples_metadata.taxonomy.batch_classify --collection sesar --type material \\
+        --input sesar.jsonl --output sesar_material.jsonl [--processes 8]
+
+The input is either JSON Lines with one source record per line, or Parquet with the source records in a column
+(as JSON text or as a struct).  It is streamed, and chunks of records are classified by a pool of worker processes
+that each load their own copy of the model.  Each record gets an output entry with its index, its id, and either the
+predictions or the exception, which is also how a record that isn't a valid JSON object is reported.  The output is JSON Lines, or a directory of Parquet part files if the output path ends
+in .parquet.
+
+Progress is checkpointed next to the output, so rerunning the same command after an interruption resumes where it
+stopped instead of starting over.
+"""
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import torch
+
+from isamples_metadata.taxonomy.metadata_models import (
+    MetadataModelLoader,
+    OpenContextMaterialPredictor,
+    OpenContextSamplePredictor,
+    RecordPrediction,
+    SESARMaterialPredictor,
+    predict_batch_isolating_errors,
+)
+
+# the source record field used as the output id if --id-field isn't specified
+DEFAULT_ID_FIELDS = {"sesar": "@id", "opencontext": "uri"}
+# a source record, or the exception raised parsing it
+SourceRecord = Union[dict, Exception]
+# (index, id, source record)
+Record = Tuple[int, Any, SourceRecord]
+
+_BATCH_PREDICTOR: Optional[Callable[[List[dict]], List[RecordPrediction]]] = None
+
+
+def _create_batch_predictor(
+    collection: str, label_type: str, config_json: Optional[dict]
+) -> Callable[[List[dict]], List[RecordPrediction]]:
+    if collection == "sesar" and label_type == "material":
+        return SESARMaterialPredictor(
+            MetadataModelLoader.get_sesar_material_model(config_json),
+            MetadataModelLoader.get_cascade("SESAR", "material"),
+        ).predict_material_type_batch
+    elif collection == "opencontext" and label_type == "material":
+        return OpenContextMaterialPredictor(
+            MetadataModelLoader.get_oc_material_model(config_json),
+            MetadataModelLoader.get_cascade("OPENCONTEXT", "material"),
+        ).predict_material_type_batch
+    elif collection == "opencontext" and label_type == "sample":
+        return OpenContextSamplePredictor(
+            MetadataModelLoader.get_oc_sample_model(config_json),
+            MetadataModelLoader.get_cascade("OPENCONTEXT", "sample"),
+        ).predict_sample_type_batch
+    raise ValueError(f"Unable to classify {label_type} for {collection}")
+
+
+def _init_worker(collection: str, label_type: str, config_json: Optional[dict], torch_threads: int):
+    global _BATCH_PREDICTOR
+    # each process runs its own forward passes, so keep them from oversubscribing the cores
+    torch.set_num_threads(torch_threads)
+    _BATCH_PREDICTOR = _create_batch_predictor(collection, label_type, config_json)
+
+
+def _classify_chunk(chunk: List[Record]) -> List[dict]:
+    assert _BATCH_PREDICTOR is not None, "worker wasn't initialized"
+    results = []
+    valid_records = [source_record for _, _, source_record in chunk if isinstance(source_record, dict)]
+    valid_predictions = iter(predict_batch_isolating_errors(_BATCH_PREDICTOR, valid_records))
+    predictions = [
+        next(valid_predictions) if isinstance(source_record, dict) else source_record for _, _, source_record in chunk
+    ]
+    for (index, record_id, _), record_prediction in zip(chunk, predictions):
+        result: Dict[str, Any] = {"index": index, "id": record_id, "predictions": [], "exception": None, "message": None}
+        if isinstance(record_prediction, Exception):
+            result["exception"] = record_prediction.__class__.__name__
+            result["message"] = str(record_prediction)
+        else:
+            result["predictions"] = [prediction.model_dump() for prediction in record_prediction]
+        results.append(result)
+    return results
+
+
+def _parse_source_record(text: str) -> SourceRecord:
+    # a malformed record is reported in its output entry instead of aborting the whole dump
+    try:
+        source_record = json.loads(text)
+    except ValueError as e:
+        return e
+    if not isinstance(source_record, dict):
+        return ValueError(f"The source record is a JSON {type(source_record).__name__}, not an object")
+    return source_record
+
+
+def _read_jsonl(path: str) -> Iterator[SourceRecord]:
+    with open(path, encoding="utf-8", errors="replace") as input_file:
+        for line in input_file:
+            if line.strip():
+                yield _parse_source_record(line)
+
+
+def _read_parquet(path: str, column: str) -> Iterator[SourceRecord]:
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        raise SystemExit("Reading Parquet requires pyarrow, install it with 'pip install pyarrow'")
+    parquet_file = pyarrow.parquet.ParquetFile(path)
+    for batch in parquet_file.iter_batches(columns=[column]):
+        for value in batch.column(0).to_pylist():
+            yield _parse_source_record(value) if isinstance(value, str) else value
+
+
+def _read_records(path: str, parquet_column: str, id_field: str, skip: int) -> Iterator[Record]:
+    source_records = _read_parquet(path, parquet_column) if path.endswith(".parquet") else _read_jsonl(path)
+    for index, source_record in enumerate(itertools.islice(source_records, skip, None), start=skip):
+        record_id = source_record.get(id_field) if isinstance(source_record, dict) else None
+        yield index, record_id, source_record
+
+
+def _chunks(records: Iterator[Record], chunk_size: int) -> Iterator[List[Record]]:
+    while True:
+        chunk = list(itertools.islice(records, chunk_size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+
+class JsonLinesWriter:
+    """Appends results to a JSON Lines file.  The checkpointed position is the file size, and resuming truncates
+    anything written after it."""
+
+    def __init__(self, path: str, position: Optional[int]):
+        self._file = open(path, "r+b" if position is not None and os.path.exists(path) else "wb")
+        if position is not None:
+            self._file.truncate(position)
+            self._file.seek(position)
+
+    def write(self, results: List[dict]):
+        self._file.write(b"".join(json.dumps(result).encode("utf-8") + b"\n" for result in results))
+
+    def position(self) -> int:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetPartsWriter:
+    """Writes each write's results to a new part file in the output directory.  The checkpointed position is the
+    number of parts, and resuming deletes any part after it."""
+
+    def __init__(self, path: str, position: Optional[int]):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("Writing Parquet requires pyarrow, install it with 'pip install pyarrow'")
+        self._pyarrow = pyarrow
+        self._path = path
+        os.makedirs(path, exist_ok=True)
+        self._parts = position if position is not None else 0
+        for filename in os.listdir(path):
+            if filename.startswith("part-") and int(filename[5:11]) >= self._parts:
+                os.remove(os.path.join(path, filename))
+
+    def write(self, results: List[dict]):
+        for result in results:
+            result["id"] = None if result["id"] is None else str(result["id"])
+        table = self._pyarrow.Table.from_pylist(results)
+        self._pyarrow.parquet.write_table(table, os.path.join(self._path, f"part-{self._parts:06d}.parquet"))
+        self._parts += 1
+
+    def position(self) -> int:
+        return self._parts
+
+    def close(self):
+        pass
+
+
+def _read_checkpoint(checkpoint_path: str) -> Optional[dict]:
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path) as checkpoint_file:
+        return json.load(checkpoint_file)
+
+
+def _write_checkpoint(checkpoint_path: str, records_done: int, output_position: int):
+    # write to a temporary file and rename it, so an interruption never leaves a partial checkpoint behind
+    temporary_path = checkpoint_path + ".tmp"
+    with open(temporary_path, "w") as checkpoint_file:
+        json.dump({"records_done": records_done, "output_position": output_position}, checkpoint_file)
+    os.replace(temporary_path, checkpoint_path)
+
+
+def classify_dump(
+    collection: str,
+    label_type: str,
+    input_path: str,
+    output_path: str,
+    config_json: Optional[dict] = None,
+    processes: int = 1,
+    chunk_size: int = 64,
+    checkpoint_every: int = 16,
+    id_field: Optional[str] = None,
+    parquet_column: str = "source_record",
+    progress_interval_seconds: float = 10.0,
+) -> int:
+    """
+    Classify every record of the dump, resuming from the checkpoint if there is one
+
+    :return: the number of records in the dump
+    """
+    checkpoint_path = output_path.rstrip("/") + ".checkpoint"
+    checkpoint = _read_checkpoint(checkpoint_path)
+    records_done = checkpoint["records_done"] if checkpoint else 0
+    if checkpoint:
+        logging.info("Resuming from the checkpoint after %d records", records_done)
+    writer_class = ParquetPartsWriter if output_path.endswith(".parquet") else JsonLinesWriter
+    writer = writer_class(output_path, checkpoint["output_position"] if checkpoint else None)
+    records = _read_records(input_path, parquet_column, id_field or DEFAULT_ID_FIELDS[collection], records_done)
+    torch_threads = max(1, (os.cpu_count() or 1) // processes)
+    start_time = last_report_time = time.monotonic()
+    records_this_run = last_report_records = 0
+    with multiprocessing.Pool(
+        processes, initializer=_init_worker, initargs=(collection, label_type, config_json, torch_threads)
+    ) as pool:
+        # imap keeps the results in input order, so the checkpoint is always a prefix of the input
+        for chunk_number, results in enumerate(pool.imap(_classify_chunk, _chunks(records, chunk_size)), start=1):
+            writer.write(results)
+            records_done += len(results)
+            records_this_run += len(results)
+            if chunk_number % checkpoint_every == 0:
+                _write_checkpoint(checkpoint_path, records_done, writer.position())
+            now = time.monotonic()
+            if now - last_report_time >= progress_interval_seconds:
+                logging.info(
+                    "%d records classified, %.1f records/sec (%.1f records/sec overall)",
+                    records_done,
+                    (records_this_run - last_report_records) / (now - last_report_time),
+                    records_this_run / (now - start_time),
+                )
+                last_report_time, last_report_records = now, records_this_run
+    _write_checkpoint(checkpoint_path, records_done, writer.position())
+    writer.close()
+    elapsed = time.monotonic() - start_time
+    logging.info(
+        "Done, classified %d records in %.1f seconds (%.1f records/sec)",
+        records_this_run,
+        elapsed,
+        records_this_run / elapsed if elapsed > 0 else 0.0,
+    )
+    return records_done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify a dump of source records")
+    parser.add_argument("--collection", required=True, choices=["sesar", "opencontext"])
+    parser.add_argument("--type", required=True, choices=["material", "sample"])
+    parser.add_argument("--input", required=True, help="JSON Lines or Parquet file of source records")
+    parser.add_argument("--output", required=True, help="JSON Lines file, or Parquet directory if it ends in .parquet")
+    parser.add_argument("--config", help="model config json, defaults to the one in the settings file")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=64, help="records per forward pass")
+    parser.add_argument("--checkpoint-every", type=int, default=16, help="chunks between checkpoints")
+    parser.add_argument("--id-field", help="source record field to output as the id")
+    parser.add_argument("--parquet-column", default="source_record", help="Parquet column holding the records")
+    args = parser.parse_args()
+    if args.collection == "sesar" and args.type != "material":
+        parser.error("sesar only has a material model")
+    logging.basicConfig(level=logging.INFO)
+    config_json = None
+    if args.config:
+        with open(args.config) as json_file:
+            config_json = json.load(json_file)
+    classify_dump(
+        args.collection,
+        args.type,
+        args.input,
+        args.output,
+        config_json,
+        args.processes,
+        args.chunk_size,
+        args.checkpoint_every,
+        args.id_field,
+        args.parquet_column,
+    )
+
+
+if __name__ == "__main__":
+    main()
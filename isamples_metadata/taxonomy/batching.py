@@ -0,0 +1,96 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Sequence, Tuple
+
+
+def deduplicate(items: Sequence[Hashable]) -> Tuple[List[Any], List[int]]:
+    """Returns the distinct items in the order they first occur, and the index of each of the items among them"""
+    distinct: Dict[Hashable, int] = {}
+    positions = [distinct.setdefault(item, len(distinct)) for item in items]
+    return list(distinct), positions
+
+
+class MicroBatcher:
+    """Collects concurrently submitted items and runs them through a batch function together.
+
+    The request handlers run on a thread pool, so without this every concurrent request would run its own batch-1
+    forward pass.  A single worker thread waits for up to max_batch_size items, or max_wait_ms after the first item
+    arrived, then invokes the batch function once and hands each caller its own result.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int,
+        max_wait_ms: float,
+        name: str = "model",
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self._batch_fn = batch_fn
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait_ms / 1000.0
+        self._name = name
+        self._lock = threading.Lock()
+        self._queue: queue.Queue[Tuple[Any, Future]] = queue.Queue()
+        # the worker thread is started on first use, and again after a fork since threads don't survive one
+        self._pid = None
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                thread = threading.Thread(target=self._run, args=(self._queue,), name=f"micro-batcher-{self._name}", daemon=True)
+                thread.start()
+                self._pid = os.getpid()
+
+    def submit(self, item: Any) -> Future:
+        """Queues the item for the next batch, the returned future resolves to the item's result"""
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def predict(self, item: Any) -> Any:
+        """Queues the item and blocks until its result is available"""
+        return self.submit(item).result()
+
+    def _next_batch(self, work_queue: queue.Queue) -> List[Tuple[Any, Future]]:
+        batch = [work_queue.get()]
+        deadline = time.monotonic() + self._max_wait
+        while len(batch) < self._max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(work_queue.get(timeout=remaining))
+                else:
+                    # don't wait any longer, but take whatever is already queued
+                    batch.append(work_queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, work_queue: queue.Queue):
+        while True:
+            batch = self._next_batch(work_queue)
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if len(batch) == 0:
+                continue
+            try:
+                results = list(self._batch_fn([item for item, _ in batch]))
+                if len(results) != len(batch):
+                    # the results can't be matched to their items, and a future without one would never resolve
+                    raise ValueError(f"The batch function returned {len(results)} results for {len(batch)} items")
+            except Exception as e:
+                logging.exception("Batch of %d items failed", len(batch))
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,95 @@
+"""
+The first stage of the cascade mode of the BERT models: a fastText classifier over the same labels answers the texts
+it's confident about, and only the rest are escalated to the BERT model.
+
+A model runs in cascade mode if its config json sets CASCADE_MODEL, the path to a supervised fastText model whose
+labels are the model's CLASS_NAMES with spaces replaced by underscores (e.g. __label__Organic_Material).  The optional
+CASCADE_THRESHOLD sets the probability the fastText model's top label needs for it to answer.
+"""
+import logging
+import threading
+from typing import List, Optional, Sequence, Tuple
+
+import fasttext
+from fasttext.FastText import _FastText
+
+from isamples_metadata.taxonomy.isamplesfasttext import SampledFeaturePredictor, format_input
+from isamples_metadata.taxonomy.metrics import CASCADE_DECISIONS, model_label, timed_stage
+
+DEFAULT_CASCADE_THRESHOLD = 0.9
+
+
+class Cascade:
+    """Answers the texts whose top first stage prediction reaches the threshold, and escalates the rest"""
+
+    def __init__(self, name: str, model: _FastText, class_names: Sequence[str], threshold: float):
+        """
+        :param name: the name of the BERT model the cascade answers for
+        :param model: the first stage fastText model
+        :param class_names: the BERT model's CLASS_NAMES, that the fastText labels are mapped back to
+        :param threshold: the probability the top label needs for the first stage to answer
+        """
+        self.name = name
+        self.threshold = threshold
+        self._metrics_label = model_label(name)
+        self._model = model
+        self._class_names = {class_name.replace(" ", "_"): class_name for class_name in class_names}
+        self._stats_lock = threading.Lock()
+        self._stats = {"answered": 0, "escalated": 0}
+
+    def _class_name(self, fasttext_label: str) -> Optional[str]:
+        return self._class_names.get(fasttext_label.removeprefix(SampledFeaturePredictor.RESULT_PREFIX))
+
+    def classify_batch(self, texts: List[str]) -> List[Optional[List[Tuple[str, float]]]]:
+        """
+        Returns the top 3 (label, probability) first stage predictions of each text that the first stage is confident
+        about, and None for the texts that have to be escalated to the BERT model
+        """
+        if len(texts) == 0:
+            return []
+        with timed_stage(self._metrics_label, "first_stage"):
+            # the list form of predict runs the texts through the model in a single native call, and takes one line
+            # per text
+            all_labels, all_probs = self._model.predict(
+                [format_input(text).replace("\n", " ") for text in texts], k=3
+            )
+        results: List[Optional[List[Tuple[str, float]]]] = []
+        for labels, probs in zip(all_labels, all_probs):
+            class_names = [self._class_name(label) for label in labels]
+            if len(class_names) == 0 or class_names[0] is None or probs[0] < self.threshold:
+                results.append(None)
+                continue
+            # fastText's softmax can come out a hair above 1
+            results.append([
+                (class_name, min(float(prob), 1.0))
+                for class_name, prob in zip(class_names, probs)
+                if class_name is not None
+            ])
+        escalated = sum(1 for result in results if result is None)
+        if escalated < len(texts):
+            CASCADE_DECISIONS.labels(self._metrics_label, "answered").inc(len(texts) - escalated)
+        if escalated > 0:
+            CASCADE_DECISIONS.labels(self._metrics_label, "escalated").inc(escalated)
+        with self._stats_lock:
+            self._stats["answered"] += len(texts) - escalated
+            self._stats["escalated"] += escalated
+        return results
+
+    def stats(self) -> dict:
+        """Returns the threshold and the cumulative number of texts answered by the first stage and escalated"""
+        with self._stats_lock:
+            stats: dict = dict(self._stats)
+        total = stats["answered"] + stats["escalated"]
+        stats["escalated_fraction"] = stats["escalated"] / total if total > 0 else 0.0
+        stats["threshold"] = self.threshold
+        return stats
+
+
+def create_cascade(name: str, config_json: dict) -> Optional[Cascade]:
+    """Loads the first stage model of the config's CASCADE_MODEL, or returns None if the model doesn't run in cascade
+    mode"""
+    if "CASCADE_MODEL" not in config_json:
+        return None
+    threshold = config_json.get("CASCADE_THRESHOLD", DEFAULT_CASCADE_THRESHOLD)
+    logging.info("Running the %s model in cascade mode, threshold %s", name, threshold)
+    return Cascade(name, fasttext.load_model(config_json["CASCADE_MODEL"]), config_json["CLASS_NAMES"], threshold)
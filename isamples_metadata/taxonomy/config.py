@@ -5,6 +5,10 @@ class Settings(BaseSettings):
     # The absolute path to the FastText model
     fasttext_model_path: str = "UNSET"
 
+    # Whether main.py loads the models at import time, so that a preforking server (gunicorn --preload) loads them
+    # once in the parent and the workers share them copy-on-write
+    preload_models: bool = False
+
     # The absolute path to the BERT model
     sesar_material_model_path: str = "UNSET"
     sesar_material_config_path: str = "UNSET"
@@ -13,6 +17,83 @@ class Settings(BaseSettings):
     opencontext_sample_model_path: str = "UNSET"
     opencontext_sample_config_path: str = "UNSET"
 
+    # Concurrent single-record predictions are merged into batches of up to max_batch_size texts, waiting at most
+    # max_batch_wait_ms for a batch to fill up.  A max batch size of 1 disables the merging.
+    sesar_material_max_batch_size: int = 16
+    sesar_material_max_batch_wait_ms: float = 5.0
+    opencontext_material_max_batch_size: int = 16
+    opencontext_material_max_batch_wait_ms: float = 5.0
+    opencontext_sample_max_batch_size: int = 16
+    opencontext_sample_max_batch_wait_ms: float = 5.0
+
+    # The most forward passes each BERT model runs at once.  The single-record micro batches, the batch and streaming
+    # requests all call the model from their own threads, and each forward pass already spreads over torch's intra-op
+    # threads, so running more than one at a time oversubscribes the cores.
+    sesar_material_max_concurrent_forward_passes: int = 1
+    opencontext_material_max_concurrent_forward_passes: int = 1
+    opencontext_sample_max_concurrent_forward_passes: int = 1
+
+    # Comma-separated batch sizes that each BERT model runs synthetic forward passes at after it's loaded, before the
+    # worker reports ready on /health/ready.  They should cover the batch sizes requests produce: single records, the
+    # micro batches and the streaming batches.  Empty disables the warm-up.
+    warmup_batch_sizes: str = "1,16,64"
+
+    # The number of inference worker processes (started with python -m isamples_metadata.taxonomy.inference_workers)
+    # that run the BERT models for the HTTP workers, which then only parse the requests and build the classifier texts.
+    # 0 runs the models in the HTTP workers.  The HTTP workers send the texts over the Unix domain socket at
+    # inference_socket_path.  Each inference worker is pinned to one of the semicolon-separated core sets of
+    # inference_worker_cores, e.g. "0-3;4-7", or to an even share of the available cores if it's empty.
+    inference_workers: int = 0
+    inference_socket_path: str = "/tmp/isamples_inference.sock"
+    inference_worker_cores: str = ""
+    # The inference workers are started alongside the HTTP workers, whose warm-up retries connecting to the socket for
+    # up to inference_connect_timeout_seconds while the workers start up
+    inference_connect_timeout_seconds: float = 300.0
+    # A prediction that an inference worker doesn't answer within inference_request_timeout_seconds fails, and its
+    # connection is dropped
+    inference_request_timeout_seconds: float = 60.0
+
+    # The request handlers run each model's predictions on its own pool of executor_workers threads.  At most
+    # executor_queue_depth predictions may be running or waiting for a thread, and requests beyond that get a 503
+    # with a Retry-After of inference_retry_after_seconds.  The single-record predictions of the BERT models are
+    # merged by the micro batcher, so their executors need at least max_batch_size threads to fill a batch.
+    sesar_material_executor_workers: int = 16
+    sesar_material_executor_queue_depth: int = 256
+    opencontext_material_executor_workers: int = 16
+    opencontext_material_executor_queue_depth: int = 256
+    opencontext_sample_executor_workers: int = 16
+    opencontext_sample_executor_queue_depth: int = 256
+    smithsonian_executor_workers: int = 4
+    smithsonian_executor_queue_depth: int = 256
+    # the SESAR rules-only classification doesn't use the model, so it has its own pool and isn't rejected while the
+    # model is overloaded
+    sesar_rules_executor_workers: int = 4
+    sesar_rules_executor_queue_depth: int = 256
+    inference_retry_after_seconds: int = 1
+
+    # The number of records of a streaming request that are run through the model together
+    stream_batch_size: int = 64
+    # Lines of a streaming request longer than stream_max_line_bytes aren't buffered, and get an error result line
+    stream_max_line_bytes: int = 1048576
+
+    # Bounds for the process-wide prediction cache shared by all predictors.  A max size of 0 disables the cache, and
+    # a ttl of 0 disables expiry.
+    prediction_cache_max_size: int = 100000
+    prediction_cache_ttl_seconds: float = 86400.0
+    # The absolute path to the SQLite database backing the persistent prediction cache, which is shared by all the
+    # worker processes and survives restarts.  Leave empty to disable it.
+    persistent_prediction_cache_path: str = ""
+    # Bounds for the persistent prediction cache, whose oldest entries are pruned beyond max_rows.  A max rows of 0
+    # disables the limit, and a ttl of 0 disables expiry.
+    persistent_prediction_cache_max_rows: int = 1000000
+    persistent_prediction_cache_ttl_seconds: float = 2592000.0
+    # The number of formatted inputs whose Smithsonian fastText predictions each worker keeps, 0 disables the cache
+    smithsonian_cache_max_size: int = 100000
+
+    # Responses are compressed with the gzip or zstd content coding the client's Accept-Encoding prefers, unless their
+    # body is smaller than response_compression_minimum_size bytes.  Streaming responses are always compressed.
+    response_compression_minimum_size: int = 1024
+
     class Config:
         env_file = "isamples_modelserver.env"
         case_sensitive = False
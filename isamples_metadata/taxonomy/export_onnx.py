@@ -0,0 +1,102 @@
+"""
+Exports the fine-tuned BERT classifiers to ONNX, for use with the onnxruntime BACKEND.
+
+Usage:
+    python -m isamples_metadata.taxonomy.export_onnx
+        exports the sesar-material, opencontext-material and opencontext-sample models configured in the settings file
+    python -m isamples_metadata.taxonomy.export_onnx --config /path/to/config.json [--output /path/to/model.onnx]
+        exports the model of a single config
+
+Each model is written to the ONNX_MODEL path of its config (by default model.onnx in the FINE_TUNED_MODEL directory)
+with dynamic batch and sequence axes.
+"""
+import argparse
+import inspect
+import json
+import logging
+from typing import Any, Dict, Optional
+
+import torch
+from transformers import BertForSequenceClassification, BertTokenizer
+
+from isamples_metadata.taxonomy import config
+from isamples_metadata.taxonomy.backends import onnx_model_path
+
+ONNX_OPSET_VERSION = 14
+
+
+class LogitsOnly(torch.nn.Module):
+    """Wraps the classifier so the exported graph has plain tensor inputs and a single logits output"""
+
+    def __init__(self, classifier: BertForSequenceClassification):
+        super().__init__()
+        self.classifier = classifier
+
+    def forward(self, input_ids, attention_mask):
+        return self.classifier(input_ids=input_ids, attention_mask=attention_mask, return_dict=False)[0]
+
+
+def export_model(config_json: dict, output_path: Optional[str] = None) -> str:
+    """
+    Export the fine-tuned model of the config to ONNX
+
+    :param config_json: the model config json
+    :param output_path: where to write the model, defaults to the ONNX_MODEL path of the config
+    :return: the path the model was written to
+    """
+    if output_path is None:
+        output_path = onnx_model_path(config_json)
+    tokenizer = BertTokenizer.from_pretrained(config_json["BERT_MODEL"])
+    classifier = BertForSequenceClassification.from_pretrained(
+        config_json["FINE_TUNED_MODEL"], num_labels=len(config_json["CLASS_NAMES"])
+    ).eval()
+    # the example inputs only fix the input types, batch and sequence sizes are dynamic in the exported graph
+    example = tokenizer(["example text", "another example text"], padding=True, return_tensors="pt")
+    export_kwargs: Dict[str, Any] = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # newer torch versions default to the dynamo exporter, stick with the TorchScript based one
+        export_kwargs["dynamo"] = False
+    with torch.no_grad():
+        torch.onnx.export(
+            LogitsOnly(classifier),
+            (example["input_ids"], example["attention_mask"]),
+            output_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"},
+            },
+            opset_version=ONNX_OPSET_VERSION,
+            **export_kwargs,
+        )
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the fine-tuned BERT classifiers to ONNX")
+    parser.add_argument("--config", help="path to a model config json, defaults to all of the configured models")
+    parser.add_argument("--output", help="output path of the ONNX model, only valid with --config")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.config:
+        config_paths = [args.config]
+    else:
+        if args.output:
+            parser.error("--output requires --config")
+        settings = config.Settings()
+        config_paths = [
+            settings.sesar_material_config_path,
+            settings.opencontext_material_config_path,
+            settings.opencontext_sample_config_path,
+        ]
+    for config_path in config_paths:
+        with open(config_path) as json_file:
+            config_json = json.load(json_file)
+        output_path = export_model(config_json, args.output)
+        logging.info("Exported %s to %s", config_path, output_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Compiles the fine-tuned BERT classifiers to self-contained TorchScript artifacts, which the torch BACKEND loads instead
+of building the classifier with transformers.
+
+Usage:
+    python -m isamples_metadata.taxonomy.export_torchscript
+        compiles the sesar-material, opencontext-material and opencontext-sample models configured in the settings file
+    python -m isamples_metadata.taxonomy.export_torchscript --config /path/to/config.json [--output /path/to/model.pt]
+        compiles the model of a single config
+
+Each classifier is traced, quantized first if the config's QUANTIZATION asks for it, frozen so the weights become
+constants of the graph, and written to the TORCHSCRIPT_MODEL path of its config (by default model.torchscript.pt, or
+model.dynamic_int8.torchscript.pt, in the FINE_TUNED_MODEL directory).  The traced graph accepts any batch size and
+sequence length.  The artifact records a fingerprint of the fine-tuned model it was compiled from, and the torch backend
+falls back to the fine-tuned model, with a warning, once that's replaced.  Re-run the export then.
+"""
+import argparse
+import json
+import logging
+from typing import Optional
+
+import torch
+from transformers import BertForSequenceClassification, BertTokenizerFast
+
+from isamples_metadata.taxonomy import config
+from isamples_metadata.taxonomy.backends import SOURCE_FINGERPRINT_FILE, source_fingerprint, torchscript_model_path
+from isamples_metadata.taxonomy.export_onnx import LogitsOnly
+
+
+def export_model(config_json: dict, output_path: Optional[str] = None) -> str:
+    """
+    Compile the fine-tuned model of the config to TorchScript
+
+    :param config_json: the model config json
+    :param output_path: where to write the artifact, defaults to the TORCHSCRIPT_MODEL path of the config
+    :return: the path the artifact was written to
+    """
+    if output_path is None:
+        output_path = torchscript_model_path(config_json)
+    # taken before loading, so the artifact can't claim a model that was replaced while it was compiled
+    fingerprint = source_fingerprint(config_json)
+    tokenizer = BertTokenizerFast.from_pretrained(config_json["BERT_MODEL"])
+    # torchscript mode unties the shared weights and returns tuples, which tracing requires
+    classifier = BertForSequenceClassification.from_pretrained(
+        config_json["FINE_TUNED_MODEL"], num_labels=len(config_json["CLASS_NAMES"]), torchscript=True
+    ).eval()
+    if config_json.get("QUANTIZATION", "none") == "dynamic_int8":
+        classifier = torch.ao.quantization.quantize_dynamic(classifier, {torch.nn.Linear}, dtype=torch.qint8)
+    # the example inputs only fix the input types, batch and sequence sizes are dynamic in the traced graph
+    example = tokenizer(["example text", "another, longer example text"], padding=True, return_tensors="pt")
+    with torch.no_grad():
+        traced = torch.jit.trace(LogitsOnly(classifier), (example["input_ids"], example["attention_mask"]))
+        frozen = torch.jit.freeze(traced.eval())
+    torch.jit.save(frozen, output_path, _extra_files={SOURCE_FINGERPRINT_FILE: fingerprint})
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the fine-tuned BERT classifiers to TorchScript")
+    parser.add_argument("--config", help="path to a model config json, defaults to all of the configured models")
+    parser.add_argument("--output", help="output path of the TorchScript artifact, only valid with --config")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.config:
+        config_paths = [args.config]
+    else:
+        if args.output:
+            parser.error("--output requires --config")
+        settings = config.Settings()
+        config_paths = [
+            settings.sesar_material_config_path,
+            settings.opencontext_material_config_path,
+            settings.opencontext_sample_config_path,
+        ]
+    for config_path in config_paths:
+        with open(config_path) as json_file:
+            config_json = json.load(json_file)
+        output_path = export_model(config_json, args.output)
+        logging.info("Compiled %s to %s", config_path, output_path)
+
+
+if __name__ == "__main__":
+    main()
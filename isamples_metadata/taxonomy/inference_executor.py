@@ -0,0 +1,149 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from isamples_metadata.taxonomy import config
+
+# The executors, named after the model they run, e.g. sesar_material
+EXECUTOR_NAMES = ("sesar_material", "opencontext_material", "opencontext_sample", "smithsonian", "sesar_rules")
+
+
+class InferenceQueueFullException(Exception):
+    """Raised when an inference executor already has its maximum number of calls pending"""
+
+    def __init__(self, name: str, retry_after_seconds: int):
+        super().__init__(f"The {name} inference queue is full")
+        self.name = name
+        self.retry_after_seconds = retry_after_seconds
+
+
+class InferenceExecutor:
+    """Bounded thread pool that the async request handlers hand their model calls to.
+
+    Each model gets its own executor, so a slow model can't starve the others of threads, and the number of calls
+    that may be pending (running or waiting for a thread) is capped at max_queue_depth.  Calls beyond that are rejected
+    with an InferenceQueueFullException instead of queueing up without limit, so an overloaded server sheds the excess
+    requests quickly rather than timing out all of them.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue_depth: int, retry_after_seconds: int = 1):
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        if max_queue_depth < max_workers:
+            raise ValueError("max_queue_depth must be at least max_workers")
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self.retry_after_seconds = retry_after_seconds
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        # the thread pool is created on first use, and again after a fork since threads don't survive one
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pid = os.getpid()
+
+    def _thread_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pid != os.getpid():
+                # the calls pending in the parent process never complete in this one
+                self._pool = None
+                self._pending = 0
+                self._running = 0
+                self._pid = os.getpid()
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix=f"inference-{self.name}")
+            return self._pool
+
+    def is_full(self) -> bool:
+        return self._pending >= self.max_queue_depth
+
+    def _admit(self, force: bool):
+        with self._lock:
+            if not force and self._pending >= self.max_queue_depth:
+                self.rejected += 1
+                raise InferenceQueueFullException(self.name, self.retry_after_seconds)
+            self._pending += 1
+            self.submitted += 1
+
+    def _call(self, submitted_at: float, fn: Callable, args: tuple) -> Any:
+        wait_seconds = time.monotonic() - submitted_at
+        with self._lock:
+            self._running += 1
+            self.wait_seconds_total += wait_seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._pending -= 1
+                self.completed += 1
+
+    async def run(self, fn: Callable, *args: Any, force: bool = False) -> Any:
+        """
+        Runs fn(*args) on the executor's threads and waits for the result
+
+        :param force: admit the call even if the queue is full, for work that was admitted earlier, like the later
+                      batches of a stream
+        :raises InferenceQueueFullException: if the queue is full
+        """
+        pool = self._thread_pool()
+        self._admit(force)
+        try:
+            future = pool.submit(self._call, time.monotonic(), fn, args)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        with self._lock:
+            started = self.completed + self._running
+            return {
+                "max_workers": self.max_workers,
+                "max_queue_depth": self.max_queue_depth,
+                "pending": self._pending,
+                "running": self._running,
+                "queued": self._pending - self._running,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "mean_wait_seconds": self.wait_seconds_total / started if started > 0 else 0.0,
+                "max_wait_seconds": self.wait_seconds_max,
+            }
+
+
+_EXECUTORS: Dict[str, InferenceExecutor] = {}
+_EXECUTORS_LOCK = threading.Lock()
+
+
+def get_inference_executor(name: str) -> InferenceExecutor:
+    """Returns the executor of the named model, created from the settings on first use"""
+    with _EXECUTORS_LOCK:
+        if name not in _EXECUTORS:
+            if name not in EXECUTOR_NAMES:
+                raise ValueError(f"Invalid inference executor {name}, valid names are {EXECUTOR_NAMES}")
+            settings = config.Settings()
+            # executor settings are named after the model, e.g. sesar_material_executor_workers
+            _EXECUTORS[name] = InferenceExecutor(
+                name,
+                getattr(settings, f"{name}_executor_workers"),
+                getattr(settings, f"{name}_executor_queue_depth"),
+                settings.inference_retry_after_seconds,
+            )
+        return _EXECUTORS[name]
+
+
+def inference_executor_stats() -> dict:
+    """Returns the statistics of the executors that have been used, keyed by name"""
+    with _EXECUTORS_LOCK:
+        return {name: executor.stats() for name, executor in _EXECUTORS.items()}
@@ -0,0 +1,174 @@
+"""
+Runs the BERT models in a pool of inference worker processes, separate from the HTTP workers.
+
+Usage:
+    python -m isamples_metadata.taxonomy.inference_workers [--workers 2] [--cores "0-3;4-7"]
+
+Each worker is pinned to its own set of cores and sets its torch thread count to match, loads the models configured
+in the settings file, and serves predictions on the Unix domain socket at INFERENCE_SOCKET_PATH.  The HTTP workers
+connect to it when INFERENCE_WORKERS is greater than 0, so the number of HTTP workers and the number of cores spent on
+the models can be scaled independently.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+from typing import List, Mapping, Protocol, Tuple
+
+import torch
+
+from isamples_metadata.taxonomy import config
+from isamples_metadata.taxonomy.metadata_models import MetadataModelLoader
+from isamples_metadata.taxonomy.model_startup import parse_batch_sizes, warm_up_model
+from isamples_metadata.taxonomy.remote_model import recv_frame, send_frame
+
+# the (collection, label type) of the models the workers serve
+MODELS = [("SESAR", "material"), ("OPENCONTEXT", "material"), ("OPENCONTEXT", "sample")]
+
+
+def parse_core_sets(core_sets: str) -> List[List[int]]:
+    """Parses semicolon-separated core sets of comma-separated cores and core ranges, e.g. "0-3;4,5,6,7" """
+    parsed = []
+    for core_set in core_sets.split(";"):
+        cores: List[int] = []
+        for part in core_set.split(","):
+            if "-" in part:
+                first, last = part.split("-")
+                cores.extend(range(int(first), int(last) + 1))
+            elif part.strip():
+                cores.append(int(part))
+        if len(cores) > 0:
+            parsed.append(cores)
+    return parsed
+
+
+def split_cores(cores: List[int], worker_count: int) -> List[List[int]]:
+    """Splits the cores into worker_count contiguous core sets, as evenly as possible"""
+    if worker_count > len(cores):
+        raise ValueError(f"Unable to pin {worker_count} inference workers to {len(cores)} cores")
+    core_sets = []
+    start = 0
+    for worker in range(worker_count):
+        end = start + (len(cores) - start) // (worker_count - worker)
+        core_sets.append(cores[start:end])
+        start = end
+    return core_sets
+
+
+def available_cores() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class ServedModel(Protocol):
+    """What the workers need of the models they serve"""
+
+    name: str
+
+    def predict(self, text: str) -> List[Tuple[str, float]]:
+        ...
+
+    def predict_batch(self, texts: List[str]) -> List[List[Tuple[str, float]]]:
+        ...
+
+
+def _serve_connection(connection: socket.socket, models: Mapping[str, ServedModel]):
+    with connection:
+        while True:
+            try:
+                request = recv_frame(connection)
+            except OSError:
+                return
+            if request is None:
+                return
+            try:
+                model = models[request["model"]]
+                texts = request["texts"]
+                # single texts go through the model's micro batcher, merging them with the other connections' texts
+                predictions = [model.predict(texts[0])] if len(texts) == 1 else model.predict_batch(texts)
+                response: dict = {"predictions": predictions}
+            except Exception as e:
+                logging.exception("Prediction failed")
+                response = {"error": f"{e.__class__.__name__}: {e}"}
+            try:
+                send_frame(connection, response)
+            except OSError:
+                return
+
+
+def serve(listener: socket.socket, models: Mapping[str, ServedModel]):
+    """Serves predictions of the models to the connections accepted on the listener, a thread per connection"""
+    while True:
+        connection, _ = listener.accept()
+        threading.Thread(target=_serve_connection, args=(connection, models), daemon=True).start()
+
+
+def _run_worker(listener: socket.socket, cores: List[int]):
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    # one intra-op thread per pinned core, so the workers don't compete for each other's cores
+    torch.set_num_threads(len(cores))
+    models = {}
+    for collection, label_type in MODELS:
+        config_json = MetadataModelLoader.read_model_config(collection, label_type)
+        if config_json is not None:
+            model = MetadataModelLoader.create_local_model(collection, label_type, config_json)
+            models[model.name] = model
+    batch_sizes = parse_batch_sizes(config.Settings().warmup_batch_sizes)
+    if len(batch_sizes) > 0:
+        # connections wait in the listen backlog until the models are warm
+        for model in models.values():
+            warm_up_model(model, batch_sizes)
+    logging.info("Inference worker %d serving %s on cores %s", os.getpid(), sorted(models), cores)
+    serve(listener, models)
+
+
+def run_workers(socket_path: str, core_sets: List[List[int]]):
+    """Binds the socket and runs an inference worker per core set, until they exit"""
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    # connections made while the workers are still loading the models wait in the backlog
+    listener.listen(128)
+    # the workers inherit the listening socket and all accept on it, so the kernel spreads the connections over them
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=_run_worker, args=(listener, cores), daemon=True) for cores in core_sets]
+    for process in processes:
+        process.start()
+    # exit normally on SIGTERM, so the workers are stopped along with this process
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            process.terminate()
+        listener.close()
+        os.remove(socket_path)
+
+
+def main():
+    settings = config.Settings()
+    parser = argparse.ArgumentParser(description="Run the BERT models in dedicated inference worker processes")
+    parser.add_argument("--workers", type=int, default=max(settings.inference_workers, 1))
+    parser.add_argument("--cores", default=settings.inference_worker_cores, help='core sets, e.g. "0-3;4-7"')
+    parser.add_argument("--socket-path", default=settings.inference_socket_path)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.cores:
+        core_sets = parse_core_sets(args.cores)
+        if len(core_sets) != args.workers:
+            parser.error(f"--cores has {len(core_sets)} core sets for {args.workers} workers")
+    else:
+        core_sets = split_cores(available_cores(), args.workers)
+    run_workers(args.socket_path, core_sets)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,33 +2,42 @@
 
 import fasttext
 import os.path
+import threading
 import typing
 import re
 import logging
 from fasttext.FastText import _FastText
 
 from isamples_metadata.taxonomy import config
+from isamples_metadata.taxonomy.bounded_cache import BoundedCache
+from isamples_metadata.taxonomy.metrics import count_cache_lookups, model_label, timed_stage
 
-_MODEL = None
 _MODEL_PATH = config.Settings().fasttext_model_path
-if not os.path.exists(_MODEL_PATH):
-    logging.error(
-        "Unable to locate fasttext model at path %s.  All predictions will return NOT_PROVIDED.",
-        _MODEL_PATH,
-    )
-else:
-    _MODEL = fasttext.load_model(_MODEL_PATH)
 
 NOT_PROVIDED = "Not Provided"
+# the most labels a prediction can ask for
+MAX_TOP_K = 10
+
+
+def format_input(text: str) -> str:
+    """Formats a text the way the fastText models expect their input: lowercased and without punctuation"""
+    return re.sub(r"[^\w\s]", "", text.lower())
 
 
 class SampledFeaturePredictor:
     RESULT_PREFIX = "__label__"
 
-    def __init__(self, name: str, model: _FastText):
+    def __init__(self, name: str, model: _FastText, cache_size: int = 0):
+        """
+        :param name: the name of the model, used in the metrics
+        :param model: the fastText model, or None if it couldn't be loaded
+        :param cache_size: the number of formatted inputs whose predictions are kept, 0 disables the cache
+        """
         self._name = name
+        self._metrics_label = model_label(name)
         self._model = model
         self._model_valid = model is not None
+        self._cache = BoundedCache(cache_size)
 
     def predict_sampled_feature(self, context: typing.List[str]) -> str:
         """
@@ -48,19 +57,73 @@ class SampledFeaturePredictor:
             )
             return NOT_PROVIDED
 
-        # Do a bit of formatting to ensure the input is as the model expects
-        string_input = " ".join(context)
-        string_input = string_input.lower()
-        string_input = re.sub(r"[^\w\s]", "", string_input)
-        result = self._model.predict(string_input)
+        predictions = self.predict_sampled_features([context], 1)[0]
+        return predictions[0][0] if len(predictions) > 0 else NOT_PROVIDED
 
-        # The model output looks like this:
-        # (('__label__Marine_water_body',), array([1.00001001]))
-        # So get the first item's first item and do some string munging to get the actual label to use
-        raw_result = result[0][0]
-        processed_result = raw_result.removeprefix(self.RESULT_PREFIX)
-        processed_result = processed_result.replace("_", " ")
-        return processed_result
+    def predict_sampled_features(
+        self, contexts: typing.List[typing.List[str]], k: int = 1
+    ) -> typing.List[typing.List[typing.Tuple[str, float]]]:
+        """
+        Batch variant of predict_sampled_feature that returns the top k labels of each context, with their
+        probabilities.  The inputs that aren't cached are sent to the model in a single call.
 
+        :param contexts: The unprocessed inputs to the model of each source record
+        :param k: The number of labels to return per context, at most MAX_TOP_K
+        :return: The top k (label, probability) predictions of each context.  If the model couldn't be loaded, each
+                 context gets NOT_PROVIDED with probability 0.
+        """
+        if not self._model_valid:
+            logging.error(
+                "Returning Transformer.NOT_PROVIDED since we couldn't load the model at path %s.",
+                _MODEL_PATH,
+            )
+            return [[(NOT_PROVIDED, 0.0)] for _ in contexts]
+
+        # Do a bit of formatting to ensure the input is as the model expects, the model takes one line per input
+        with timed_stage(self._metrics_label, "build_text"):
+            string_inputs = [format_input(" ".join(context)).replace("\n", " ") for context in contexts]
+        results: typing.List[typing.Optional[typing.List[typing.Tuple[str, float]]]] = [
+            self._cache.get((string_input, k)) for string_input in string_inputs
+        ]
+        missing_indices = [index for index, result in enumerate(results) if result is None]
+        count_cache_lookups(self._metrics_label, "memory", len(results) - len(missing_indices), len(missing_indices))
+        if len(missing_indices) > 0:
+            with timed_stage(self._metrics_label, "forward"):
+                all_labels, all_probs = self._model.predict([string_inputs[index] for index in missing_indices], k=k)
+
+            # The model output of each input looks like this:
+            # ['__label__Marine_water_body', '__label__Subsurface'], array([0.97, 0.02])
+            # So do some string munging to get the actual labels to use
+            with timed_stage(self._metrics_label, "postprocessing"):
+                for index, labels, probs in zip(missing_indices, all_labels, all_probs):
+                    predictions = [
+                        # fastText's softmax can come out a hair above 1
+                        (label.removeprefix(self.RESULT_PREFIX).replace("_", " "), min(float(prob), 1.0))
+                        for label, prob in zip(labels, probs)
+                    ]
+                    results[index] = predictions
+                    self._cache.put((string_inputs[index], k), predictions)
+        return typing.cast(typing.List[typing.List[typing.Tuple[str, float]]], results)
 
-SMITHSONIAN_FEATURE_PREDICTOR = SampledFeaturePredictor("Smithsonian", _MODEL)
+
+_SMITHSONIAN_FEATURE_PREDICTOR: typing.Optional[SampledFeaturePredictor] = None
+_SMITHSONIAN_FEATURE_PREDICTOR_LOCK = threading.Lock()
+
+
+def get_smithsonian_feature_predictor() -> SampledFeaturePredictor:
+    """Returns the Smithsonian sampled feature predictor, loading the fasttext model on first use"""
+    global _SMITHSONIAN_FEATURE_PREDICTOR
+    with _SMITHSONIAN_FEATURE_PREDICTOR_LOCK:
+        if _SMITHSONIAN_FEATURE_PREDICTOR is None:
+            model = None
+            if not os.path.exists(_MODEL_PATH):
+                logging.error(
+                    "Unable to locate fasttext model at path %s.  All predictions will return NOT_PROVIDED.",
+                    _MODEL_PATH,
+                )
+            else:
+                model = fasttext.load_model(_MODEL_PATH)
+            _SMITHSONIAN_FEATURE_PREDICTOR = SampledFeaturePredictor(
+                "Smithsonian", model, config.Settings().smithsonian_cache_max_size
+            )
+        return _SMITHSONIAN_FEATURE_PREDICTOR
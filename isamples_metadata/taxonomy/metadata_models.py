@@ -2,17 +2,21 @@ import collections
 import logging
 import json
 import os
-from functools import cache
-from typing import Tuple, Optional, List, Protocol
+import threading
+import warnings
+from typing import Dict, Tuple, Optional, List, Protocol, Union, Callable
 
 from pydantic import BaseModel
 
-from isamples_metadata.metadata_exceptions import (
-    TestRecordException,
-    SESARSampleTypeException,
-)
+from isamples_metadata.metadata_exceptions import MetadataException
 from isamples_metadata.taxonomy import config
-from isamples_metadata.taxonomy.Model import Model
+from isamples_metadata.taxonomy.Model import Model, fingerprint
+from isamples_metadata.taxonomy.backends import create_backend
+from isamples_metadata.taxonomy.cascade import Cascade, create_cascade
+from isamples_metadata.taxonomy.metrics import CLASSIFICATIONS, model_label, timed_stage
+from isamples_metadata.taxonomy.prediction_cache import PREDICTION_CACHE
+from isamples_metadata.taxonomy.remote_model import RemoteModel
+from isamples_metadata.taxonomy.sesar_rules import SESAR_RULES
 from isamples_metadata.taxonomy.SESARClassifierInput import SESARClassifierInput
 from isamples_metadata.taxonomy.OpenContextClassifierInput import (
     OpenContextClassifierInput,
@@ -21,34 +25,172 @@ from isamples_metadata.taxonomy.OpenContextClassifierInput import (
 
 RULE_BASED_CONFIDENCE = 1.0
 
+# The stage of the classification that answered a prediction: the SESAR rules, the first stage model of a model in
+# cascade mode, or the BERT model
+RULE_STAGE = "rule"
+FIRST_STAGE = "first_stage"
+MODEL_STAGE = "model"
+
 
 class PredictionResult(BaseModel):
     value: str = ""
     confidence: float = 0.0
+    stage: str = MODEL_STAGE
+
+
+# A model running in this process, or a proxy for one running in the inference worker processes
+AnyModel = Union[Model, RemoteModel]
+
+# The outcome of a single record in a batch prediction: either the predictions, or the exception that excluded it
+RecordPrediction = Union[List[PredictionResult], MetadataException]
+
+# The outcome of a single record in a rules-only classification: the rule-based predictions, None if none of the rules
+# apply and the model has to classify it, or the exception that excluded it
+RulePrediction = Union[Optional[List[PredictionResult]], MetadataException]
+
+
+def predict_batch_isolating_errors(
+    batch_predictor: Callable[[List[dict]], List[RecordPrediction]], source_records: List[dict]
+) -> List[Union[RecordPrediction, Exception]]:
+    """
+    Run the records through a batch predictor.  Records that are malformed (e.g. missing fields the classifier input
+    requires) fail the whole batch, so if the batch fails the records are retried one at a time, and the exception
+    is returned for the ones that fail on their own.
+
+    :param batch_predictor one of the predict_*_batch methods of the predictors
+    :param source_records the raw sources of the records
+    :return per-record list of predictions, or the exception raised for the record
+    """
+    try:
+        return list(batch_predictor(source_records))
+    except Exception:
+        results: List[Union[RecordPrediction, Exception]] = []
+        for source_record in source_records:
+            try:
+                results.extend(batch_predictor([source_record]))
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+def predict_in_stages(
+    cascade: Optional[Cascade],
+    texts: List[str],
+    classify_by_machine_batch: Callable[[List[str]], List[List[Tuple[str, float]]]],
+    labels_to_cv: Optional[Dict[str, str]] = None,
+) -> List[List[PredictionResult]]:
+    """
+    Returns the machine predictions of the texts.  If the model runs in cascade mode, the first stage answers the
+    texts it's confident about and only the rest are passed to classify_by_machine_batch.
+
+    :param cascade the first stage of the model, or None if it doesn't run in cascade mode
+    :param texts the model input texts
+    :param classify_by_machine_batch the predictor method that runs texts through the BERT model
+    :param labels_to_cv maps the first stage labels to the iSamples CV, like classify_by_machine_batch does
+    :return per-text list of predictions, with the stage that answered
+    """
+    first_stage_predictions = cascade.classify_batch(texts) if cascade is not None else [None] * len(texts)
+    escalated_indices = [index for index, predictions in enumerate(first_stage_predictions) if predictions is None]
+    machine_predictions = classify_by_machine_batch([texts[index] for index in escalated_indices])
+    results: List[List[PredictionResult]] = []
+    for predictions in first_stage_predictions:
+        if predictions is None:
+            results.append([])
+            continue
+        results.append([
+            PredictionResult(
+                value=labels_to_cv[label] if labels_to_cv else label, confidence=prob, stage=FIRST_STAGE
+            )
+            for label, prob in predictions
+        ])
+    for index, predictions in zip(escalated_indices, machine_predictions):
+        results[index] = [PredictionResult(value=label, confidence=prob) for label, prob in predictions]
+    return results
 
 
 class SampleTypePredictor(Protocol):
     def predict_sample_type(self, source_record: dict) -> List[PredictionResult]:
         return []
 
+    def predict_sample_type_for_input(self, oc_input: OpenContextClassifierInput) -> List[PredictionResult]:
+        return []
+
+    def predict_sample_type_batch(self, source_records: List[dict]) -> List[RecordPrediction]:
+        return []
+
 
 class MaterialTypePredictor(Protocol):
     def predict_material_type(self, source_record: dict) -> List[PredictionResult]:
         return []
 
+    def predict_material_type_batch(self, source_records: List[dict]) -> List[RecordPrediction]:
+        return []
+
+
+class OpenContextMaterialTypePredictor(MaterialTypePredictor, Protocol):
+    def predict_material_type_for_input(self, oc_input: OpenContextClassifierInput) -> List[PredictionResult]:
+        return []
+
 
 class SampledFeaturePredictor(Protocol):
     def predict_sampled_feature(self, context: List[str]) -> str:
         return ""
 
+    def predict_sampled_features(self, contexts: List[List[str]], k: int = 1) -> List[List[Tuple[str, float]]]:
+        return []
+
 
 class MetadataModelLoader:
     """Class that instantiates the pretrained models"""
 
     # loaded models that will be used for classification
-    _SESAR_MATERIAL_MODEL = None
-    _OPENCONTEXT_MATERIAL_MODEL = None
-    _OPENCONTEXT_SAMPLE_MODEL = None
+    _SESAR_MATERIAL_MODEL: Optional[AnyModel] = None
+    _OPENCONTEXT_MATERIAL_MODEL: Optional[AnyModel] = None
+    _OPENCONTEXT_SAMPLE_MODEL: Optional[AnyModel] = None
+    # the first stages of the models in cascade mode, keyed by (collection, label type)
+    _CASCADES: Dict[Tuple[str, str], Cascade] = {}
+    # held while a model loads, so concurrent getters of the same model wait for it rather than load it again
+    _LOAD_LOCKS = {
+        ("SESAR", "material"): threading.Lock(),
+        ("OPENCONTEXT", "material"): threading.Lock(),
+        ("OPENCONTEXT", "sample"): threading.Lock(),
+    }
+
+    @staticmethod
+    def read_model_config(collection, label_type) -> Optional[dict]:
+        """Returns the model config json at the config path in the settings file, or None if it doesn't exist"""
+        if collection == "SESAR" and label_type == "material":
+            config_path = config.Settings().sesar_material_config_path
+        elif collection == "OPENCONTEXT" and label_type == "material":
+            config_path = config.Settings().opencontext_material_config_path
+        elif collection == "OPENCONTEXT" and label_type == "sample":
+            config_path = config.Settings().opencontext_sample_config_path
+        # read the model config file as json
+        if not os.path.exists(config_path):
+            logging.error("Unable to locate pretrained models at %s", config_path)
+            return None
+        with open(config_path) as json_file:
+            return json.load(json_file)
+
+    @staticmethod
+    def create_local_model(collection, label_type, config_json) -> Model:
+        """Loads the model of the config to run in this process"""
+        # the model config selects the backend that runs the forward pass
+        backend = create_backend(config_json)
+        # batching settings are named after the model, e.g. sesar_material_max_batch_size
+        settings = config.Settings()
+        settings_prefix = f"{collection.lower()}_{label_type}"
+        model = Model(
+            config_json,
+            f"{collection}-{label_type}",
+            backend,
+            getattr(settings, f"{settings_prefix}_max_concurrent_forward_passes"),
+        )
+        max_batch_size = getattr(settings, f"{settings_prefix}_max_batch_size")
+        max_batch_wait_ms = getattr(settings, f"{settings_prefix}_max_batch_wait_ms")
+        if max_batch_size > 1:
+            model.enable_micro_batching(max_batch_size, max_batch_wait_ms)
+        return model
 
     @staticmethod
     def load_model_from_path(collection, label_type, config_json=None):
@@ -64,20 +206,26 @@ class MetadataModelLoader:
         """
         # load the model config file
         if not config_json:
-            if collection == "SESAR" and label_type == "material":
-                config_path = config.Settings().sesar_material_config_path
-            elif collection == "OPENCONTEXT" and label_type == "material":
-                config_path = config.Settings().opencontext_material_config_path
-            elif collection == "OPENCONTEXT" and label_type == "sample":
-                config_path = config.Settings().opencontext_sample_config_path
-            # read the model config file as json
-            if not os.path.exists(config_path):
-                logging.error("Unable to locate pretrained models at %s", config_path)
+            config_json = MetadataModelLoader.read_model_config(collection, label_type)
+            if config_json is None:
                 return
-            with open(config_path) as json_file:
-                config_json = json.load(json_file)
         # use the model config to get the pretrained model
-        model = Model(config_json)
+        settings = config.Settings()
+        if settings.inference_workers > 0:
+            # the model runs in the inference worker processes, this process only sends them the texts
+            model = RemoteModel(
+                f"{collection}-{label_type}",
+                settings.inference_socket_path,
+                fingerprint(config_json),
+                settings.inference_connect_timeout_seconds,
+                settings.inference_request_timeout_seconds,
+            )
+        else:
+            model = MetadataModelLoader.create_local_model(collection, label_type, config_json)
+        # the first stage of a model in cascade mode always runs in this process, it's cheaper than a round trip
+        cascade = create_cascade(f"{collection}-{label_type}", config_json)
+        if cascade is not None:
+            MetadataModelLoader._CASCADES[(collection, label_type)] = cascade
 
         # initialize the model fields
         if collection == "SESAR" and label_type == "material":
@@ -88,7 +236,27 @@ class MetadataModelLoader:
             MetadataModelLoader._OPENCONTEXT_SAMPLE_MODEL = model
 
     @staticmethod
-    def get_sesar_material_model(config_json: Optional[dict] = None) -> Optional[Model]:
+    def loaded_models() -> List[AnyModel]:
+        """Returns the models that have been loaded so far"""
+        models = [
+            MetadataModelLoader._SESAR_MATERIAL_MODEL,
+            MetadataModelLoader._OPENCONTEXT_MATERIAL_MODEL,
+            MetadataModelLoader._OPENCONTEXT_SAMPLE_MODEL,
+        ]
+        return [model for model in models if model is not None]
+
+    @staticmethod
+    def loaded_cascades() -> List[Cascade]:
+        """Returns the first stages of the loaded models that run in cascade mode"""
+        return list(MetadataModelLoader._CASCADES.values())
+
+    @staticmethod
+    def get_cascade(collection, label_type) -> Optional[Cascade]:
+        """Returns the first stage of the model if it's loaded and runs in cascade mode, otherwise None"""
+        return MetadataModelLoader._CASCADES.get((collection, label_type))
+
+    @staticmethod
+    def get_sesar_material_model(config_json: Optional[dict] = None) -> Optional[AnyModel]:
         """
         Getter method that returns the SESAR material model
         If the config of the model is passed, we can load the model directly reading the config_json values
@@ -97,157 +265,143 @@ class MetadataModelLoader:
         :param config_json sesar material model config json in dict format
         """
         if not MetadataModelLoader._SESAR_MATERIAL_MODEL:
-            MetadataModelLoader.load_model_from_path("SESAR", "material", config_json)
+            with MetadataModelLoader._LOAD_LOCKS[("SESAR", "material")]:
+                if not MetadataModelLoader._SESAR_MATERIAL_MODEL:
+                    MetadataModelLoader.load_model_from_path("SESAR", "material", config_json)
         return MetadataModelLoader._SESAR_MATERIAL_MODEL
 
     @staticmethod
-    def get_oc_material_model(config_json: Optional[dict] = None) -> Optional[Model]:
+    def get_oc_material_model(config_json: Optional[dict] = None) -> Optional[AnyModel]:
         if not MetadataModelLoader._OPENCONTEXT_MATERIAL_MODEL:
-            MetadataModelLoader.load_model_from_path(
-                "OPENCONTEXT", "material", config_json
-            )
+            with MetadataModelLoader._LOAD_LOCKS[("OPENCONTEXT", "material")]:
+                if not MetadataModelLoader._OPENCONTEXT_MATERIAL_MODEL:
+                    MetadataModelLoader.load_model_from_path(
+                        "OPENCONTEXT", "material", config_json
+                    )
         return MetadataModelLoader._OPENCONTEXT_MATERIAL_MODEL
 
     @staticmethod
-    def get_oc_sample_model(config_json: Optional[dict] = None) -> Optional[Model]:
+    def get_oc_sample_model(config_json: Optional[dict] = None) -> Optional[AnyModel]:
         if not MetadataModelLoader._OPENCONTEXT_SAMPLE_MODEL:
-            MetadataModelLoader.load_model_from_path(
-                "OPENCONTEXT", "sample", config_json
-            )
+            with MetadataModelLoader._LOAD_LOCKS[("OPENCONTEXT", "sample")]:
+                if not MetadataModelLoader._OPENCONTEXT_SAMPLE_MODEL:
+                    MetadataModelLoader.load_model_from_path(
+                        "OPENCONTEXT", "sample", config_json
+                    )
         return MetadataModelLoader._OPENCONTEXT_SAMPLE_MODEL
 
 
+def sesar_rule_pass(metrics_label: str, source_record: dict) -> Tuple[str, Optional[List[PredictionResult]]]:
+    """Returns the model input text of the SESAR record, along with the rule-based prediction if one of the rules
+    applies.  Raises a MetadataException if the record should be excluded."""
+    # extract the data that the model requires for classification
+    with timed_stage(metrics_label, "parse_thing"):
+        sesar_input = SESARClassifierInput(source_record)
+        sesar_input.parse_thing()
+    with timed_stage(metrics_label, "build_text"):
+        description_map = sesar_input.get_description_map()
+        # get the input string for prediction
+        input_string = sesar_input.get_material_text()
+    # first pass : see if the record falls in the defined rules
+    with timed_stage(metrics_label, "rules"):
+        label = SESAR_RULES.classify(input_string, description_map)
+    if label:
+        # set sentinel value as probability
+        return input_string, [PredictionResult(value=label, confidence=RULE_BASED_CONFIDENCE, stage=RULE_STAGE)]
+    return input_string, None
+
+
+def classify_sesar_by_rules(source_records: List[dict]) -> List[RulePrediction]:
+    """
+    Run only the rule pass of the SESAR material classification, which needs neither the model nor its config, so
+    pipelines can label the records that the rules cover cheaply and only send the rest to the model.
+
+    :param source_records the raw sources of the records
+    :return per-record rule-based predictions, None for the records that need the model, or the MetadataException
+            raised for excluded records
+    """
+    results: List[RulePrediction] = []
+    for source_record in source_records:
+        try:
+            results.append(sesar_rule_pass(model_label("SESAR-material"), source_record)[1])
+        except MetadataException as e:
+            results.append(e)
+    return results
+
+
 class SESARMaterialPredictor:
     """Material label predictor of SESAR collection"""
 
-    def __init__(self, model: Optional[Model]):
+    def __init__(self, model: Optional[AnyModel], cascade: Optional[Cascade] = None):
+        """
+        :param model: the BERT model
+        :param cascade: the first stage of the model if it runs in cascade mode
+        """
         if not model:
             raise TypeError("Model is required to be non-None")
         self._model = model
+        self._cascade = cascade
+        self._metrics_label = model_label(model.name)
+
+    @staticmethod
+    def _warn_deprecated(method: str, replacement: str):
+        warnings.warn(
+            f"SESARMaterialPredictor.{method} is deprecated, use sesar_rules.SESAR_RULES.{replacement}",
+            DeprecationWarning,
+            stacklevel=3,
+        )
 
     def check_informative(self, text: str, description_map: dict) -> bool:
-        """Checks if the record is informative"""
-        # if record does not have description field
-        #   && no CV words in content
-        #       && only contains sampleType
-        # check descriptive
-        if description_map.get("description", "") == "":
-            descriptive = False
-
-        # check if CV words are in content
-        content_bearing = False
-        for cv in SESARClassifierInput.SESAR_CV_words:
-            if cv in text:
-                content_bearing = True
-                break
-
-        # only contains sampleType field
-        if "sampleType" in description_map and text == description_map["sampleType"]:
-            if not descriptive and not content_bearing:
-                # not informative as all three conditions are satisfied
-                return False
-        return True
+        """Checks if the record is informative.  Deprecated, the rules live in sesar_rules."""
+        self._warn_deprecated("check_informative", "is_informative")
+        return SESAR_RULES.is_informative(text, description_map)
 
     def check_invalid(self, field_to_value: dict) -> bool:
-        """Checks if the record is invalid (not a sample record)"""
-        if field_to_value["igsnPrefix"] != "":
-            for test_igsn in SESARClassifierInput.SESAR_test_igsn:
-                if test_igsn in field_to_value["igsnPrefix"]:
-                    raise TestRecordException(
-                        "Record excluded from indexing due to a known test igsnPrefix"
-                    )
-        if (
-            field_to_value["sampleType"] == "Hole"
-            or field_to_value["sampleType"] == "Site"
-        ):
-            raise SESARSampleTypeException(
-                "Record excluded from indexing due to it being a known ignored sampleType"
-            )
+        """Raises a MetadataException if the record is invalid (not a sample record), returns False otherwise.
+        Deprecated, the rules live in sesar_rules."""
+        self._warn_deprecated("check_invalid", "check_invalid")
+        SESAR_RULES.check_invalid(collections.defaultdict(str, field_to_value))
         return False
 
     def classify_by_sample_type(self, field_to_value: dict) -> Optional[str]:
-        """
-        Use the sampleType field in the SESAR record
-        If falls into any of the rules -> return defined label
-        If it does not -> return None
-        """
-        if (
-            "IODP" in field_to_value["cruiseFieldPrgrm"]
-            or "ODP" in field_to_value["cruiseFieldPrgrm"]
-        ):
-            if "core" in field_to_value["sampleType"].lower():
-                return "Mixed soil, sediment, rock"
-            if field_to_value["sampleType"] == "Individual Sample":
-                return "Sediment or Rock"
-            if "macrofossil" in field_to_value["description"].lower():
-                return "Rock"
-        if "dredge" in field_to_value["sampleType"].lower():
-            return "Natural Solid Material"
-        if (
-            field_to_value["primaryLocationType"] == "wetland"
-            and "core" in field_to_value["sampleType"].lower()
-        ):
-            return "Material"
-        if field_to_value["sampleType"] == "U-channel":
-            return "Sediment"
-        if field_to_value["sampleType"] == "CTP":
-            return "Liquid"
-        if field_to_value["sampleType"] == "Individual Sample>Cylinder":
-            return "Material"
-        # if the record cannot be classified by the defined rules
-        return None
+        """Returns the SESAR source label of the first sampleType rule the record matches, or None if none of them
+        do.  Deprecated, the rules live in sesar_rules."""
+        self._warn_deprecated("classify_by_sample_type", "classify_by_sample_type")
+        return SESAR_RULES.classify_by_sample_type(collections.defaultdict(str, field_to_value))
 
     def classify_by_rule(self, text: str, description_map: dict) -> Optional[str]:
         """Checks if the record can be classified by rule
         If the record corresponds to a rule, returns the rule-defined label
         Else return None
         """
-        # 1. rule-based classification
-        # extract fields that we need to consider for the rules
-        fields_to_check = [
-            "sampleType",
-            "supplementMetadata_cruiseFieldPrgrm",
-            "igsnPrefix",
-            "description",
-            "supplementMetadata_primaryLocationType",
-        ]
-        # build a map that stores the fields that we are interested
-        field_to_value = collections.defaultdict(str)
-        for key, value in description_map.items():
-            if key in fields_to_check:
-                # remove nested label
-                key = key.replace("supplementMetadata_", "")
-                field_to_value[key] = value
-
-        # check if record is invalid
-        # i.e., not a sample
-        if self.check_invalid(field_to_value):
-            return "Invalid"
-        # check if the fields fall into the rules
-        # if it does not, return None
-        result = self.classify_by_sample_type(field_to_value)
-        if result:
-            # map to controlled vocabulary
-            return SESARClassifierInput.source_to_CV[result]
-        else:
-            # check if there is enough information to do classification
-            # give "Material" label
-            if not self.check_informative(text, description_map):
-                return "Material"
-            else:
-                return None
+        return SESAR_RULES.classify(text, description_map)
 
-    @cache
     def classify_by_machine(self, text: str) -> List[Tuple[str, float]]:
         """Returns the machine prediction on the given
         input record
         """
-        predictions = self._model.predict(text)
+        predictions = PREDICTION_CACHE.predict(self._model, text)
         return [
             (SESARClassifierInput.source_to_CV[label], prob)
             for (label, prob) in predictions
         ]
 
+    def classify_by_machine_batch(self, texts: List[str]) -> List[List[Tuple[str, float]]]:
+        """Returns the machine predictions on the given
+        input records, computed in a single forward pass
+        """
+        return [
+            [(SESARClassifierInput.source_to_CV[label], prob) for (label, prob) in predictions]
+            for predictions in PREDICTION_CACHE.predict_batch(self._model, texts)
+        ]
+
+    def _classify_by_rule_pass(self, source_record: dict) -> Tuple[str, Optional[List[PredictionResult]]]:
+        """Returns the model input text of the record, along with the rule-based prediction if one of the rules
+        applies.  Raises a MetadataException if the record should be excluded."""
+        input_string, rule_predictions = sesar_rule_pass(self._metrics_label, source_record)
+        CLASSIFICATIONS.labels(self._metrics_label, "rule" if rule_predictions else "machine").inc()
+        return input_string, rule_predictions
+
     def predict_material_type(self, source_record: dict) -> List[PredictionResult]:
         """
         Invoke the pre-trained BERT model to predict the material type label for the specified string inputs.
@@ -255,83 +409,154 @@ class SESARMaterialPredictor:
         :param source_record the raw source of a record
         :return iSamples CV that corresponds to the label that is the prediction result of the field
         """
-        # extract the data that the model requires for classification
-        sesar_input = SESARClassifierInput(source_record)
-        sesar_input.parse_thing()
-        description_map = sesar_input.get_description_map()
-        # get the input string for prediction
-        input_string = sesar_input.get_material_text()
-        # get the prediction result
-        # first pass : see if the record falls in the defined rules
-        label = self.classify_by_rule(input_string, description_map)
-        if label:
-            # map the label to iSamples CV
-            label = SESARClassifierInput.source_to_CV[label]
-            return [
-                PredictionResult(value=label, confidence=RULE_BASED_CONFIDENCE)
-            ]  # set sentinel value as probability
+        input_string, rule_predictions = self._classify_by_rule_pass(source_record)
+        if rule_predictions:
+            return rule_predictions
         else:
             # second pass : deriving the prediction by machine
             # we pass the text to a pretrained model to get the prediction result
             # predicted label is mapped to iSamples CV
-            machine_predictions = self.classify_by_machine(input_string)
-            return [
-                PredictionResult(value=label, confidence=prob)
-                for label, prob in machine_predictions
-            ]
+            return self._predict_by_machine([input_string], self._classify_by_machine_single)[0]
+
+    def _classify_by_machine_single(self, texts: List[str]) -> List[List[Tuple[str, float]]]:
+        # predicts the texts one at a time, so concurrent requests are merged by the micro batcher
+        return [self.classify_by_machine(text) for text in texts]
+
+    def _predict_by_machine(
+        self, texts: List[str], classify: Callable[[List[str]], List[List[Tuple[str, float]]]]
+    ) -> List[List[PredictionResult]]:
+        return predict_in_stages(self._cascade, texts, classify, SESARClassifierInput.source_to_CV)
+
+    def predict_material_type_batch(self, source_records: List[dict]) -> List[RecordPrediction]:
+        """
+        Batch variant of predict_material_type.  The rule pass runs over every record first, and only the records
+        that aren't classified by rule are sent to the model, in a single forward pass.
+
+        :param source_records the raw sources of the records
+        :return per-record list of predictions, or the MetadataException raised for excluded records
+        """
+        results: List[RecordPrediction] = [[] for _ in source_records]
+        machine_indices = []
+        machine_texts = []
+        for index, source_record in enumerate(source_records):
+            try:
+                input_string, rule_predictions = self._classify_by_rule_pass(source_record)
+            except MetadataException as e:
+                results[index] = e
+                continue
+            if rule_predictions:
+                results[index] = rule_predictions
+            else:
+                machine_indices.append(index)
+                machine_texts.append(input_string)
+        machine_predictions = self._predict_by_machine(machine_texts, self.classify_by_machine_batch)
+        for index, predictions in zip(machine_indices, machine_predictions):
+            results[index] = predictions
+        return results
+
+
+def parse_opencontext_record(metrics_label: str, source_record: dict) -> OpenContextClassifierInput:
+    """Parses the record into the classifier input that both OpenContext predictors build their texts from"""
+    with timed_stage(metrics_label, "parse_thing"):
+        oc_input = OpenContextClassifierInput(source_record)
+        oc_input.parse_thing()
+    return oc_input
 
 
 class OpenContextMaterialPredictor:
     """Material label predictor of OpenContext collection"""
 
-    def __init__(self, model: Optional[Model]):
+    def __init__(self, model: Optional[AnyModel], cascade: Optional[Cascade] = None):
+        """
+        :param model: the BERT model
+        :param cascade: the first stage of the model if it runs in cascade mode
+        """
         if not model:
             raise TypeError("Model is required to be non-None")
         self._model = model
+        self._cascade = cascade
+        self._metrics_label = model_label(model.name)
 
-    @cache
     def classify_by_machine(self, text: str) -> List[Tuple[str, float]]:
         """Returns the machine prediction on the given
         input record
         """
-        predictions = self._model.predict(text)
+        predictions = PREDICTION_CACHE.predict(self._model, text)
         return [(label, prob) for (label, prob) in predictions]
 
+    def classify_by_machine_batch(self, texts: List[str]) -> List[List[Tuple[str, float]]]:
+        """Returns the machine predictions on the given
+        input records, computed in a single forward pass
+        """
+        return [
+            [(label, prob) for (label, prob) in predictions]
+            for predictions in PREDICTION_CACHE.predict_batch(self._model, texts)
+        ]
+
     def predict_material_type(self, source_record: dict) -> List[PredictionResult]:
         """
         Invoke the pre-trained BERT model to predict the material type label for the specified string inputs.
         """
         # extract the data that the model requires for classification
-        oc_input = OpenContextClassifierInput(source_record)
-        oc_input.parse_thing()
+        oc_input = parse_opencontext_record(self._metrics_label, source_record)
+        return self.predict_material_type_for_input(oc_input)
+
+    def predict_material_type_for_input(self, oc_input: OpenContextClassifierInput) -> List[PredictionResult]:
+        """
+        Variant of predict_material_type for a record that has already been parsed
+        """
         # use the description map to assist rule-based classification
-        input_string = oc_input.get_material_text()
+        with timed_stage(self._metrics_label, "build_text"):
+            input_string = oc_input.get_material_text()
         # second pass : deriving the prediction by machine
         # we pass the text to a pretrained model to get the prediction result
         # load the model
-        machine_predictions = self.classify_by_machine(input_string)
-        return [
-            PredictionResult(value=label, confidence=prob)
-            for label, prob in machine_predictions
-        ]
+        return predict_in_stages(self._cascade, [input_string], self._classify_by_machine_single)[0]
+
+    def _classify_by_machine_single(self, texts: List[str]) -> List[List[Tuple[str, float]]]:
+        # predicts the texts one at a time, so concurrent requests are merged by the micro batcher
+        return [self.classify_by_machine(text) for text in texts]
+
+    def predict_material_type_batch(self, source_records: List[dict]) -> List[RecordPrediction]:
+        """
+        Batch variant of predict_material_type, the records are sent to the model in a single forward pass.
+        """
+        # only the texts are needed, so they're extracted without parsing each record into a classifier input
+        with timed_stage(self._metrics_label, "parse_thing"):
+            input_strings = OpenContextClassifierInput.extract_texts(source_records, ("material",))["material"]
+        return list(predict_in_stages(self._cascade, input_strings, self.classify_by_machine_batch))
 
 
 class OpenContextSamplePredictor:
     """Sample label predictor of OpenContext collection"""
 
-    def __init__(self, model: Optional[Model]):
+    def __init__(self, model: Optional[AnyModel], cascade: Optional[Cascade] = None):
+        """
+        :param model: the BERT model
+        :param cascade: the first stage of the model if it runs in cascade mode
+        """
         if not model:
             raise TypeError("Model is required to be non-None")
         self._model = model
+        self._cascade = cascade
+        self._metrics_label = model_label(model.name)
 
-    @cache
     def classify_by_machine(self, text: str) -> List[Tuple[str, float]]:
         """Returns the machine prediction on the given
         input record
         """
-        predictions = self._model.predict(text)
+        predictions = PREDICTION_CACHE.predict(self._model, text)
         return [(label, prob) for (label, prob) in predictions]
 
+    def classify_by_machine_batch(self, texts: List[str]) -> List[List[Tuple[str, float]]]:
+        """Returns the machine predictions on the given
+        input records, computed in a single forward pass
+        """
+        return [
+            [(label, prob) for (label, prob) in predictions]
+            for predictions in PREDICTION_CACHE.predict_batch(self._model, texts)
+        ]
+
     def predict_sample_type(self, source_record: dict) -> List[PredictionResult]:
         """
         Invoke the pre-trained BERT model to predict the sample type label for the specified string inputs.
@@ -340,14 +565,29 @@ class OpenContextSamplePredictor:
         :return string label that is the prediction result of the field
         """
         # extract the data that the model requires for classification
-        oc_input = OpenContextClassifierInput(source_record)
-        oc_input.parse_thing()
-        input_string = oc_input.get_sample_text()
+        oc_input = parse_opencontext_record(self._metrics_label, source_record)
+        return self.predict_sample_type_for_input(oc_input)
+
+    def predict_sample_type_for_input(self, oc_input: OpenContextClassifierInput) -> List[PredictionResult]:
+        """
+        Variant of predict_sample_type for a record that has already been parsed
+        """
+        with timed_stage(self._metrics_label, "build_text"):
+            input_string = oc_input.get_sample_text()
         # deriving the prediction by machine
         # we pass the text to a pretrained model to get the prediction result
         # load the model
-        machine_predictions = self.classify_by_machine(input_string)
-        return [
-            PredictionResult(value=label, confidence=prob)
-            for label, prob in machine_predictions
-        ]
+        return predict_in_stages(self._cascade, [input_string], self._classify_by_machine_single)[0]
+
+    def _classify_by_machine_single(self, texts: List[str]) -> List[List[Tuple[str, float]]]:
+        # predicts the texts one at a time, so concurrent requests are merged by the micro batcher
+        return [self.classify_by_machine(text) for text in texts]
+
+    def predict_sample_type_batch(self, source_records: List[dict]) -> List[RecordPrediction]:
+        """
+        Batch variant of predict_sample_type, the records are sent to the model in a single forward pass.
+        """
+        # only the texts are needed, so they're extracted without parsing each record into a classifier input
+        with timed_stage(self._metrics_label, "parse_thing"):
+            input_strings = OpenContextClassifierInput.extract_texts(source_records, ("sample",))["sample"]
+        return list(predict_in_stages(self._cascade, input_strings, self.classify_by_machine_batch))
@@ -0,0 +1,125 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from isamples_metadata.metadata_exceptions import MetadataException
+
+# the per-record stages are far quicker than the default buckets resolve
+_STAGE_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+_TOKEN_BUCKETS = (8, 16, 32, 64, 96, 128, 192, 256, 384, 512)
+
+REQUEST_SECONDS = Histogram(
+    "isamples_request_seconds",
+    "Time to serve a prediction request, including the time queued for the model",
+    ["model", "endpoint"],
+    buckets=_STAGE_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "isamples_prediction_stage_seconds",
+    "Time spent in each stage of a prediction: parse_thing, build_text, rules, first_stage, tokenization, forward "
+    "and postprocessing.  The model stages, first_stage, and parse_thing of the OpenContext batches, are observed "
+    "once per batch.",
+    ["model", "stage"],
+    buckets=_STAGE_BUCKETS,
+)
+CLASSIFICATIONS = Counter(
+    "isamples_classifications",
+    "Records classified, by whether a rule or the model assigned the label",
+    ["model", "method"],
+)
+CACHE_LOOKUPS = Counter(
+    "isamples_cache_lookups",
+    "Lookups in the prediction caches (memory, persistent) and the token ids cache (tokenization)",
+    ["model", "cache", "result"],
+)
+CASCADE_DECISIONS = Counter(
+    "isamples_cascade_decisions",
+    "Texts of the models in cascade mode, by whether the first stage answered or they were escalated to BERT",
+    ["model", "decision"],
+)
+MODEL_INPUTS = Counter(
+    "isamples_model_inputs",
+    "Texts of the batches sent to the model, by whether they were unique within their batch or a duplicate that "
+    "shares the prediction of an identical text",
+    ["model", "input"],
+)
+INPUT_TOKENS = Histogram(
+    "isamples_input_tokens",
+    "Token count of the model inputs, after truncation",
+    ["model"],
+    buckets=_TOKEN_BUCKETS,
+)
+TRUNCATED_INPUTS = Counter(
+    "isamples_truncated_inputs",
+    "Model inputs that filled MAX_SEQUENCE_LEN, i.e. were cut off or only just fit",
+    ["model"],
+)
+METADATA_EXCEPTIONS = Counter(
+    "isamples_metadata_exceptions",
+    "Records excluded from classification, by MetadataException subclass",
+    ["model", "exception"],
+)
+
+
+def model_label(name: str) -> str:
+    """Returns the metrics label of a model, e.g. sesar_material for the SESAR-material model"""
+    return name.lower().replace("-", "_")
+
+
+@contextmanager
+def timed_stage(model: str, stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(model, stage).observe(time.perf_counter() - start)
+
+
+@contextmanager
+def observe_request(model: str, endpoint: str) -> Iterator[None]:
+    """Observes the latency of the request, and counts the MetadataException it raises if the record is excluded"""
+    start = time.perf_counter()
+    try:
+        yield
+    except MetadataException as e:
+        METADATA_EXCEPTIONS.labels(model, e.__class__.__name__).inc()
+        raise
+    finally:
+        REQUEST_SECONDS.labels(model, endpoint).observe(time.perf_counter() - start)
+
+
+def count_cache_lookups(model: str, cache: str, hits: int, misses: int):
+    if hits > 0:
+        CACHE_LOOKUPS.labels(model, cache, "hit").inc(hits)
+    if misses > 0:
+        CACHE_LOOKUPS.labels(model, cache, "miss").inc(misses)
+
+
+def count_model_inputs(model: str, unique: int, duplicates: int):
+    if unique > 0:
+        MODEL_INPUTS.labels(model, "unique").inc(unique)
+    if duplicates > 0:
+        MODEL_INPUTS.labels(model, "duplicate").inc(duplicates)
+
+
+def metrics_exposition() -> tuple:
+    """Returns the metrics in the Prometheus text format, along with its content type.  If PROMETHEUS_MULTIPROC_DIR
+    is set, the metrics are aggregated over all the worker processes."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,118 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+from isamples_metadata.taxonomy import config
+from isamples_metadata.taxonomy.isamplesfasttext import get_smithsonian_feature_predictor
+from isamples_metadata.taxonomy.metadata_models import AnyModel, MetadataModelLoader
+
+# The models a worker serves, by name, along with the getter that loads each one on first use
+MODEL_LOADERS: Dict[str, Callable[[], object]] = {
+    "OPENCONTEXT-sample": MetadataModelLoader.get_oc_sample_model,
+    "OPENCONTEXT-material": MetadataModelLoader.get_oc_material_model,
+    "SESAR-material": MetadataModelLoader.get_sesar_material_model,
+    "Smithsonian": get_smithsonian_feature_predictor,
+}
+
+
+def parse_batch_sizes(batch_sizes: str) -> List[int]:
+    """Parses comma-separated batch sizes, e.g. "1,16,64" """
+    return [int(batch_size) for batch_size in batch_sizes.split(",") if batch_size.strip()]
+
+
+def _timed_load(name: str, loader: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    loader()
+    seconds = time.perf_counter() - start
+    logging.info("Loaded the %s model in %.2f seconds", name, seconds)
+    return seconds
+
+
+def load_models(loaders: Optional[Dict[str, Callable[[], object]]] = None) -> Dict[str, float]:
+    """
+    Loads the models concurrently, a thread per model.  Most of the loading time is spent reading the weights and in
+    torch's native code, which release the GIL.
+
+    :return: dict of model name to the seconds it took to load
+    """
+    loaders = loaders if loaders is not None else MODEL_LOADERS
+    with ThreadPoolExecutor(max_workers=len(loaders), thread_name_prefix="model-loader") as pool:
+        futures = {name: pool.submit(_timed_load, name, loader) for name, loader in loaders.items()}
+        # re-raises the exception of a model that failed to load
+        return {name: future.result() for name, future in futures.items()}
+
+
+def warm_up_model(model: AnyModel, batch_sizes: Sequence[int]) -> float:
+    """Warms up the model at each of the batch sizes and returns the seconds it took"""
+    start = time.perf_counter()
+    model.warm_up(batch_sizes)
+    seconds = time.perf_counter() - start
+    logging.info("Warmed up the %s model at batch sizes %s in %.2f seconds", model.name, list(batch_sizes), seconds)
+    return seconds
+
+
+class ModelStartup:
+    """Loads and warms up the models on a background thread, and reports whether that's done.
+
+    The worker accepts requests in the meantime, so /health/live answers right away and /health/ready tells a load
+    balancer or orchestrator when to start routing traffic to it.  Predictions that arrive early load the model they
+    need themselves, or wait for the startup thread to finish loading it.
+    """
+
+    STARTING = "starting"
+    LOADING = "loading"
+    WARMING_UP = "warming_up"
+    READY = "ready"
+    FAILED = "failed"
+
+    def __init__(self, loaders: Optional[Dict[str, Callable[[], object]]] = None):
+        self._loaders = loaders
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.state = ModelStartup.STARTING
+        self.error: Optional[str] = None
+        self.load_seconds: Dict[str, float] = {}
+        self.warmup_seconds: Dict[str, float] = {}
+
+    def start(self):
+        """Starts the startup thread, if it hasn't been started yet"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name="model-startup", daemon=True)
+                self._thread.start()
+
+    def join(self, timeout: Optional[float] = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        try:
+            self.state = ModelStartup.LOADING
+            self.load_seconds = load_models(self._loaders)
+            self.state = ModelStartup.WARMING_UP
+            batch_sizes = parse_batch_sizes(config.Settings().warmup_batch_sizes)
+            if len(batch_sizes) > 0:
+                for model in MetadataModelLoader.loaded_models():
+                    self.warmup_seconds[model.name] = warm_up_model(model, batch_sizes)
+            self.state = ModelStartup.READY
+            logging.info("The models are ready")
+        except Exception as e:
+            logging.exception("Model startup failed")
+            self.error = f"{e.__class__.__name__}: {e}"
+            self.state = ModelStartup.FAILED
+
+    def is_ready(self) -> bool:
+        return self.state == ModelStartup.READY
+
+    def status(self) -> Dict[str, Union[str, Dict[str, float], None]]:
+        return {
+            "status": self.state,
+            "error": self.error,
+            "load_seconds": dict(self.load_seconds),
+            "warmup_seconds": dict(self.warmup_seconds),
+        }
+
+
+MODEL_STARTUP = ModelStartup()
@@ -0,0 +1,280 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, cast
+
+from isamples_metadata.taxonomy import config
+from isamples_metadata.taxonomy.bounded_cache import BoundedCache
+from isamples_metadata.taxonomy.metrics import count_cache_lookups, model_label
+
+
+class PersistentPredictionCache:
+    """SQLite-backed prediction cache that is shared by all the worker processes and survives restarts.
+
+    Entries are keyed by the model fingerprint and a hash of the input text.  Registering a model under a new
+    fingerprint deletes the entries stored under its previous fingerprint.  The oldest entries are pruned once the
+    table holds more than max_rows entries, and entries expire ttl_seconds after they were stored.  A max_rows of 0
+    disables the row limit, and a ttl_seconds of 0 disables expiry.
+    """
+
+    # the writes prune the table at most this often, so it may briefly exceed max_rows
+    PRUNE_INTERVAL_SECONDS = 60.0
+    PRUNE_INTERVAL_ROWS = 10000
+
+    def __init__(self, path: str, max_rows: int = 0, ttl_seconds: float = 0):
+        self.path = path
+        self.max_rows = max_rows
+        self.ttl_seconds = ttl_seconds
+        # sqlite connections can't be shared between threads, so each thread opens its own
+        self._local = threading.local()
+        self._registered_fingerprints: set = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.pruned = 0
+        self._last_prune = time.monotonic()
+        self._rows_since_prune = 0
+        # the schema is created on a throwaway connection, so no open connection is inherited by forked workers
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS models (name TEXT PRIMARY KEY, fingerprint TEXT NOT NULL)"
+                )
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS predictions (fingerprint TEXT NOT NULL, text_hash TEXT NOT NULL, "
+                    "predictions TEXT NOT NULL, created_at REAL NOT NULL DEFAULT 0, "
+                    "PRIMARY KEY (fingerprint, text_hash))"
+                )
+                columns = [row[1] for row in connection.execute("PRAGMA table_info(predictions)")]
+                if "created_at" not in columns:
+                    # a database created before the entries were timestamped, whose entries count as the oldest
+                    connection.execute("ALTER TABLE predictions ADD COLUMN created_at REAL NOT NULL DEFAULT 0")
+                connection.execute("CREATE INDEX IF NOT EXISTS predictions_created_at ON predictions (created_at)")
+        finally:
+            connection.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30)
+        # write-ahead logging lets the workers read while another one is writing
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        # connections must not be used across a fork, so forked workers open their own
+        if connection is None or self._local.pid != os.getpid():
+            connection = self._connect()
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @staticmethod
+    def _text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def register_model(self, name: str, fingerprint: str):
+        """Records the fingerprint of the named model, invalidating the entries of a previous fingerprint"""
+        with self._lock:
+            if fingerprint in self._registered_fingerprints:
+                return
+            self._registered_fingerprints.add(fingerprint)
+        with self._connection() as connection:
+            row = connection.execute("SELECT fingerprint FROM models WHERE name = ?", (name,)).fetchone()
+            if row is not None and row[0] != fingerprint:
+                logging.info("Model %s changed, invalidating its persistent prediction cache entries", name)
+                connection.execute("DELETE FROM predictions WHERE fingerprint = ?", (row[0],))
+            connection.execute("INSERT OR REPLACE INTO models (name, fingerprint) VALUES (?, ?)", (name, fingerprint))
+
+    def get_many(self, fingerprint: str, texts: List[str]) -> Dict[str, List]:
+        """Returns the cached predictions of the texts that have them, keyed by text"""
+        text_hashes = {self._text_hash(text): text for text in texts}
+        results = {}
+        hash_list = list(text_hashes)
+        # entries that expired since the last prune are ignored
+        created_after = time.time() - self.ttl_seconds if self.ttl_seconds > 0 else 0
+        # stay under sqlite's limit on the number of query parameters
+        for start in range(0, len(hash_list), 500):
+            chunk = hash_list[start:start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = self._connection().execute(
+                "SELECT text_hash, predictions FROM predictions "
+                f"WHERE fingerprint = ? AND created_at >= ? AND text_hash IN ({placeholders})",
+                [fingerprint, created_after, *chunk],
+            ).fetchall()
+            for text_hash, predictions in rows:
+                results[text_hashes[text_hash]] = [tuple(prediction) for prediction in json.loads(predictions)]
+        with self._lock:
+            self.hits += len(results)
+            self.misses += len(text_hashes) - len(results)
+        return results
+
+    def put_many(self, fingerprint: str, text_predictions: List[Tuple[str, List]]):
+        created_at = time.time()
+        with self._connection() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO predictions (fingerprint, text_hash, predictions, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (fingerprint, self._text_hash(text), json.dumps(predictions), created_at)
+                    for text, predictions in text_predictions
+                ],
+            )
+        if self._prune_due(len(text_predictions)):
+            self.prune()
+
+    def _prune_due(self, written_rows: int) -> bool:
+        if self.max_rows <= 0 and self.ttl_seconds <= 0:
+            return False
+        with self._lock:
+            self._rows_since_prune += written_rows
+            if (
+                self._rows_since_prune < self.PRUNE_INTERVAL_ROWS
+                and time.monotonic() - self._last_prune < self.PRUNE_INTERVAL_SECONDS
+            ):
+                return False
+            self._rows_since_prune = 0
+            self._last_prune = time.monotonic()
+            return True
+
+    def prune(self):
+        """Deletes the expired entries, and the oldest entries beyond max_rows"""
+        pruned = 0
+        with self._connection() as connection:
+            if self.ttl_seconds > 0:
+                pruned += connection.execute(
+                    "DELETE FROM predictions WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+                ).rowcount
+            if self.max_rows > 0:
+                excess_rows = connection.execute("SELECT COUNT(*) FROM predictions").fetchone()[0] - self.max_rows
+                if excess_rows > 0:
+                    pruned += connection.execute(
+                        "DELETE FROM predictions WHERE rowid IN "
+                        "(SELECT rowid FROM predictions ORDER BY created_at LIMIT ?)",
+                        (excess_rows,),
+                    ).rowcount
+        with self._lock:
+            self.pruned += pruned
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "path": self.path,
+                "hits": self.hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "pruned": self.pruned,
+            }
+
+
+class PredictionCache(BoundedCache):
+    """Process-wide LRU cache of model predictions, keyed by (model identity, input text).
+
+    Misses fall through to the optional persistent tier before reaching the model.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float, persistent: Optional[PersistentPredictionCache] = None):
+        super().__init__(max_size, ttl_seconds)
+        self.persistent = persistent
+
+    def _persistent_get_many(self, model, texts: List[str]) -> Dict[str, List]:
+        if self.persistent is None or len(texts) == 0:
+            return {}
+        try:
+            self.persistent.register_model(model.name, model.fingerprint)
+            results = self.persistent.get_many(model.fingerprint, texts)
+            count_cache_lookups(model_label(model.name), "persistent", len(results), len(texts) - len(results))
+            return results
+        except sqlite3.Error:
+            # the persistent tier is an optimization, don't fail the prediction over it
+            logging.exception("Unable to read from the persistent prediction cache")
+            self.persistent.record_error()
+            return {}
+
+    def _persistent_put_many(self, model, text_predictions: List[Tuple[str, List]]):
+        if self.persistent is None or len(text_predictions) == 0:
+            return
+        try:
+            self.persistent.put_many(model.fingerprint, text_predictions)
+        except sqlite3.Error:
+            logging.exception("Unable to write to the persistent prediction cache")
+            self.persistent.record_error()
+
+    def predict(self, model, text: str) -> List:
+        """Returns model.predict(text), consulting the caches first"""
+        key = (model.identity, text)
+        predictions = self.get(key)
+        count_cache_lookups(model_label(model.name), "memory", int(predictions is not None), int(predictions is None))
+        if predictions is None:
+            predictions = self._persistent_get_many(model, [text]).get(text)
+            if predictions is None:
+                predictions = model.predict(text)
+                self._persistent_put_many(model, [(text, predictions)])
+            self.put(key, predictions)
+        return predictions
+
+    def predict_batch(self, model, texts: List[str]) -> List[List]:
+        """Returns model.predict_batch(texts), only sending the texts that aren't cached to the model"""
+        results: List[Optional[List]] = [self.get((model.identity, text)) for text in texts]
+        missing_indices = [index for index, result in enumerate(results) if result is None]
+        count_cache_lookups(model_label(model.name), "memory", len(texts) - len(missing_indices), len(missing_indices))
+        persistent_results = self._persistent_get_many(model, [texts[index] for index in missing_indices])
+        model_indices = []
+        for index in missing_indices:
+            predictions = persistent_results.get(texts[index])
+            if predictions is None:
+                model_indices.append(index)
+            else:
+                results[index] = predictions
+                self.put((model.identity, texts[index]), predictions)
+        if len(model_indices) > 0:
+            model_predictions = model.predict_batch([texts[index] for index in model_indices])
+            for index, predictions in zip(model_indices, model_predictions):
+                results[index] = predictions
+                self.put((model.identity, texts[index]), predictions)
+            self._persistent_put_many(
+                model, [(texts[index], predictions) for index, predictions in zip(model_indices, model_predictions)]
+            )
+        return cast(List[List], results)
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["persistent"] = self.persistent.stats() if self.persistent is not None else None
+        return stats
+
+
+def _persistent_prediction_cache(
+    path: str, max_rows: int, ttl_seconds: float
+) -> Optional[PersistentPredictionCache]:
+    if not path:
+        return None
+    try:
+        return PersistentPredictionCache(path, max_rows, ttl_seconds)
+    except sqlite3.Error:
+        logging.error(
+            "Unable to open the persistent prediction cache at path %s.  Only the in-memory cache will be used.",
+            path,
+        )
+        return None
+
+
+_SETTINGS = config.Settings()
+PREDICTION_CACHE = PredictionCache(
+    _SETTINGS.prediction_cache_max_size,
+    _SETTINGS.prediction_cache_ttl_seconds,
+    _persistent_prediction_cache(
+        _SETTINGS.persistent_prediction_cache_path,
+        _SETTINGS.persistent_prediction_cache_max_rows,
+        _SETTINGS.persistent_prediction_cache_ttl_seconds,
+    ),
+)
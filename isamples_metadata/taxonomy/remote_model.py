@@ -0,0 +1,192 @@
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+import uuid
+from typing import Any, Optional, Sequence
+
+from isamples_metadata.taxonomy.batching import deduplicate
+from isamples_metadata.taxonomy.metrics import count_model_inputs, model_label
+
+# every frame is a 4 byte big-endian length followed by that many bytes of UTF-8 JSON
+_FRAME_HEADER = struct.Struct(">I")
+# the bounds of the exponential backoff between the warm-up's attempts to connect
+_CONNECT_RETRY_SECONDS = 0.1
+_MAX_CONNECT_RETRY_SECONDS = 5.0
+
+
+class RemoteInferenceException(Exception):
+    """Raised when an inference worker process fails to run a prediction"""
+
+
+def send_frame(connection: socket.socket, message: Any):
+    payload = json.dumps(message, separators=(",", ":")).encode("utf-8")
+    connection.sendall(_FRAME_HEADER.pack(len(payload)) + payload)
+
+
+def _recv_exactly(connection: socket.socket, size: int) -> Optional[bytes]:
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = connection.recv(size - len(buffer))
+        if not chunk:
+            return None
+        buffer.extend(chunk)
+    return bytes(buffer)
+
+
+def recv_frame(connection: socket.socket) -> Optional[Any]:
+    """Returns the next message, or None if the peer closed the connection"""
+    header = _recv_exactly(connection, _FRAME_HEADER.size)
+    if header is None:
+        return None
+    payload = _recv_exactly(connection, _FRAME_HEADER.unpack(header)[0])
+    if payload is None:
+        return None
+    return json.loads(payload)
+
+
+class RemoteModel:
+    """Stands in for a Model whose forward passes run in the inference worker processes.
+
+    The request handlers keep building the classifier text, and only the texts are sent to the workers over a Unix
+    domain socket, as compact JSON frames rather than pickles.  The predictions come back the same way.  Each thread
+    keeps its own connection, and the workers share one listening socket, so the kernel spreads the connections over
+    them.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        socket_path: str,
+        fingerprint: str,
+        connect_timeout_seconds: float = 300.0,
+        request_timeout_seconds: float = 60.0,
+    ):
+        """
+        :param name: the name of the model in the inference workers
+        :param socket_path: the path of the inference workers' Unix domain socket
+        :param fingerprint: the fingerprint of the model's config, that keys its entries in the prediction cache
+        :param connect_timeout_seconds: how long the warm-up keeps retrying to connect while the workers start up
+        :param request_timeout_seconds: how long a prediction waits for the worker before giving up on it
+        """
+        self.name = name
+        self.socket_path = socket_path
+        self.fingerprint = fingerprint
+        self.connect_timeout_seconds = connect_timeout_seconds
+        self.request_timeout_seconds = request_timeout_seconds
+        # distinguishes this model's entries in the shared prediction cache
+        self.identity = uuid.uuid4().hex
+        # connections must not be used across a fork, so forked workers open their own
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "texts": 0, "duplicate_texts": 0, "round_trip_seconds": 0.0, "errors": 0}
+
+    def _connection(self) -> socket.socket:
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            # a hung worker must not hold the calling executor thread forever
+            connection.settimeout(self.request_timeout_seconds)
+            try:
+                connection.connect(self.socket_path)
+            except OSError:
+                connection.close()
+                raise
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _close_connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def predict(self, text):
+        return self.predict_batch([text])[0]
+
+    def predict_batch(self, texts):
+        """Returns the top 3 (label, probability) predictions for each of the texts.  Identical texts are only sent
+        once, and share the predictions."""
+        if len(texts) == 0:
+            return []
+        start = time.perf_counter()
+        unique_texts, positions = deduplicate(texts)
+        duplicate_count = len(texts) - len(unique_texts)
+        count_model_inputs(model_label(self.name), len(unique_texts), duplicate_count)
+        try:
+            connection = self._connection()
+            send_frame(connection, {"model": self.name, "texts": unique_texts})
+            response = recv_frame(connection)
+        except socket.timeout:
+            # a late response would be read as the answer to the next request, so the connection is dropped
+            self._close_connection()
+            self._record(len(unique_texts), duplicate_count, time.perf_counter() - start, error=True)
+            raise RemoteInferenceException(
+                f"The inference worker didn't answer within {self.request_timeout_seconds} seconds while predicting "
+                f"{self.name}"
+            )
+        except OSError:
+            # the worker may have restarted, reconnect on the next call
+            self._close_connection()
+            self._record(len(unique_texts), duplicate_count, time.perf_counter() - start, error=True)
+            raise
+        if response is None:
+            self._close_connection()
+            self._record(len(unique_texts), duplicate_count, time.perf_counter() - start, error=True)
+            raise RemoteInferenceException(f"The inference worker closed the connection while predicting {self.name}")
+        self._record(len(unique_texts), duplicate_count, time.perf_counter() - start, error="error" in response)
+        if "error" in response:
+            raise RemoteInferenceException(response["error"])
+        predictions = [[(label, prob) for label, prob in predictions] for predictions in response["predictions"]]
+        return [predictions[position] for position in positions]
+
+    def _wait_for_workers(self):
+        # the inference workers are started at the same time as this process, so their socket may not exist yet, or
+        # may be left over from a previous run until they bind it again
+        deadline = time.monotonic() + self.connect_timeout_seconds
+        delay = _CONNECT_RETRY_SECONDS
+        while True:
+            try:
+                connection = self._connection()
+                # the workers only answer once their models are warm, which may take longer than a prediction
+                connection.settimeout(max(deadline - time.monotonic(), self.request_timeout_seconds))
+                return
+            except (FileNotFoundError, ConnectionRefusedError) as e:
+                if time.monotonic() + delay > deadline:
+                    raise
+                logging.info("Waiting for the inference workers at %s: %s", self.socket_path, e)
+                time.sleep(delay)
+                delay = min(delay * 2, _MAX_CONNECT_RETRY_SECONDS)
+
+    def warm_up(self, batch_sizes: Sequence[int]):
+        """The inference workers warm up their own models, so this only waits until they accept a connection and
+        then serve a prediction, which they do once their models are warm"""
+        try:
+            self._wait_for_workers()
+            self.predict_batch(["warm up"])
+        finally:
+            # the warm-up thread won't make any more calls
+            self._close_connection()
+
+    def _record(self, text_count: int, duplicate_count: int, round_trip_seconds: float, error: bool):
+        with self._stats_lock:
+            self._stats["requests"] += 1
+            self._stats["texts"] += text_count
+            self._stats["duplicate_texts"] += duplicate_count
+            self._stats["round_trip_seconds"] += round_trip_seconds
+            if error:
+                self._stats["errors"] += 1
+
+    def stats(self) -> dict:
+        """Returns the cumulative number of requests sent to the inference workers and their round trip time, and the
+        fraction of the texts that were duplicates within their batch"""
+        with self._stats_lock:
+            stats: dict = dict(self._stats)
+        total_texts = stats["texts"] + stats["duplicate_texts"]
+        stats["dedup_ratio"] = stats["duplicate_texts"] / total_texts if total_texts > 0 else 0.0
+        stats["socket_path"] = self.socket_path
+        return stats
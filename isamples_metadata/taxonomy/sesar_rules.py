@@ -0,0 +1,157 @@
+"""
+The rules that label SESAR records without the model, as a declarative table that's compiled once into lookup
+structures: the rules that apply to a record are looked up by its exact sampleType, and the substring tests against
+the test IGSN prefixes and the controlled vocabulary words go through precompiled pattern sets.
+"""
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+from isamples_metadata.metadata_exceptions import SESARSampleTypeException, TestRecordException
+from isamples_metadata.taxonomy.SESARClassifierInput import SESARClassifierInput
+
+
+class MultiPatternMatcher:
+    """Tests a text against a fixed set of substrings at once.
+
+    The set is compiled when the matcher is created: duplicates are dropped, and so are the patterns that contain
+    another pattern, since they can't occur without it.  The remaining patterns are searched for with CPython's
+    native substring search, which is faster than an Aho-Corasick automaton run in Python for pattern sets and texts
+    of the sizes the rules use.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns = tuple(dict.fromkeys(patterns))
+        self._minimal_patterns = tuple(
+            pattern for pattern in self.patterns
+            if not any(other != pattern and other in pattern for other in self.patterns)
+        )
+
+    def contains_any(self, text: str) -> bool:
+        """Returns whether any of the patterns occurs in the text"""
+        for pattern in self._minimal_patterns:
+            if pattern in text:
+                return True
+        return False
+
+
+@dataclass(frozen=True)
+class SampleTypeRule:
+    """Labels the records that satisfy all of the rule's conditions, the conditions left as None don't apply"""
+
+    label: str
+    # the sampleType equals this
+    sample_type: Optional[str] = None
+    # the lowercased sampleType contains this
+    sample_type_contains: Optional[str] = None
+    # the cruiseFieldPrgrm contains this
+    cruise_contains: Optional[str] = None
+    # the primaryLocationType equals this
+    location_type: Optional[str] = None
+    # the lowercased description contains this
+    description_contains: Optional[str] = None
+
+    def matches(self, fields: Dict[str, str], lowered_sample_type: str) -> bool:
+        if self.sample_type is not None and fields["sampleType"] != self.sample_type:
+            return False
+        if self.sample_type_contains is not None and self.sample_type_contains not in lowered_sample_type:
+            return False
+        if self.cruise_contains is not None and self.cruise_contains not in fields["cruiseFieldPrgrm"]:
+            return False
+        if self.location_type is not None and fields["primaryLocationType"] != self.location_type:
+            return False
+        if self.description_contains is not None and self.description_contains not in fields["description"].lower():
+            return False
+        return True
+
+
+# The rules in order of precedence, the first one that matches labels the record with a SESAR source label.  "ODP"
+# also matches the IODP cruises.
+SAMPLE_TYPE_RULES = (
+    SampleTypeRule("Mixed soil, sediment, rock", cruise_contains="ODP", sample_type_contains="core"),
+    SampleTypeRule("Sediment or Rock", cruise_contains="ODP", sample_type="Individual Sample"),
+    SampleTypeRule("Rock", cruise_contains="ODP", description_contains="macrofossil"),
+    SampleTypeRule("Natural Solid Material", sample_type_contains="dredge"),
+    SampleTypeRule("Material", location_type="wetland", sample_type_contains="core"),
+    SampleTypeRule("Sediment", sample_type="U-channel"),
+    SampleTypeRule("Liquid", sample_type="CTP"),
+    SampleTypeRule("Material", sample_type="Individual Sample>Cylinder"),
+)
+# records of these sample types aren't samples, and are excluded from indexing
+EXCLUDED_SAMPLE_TYPES = frozenset(["Hole", "Site"])
+# the label of records that carry no more information than their sampleType
+UNINFORMATIVE_LABEL = "Material"
+
+# the description map keys of the fields the rules read, by the name the rules use
+_RULE_FIELDS = (
+    ("sampleType", "sampleType"),
+    ("cruiseFieldPrgrm", "supplementMetadata_cruiseFieldPrgrm"),
+    ("igsnPrefix", "igsnPrefix"),
+    ("description", "description"),
+    ("primaryLocationType", "supplementMetadata_primaryLocationType"),
+)
+
+
+class SESARRules:
+    """The compiled rule table"""
+
+    def __init__(
+        self,
+        sample_type_rules: Iterable[SampleTypeRule] = SAMPLE_TYPE_RULES,
+        test_igsn_prefixes: Iterable[str] = SESARClassifierInput.SESAR_test_igsn,
+        cv_words: Iterable[str] = SESARClassifierInput.SESAR_CV_words,
+    ):
+        rules = tuple(sample_type_rules)
+        # the rules that can match a record, in order of precedence, looked up by the record's sampleType: the rules
+        # without a sampleType condition, plus the ones whose sampleType condition it satisfies
+        self._general_rules = tuple(rule for rule in rules if rule.sample_type is None)
+        self._rules_by_sample_type: Dict[str, Tuple[SampleTypeRule, ...]] = {
+            sample_type: tuple(rule for rule in rules if rule.sample_type in (None, sample_type))
+            for sample_type in {rule.sample_type for rule in rules if rule.sample_type is not None}
+        }
+        self._test_igsn_matcher = MultiPatternMatcher(test_igsn_prefixes)
+        self._cv_word_matcher = MultiPatternMatcher(cv_words)
+
+    @staticmethod
+    def rule_fields(description_map: dict) -> Dict[str, str]:
+        """Returns the fields of the description map that the rules read, empty if the record doesn't have them"""
+        return {name: description_map.get(key, "") for name, key in _RULE_FIELDS}
+
+    def check_invalid(self, fields: Dict[str, str]):
+        """Raises a MetadataException if the record is invalid (not a sample record)"""
+        if fields["igsnPrefix"] != "" and self._test_igsn_matcher.contains_any(fields["igsnPrefix"]):
+            raise TestRecordException("Record excluded from indexing due to a known test igsnPrefix")
+        if fields["sampleType"] in EXCLUDED_SAMPLE_TYPES:
+            raise SESARSampleTypeException("Record excluded from indexing due to it being a known ignored sampleType")
+
+    def classify_by_sample_type(self, fields: Dict[str, str]) -> Optional[str]:
+        """Returns the SESAR source label of the first rule the record matches, or None if none of them do"""
+        lowered_sample_type = fields["sampleType"].lower()
+        for rule in self._rules_by_sample_type.get(fields["sampleType"], self._general_rules):
+            if rule.matches(fields, lowered_sample_type):
+                return rule.label
+        return None
+
+    def is_informative(self, text: str, description_map: dict) -> bool:
+        """Returns False if the record has no description, no controlled vocabulary words, and its text is nothing
+        but its sampleType"""
+        if "sampleType" not in description_map or text != description_map["sampleType"]:
+            return True
+        return description_map.get("description", "") != "" or self._cv_word_matcher.contains_any(text)
+
+    def classify(self, text: str, description_map: dict) -> Optional[str]:
+        """
+        Returns the iSamples CV label of the record if one of the rules applies to it, or None if the model has to
+        classify it.  Raises a MetadataException if the record should be excluded.
+        """
+        fields = self.rule_fields(description_map)
+        self.check_invalid(fields)
+        label = self.classify_by_sample_type(fields)
+        if label is None and not self.is_informative(text, description_map):
+            label = UNINFORMATIVE_LABEL
+        if label is None:
+            return None
+        # map to controlled vocabulary
+        return SESARClassifierInput.source_to_CV[label]
+
+
+SESAR_RULES = SESARRules()
@@ -1,3 +1,16 @@
 #!/bin/bash
 export PYTHONPATH=/app
-uvicorn main:app --host 0.0.0.0 --port 9000 --workers 4
\ No newline at end of file
+if [ -n "${PROMETHEUS_MULTIPROC_DIR:-}" ]; then
+  # /metrics aggregates the metrics the workers write here, clear out the previous run's
+  rm -rf "${PROMETHEUS_MULTIPROC_DIR}" && mkdir -p "${PROMETHEUS_MULTIPROC_DIR}"
+fi
+if [ "${INFERENCE_WORKERS:-0}" -gt 0 ]; then
+  # Run the models in dedicated core-pinned processes, the HTTP workers send them the texts to classify
+  python -m isamples_metadata.taxonomy.inference_workers &
+fi
+if [ "${PRELOAD_MODELS:-false}" = "true" ]; then
+  # Load the models once in the gunicorn master so the forked workers share them copy-on-write
+  exec gunicorn main:app --preload --bind 0.0.0.0:9000 --workers 4 --worker-class uvicorn.workers.UvicornWorker
+else
+  uvicorn main:app --host 0.0.0.0 --port 9000 --workers 4
+fi
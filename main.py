@@ -1,6 +1,8 @@
+import asyncio
 import faulthandler
+import gc
 import json
-from typing import Type
+from typing import Type, Optional, Union, Callable, AsyncIterator, Sequence, Any
 
 import fastapi
 import logging
@@ -9,25 +11,46 @@ import traceback
 
 import uvicorn
 from fastapi import HTTPException, Depends
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, ValidationError
 from starlette.requests import Request
-from starlette.responses import PlainTextResponse
+from starlette.responses import PlainTextResponse, StreamingResponse, Response
+from starlette.types import Scope, Receive, Send
 
 from enums import ISBModelType
+from isamples_metadata.http_compression import CompressionMiddleware
 from isamples_metadata.metadata_exceptions import SESARSampleTypeException, TestRecordException, MetadataException
-from isamples_metadata.taxonomy.isamplesfasttext import SMITHSONIAN_FEATURE_PREDICTOR
+from isamples_metadata.process_memory import process_memory
+from isamples_metadata.response_encoding import ResponseEncoding, negotiate_encoding
+from isamples_metadata.taxonomy import config
+from isamples_metadata.taxonomy.inference_executor import (
+    InferenceExecutor,
+    InferenceQueueFullException,
+    get_inference_executor,
+    inference_executor_stats,
+)
+from isamples_metadata.taxonomy.isamplesfasttext import MAX_TOP_K, get_smithsonian_feature_predictor
+from isamples_metadata.taxonomy.metrics import METADATA_EXCEPTIONS, metrics_exposition, observe_request
+from isamples_metadata.taxonomy.model_startup import MODEL_STARTUP, load_models
+from isamples_metadata.taxonomy.prediction_cache import PREDICTION_CACHE
 from isamples_metadata.taxonomy.metadata_models import (
     SampleTypePredictor,
     MaterialTypePredictor,
     PredictionResult,
+    RecordPrediction,
+    RulePrediction,
     MetadataModelLoader,
+    OpenContextMaterialTypePredictor,
     OpenContextSamplePredictor,
     OpenContextMaterialPredictor,
     SESARMaterialPredictor,
     SampledFeaturePredictor,
+    classify_sesar_by_rules,
+    parse_opencontext_record,
+    predict_batch_isolating_errors,
 )
 
 app = fastapi.FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=config.Settings().response_compression_minimum_size)
 
 
 def exception_response(exception: Type[MetadataException]) -> PlainTextResponse:
@@ -50,6 +73,15 @@ def test_record_exception_handler(request: Request, exc: SESARSampleTypeExceptio
     return exception_response(TestRecordException)
 
 
+@app.exception_handler(InferenceQueueFullException)
+def inference_queue_full_exception_handler(request: Request, exc: InferenceQueueFullException) -> PlainTextResponse:
+    # http status code 503 is "Service Unavailable", the Retry-After header tells the client when to try again
+    json_str = json.dumps({"exception": exc.__class__.__name__, "message": str(exc)})
+    return PlainTextResponse(
+        json_str, status_code=503, headers={"Retry-After": str(exc.retry_after_seconds)}
+    )
+
+
 def dump_stack_trace():
     print("Dumping stack trace because the python interpreter was killed.")
     traceback.print_stack()
@@ -62,16 +94,20 @@ def main():
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
 
 
+if config.Settings().preload_models:
+    # Load the models at import, in the parent process of a preforking server (gunicorn --preload), so the forked
+    # workers share the weights copy-on-write instead of each loading their own copy.
+    load_models()
+    # keep the garbage collector from writing to the pages of the loaded objects, which would unshare them
+    gc.freeze()
+
+
 @app.on_event("startup")
 def on_startup():
-    # Force load these into memory on app startup so we don't incur a lazy loading penalty on first request
-    print("Loading OpenContext sample model…")
-    MetadataModelLoader.get_oc_sample_model()
-    print("Loading OpenContext material model…")
-    MetadataModelLoader.get_oc_material_model()
-    print("Loading SESAR material model…")
-    MetadataModelLoader.get_sesar_material_model()
-    print("Loading done.")
+    # Load and warm up the models in the background so we don't incur a lazy loading penalty on first request, while
+    # /health/live already answers (loading is a no-op for the models that were preloaded, but every worker warms up
+    # its own threads and allocator)
+    MODEL_STARTUP.start()
 
 
 @app.on_event("shutdown")
@@ -81,21 +117,100 @@ def on_shutdown():
 
 def get_opencontext_sample_type_predictor() -> SampleTypePredictor:
     ocs_model = MetadataModelLoader.get_oc_sample_model()
-    return OpenContextSamplePredictor(ocs_model)
+    return OpenContextSamplePredictor(ocs_model, MetadataModelLoader.get_cascade("OPENCONTEXT", "sample"))
 
 
-def get_opencontext_material_type_predictor() -> MaterialTypePredictor:
+def get_opencontext_material_type_predictor() -> OpenContextMaterialTypePredictor:
     ocs_model = MetadataModelLoader.get_oc_material_model()
-    return OpenContextMaterialPredictor(ocs_model)
+    return OpenContextMaterialPredictor(ocs_model, MetadataModelLoader.get_cascade("OPENCONTEXT", "material"))
 
 
 def get_sesar_material_type_predictor() -> MaterialTypePredictor:
     sesar_model = MetadataModelLoader.get_sesar_material_model()
-    return SESARMaterialPredictor(sesar_model)
+    return SESARMaterialPredictor(sesar_model, MetadataModelLoader.get_cascade("SESAR", "material"))
 
 
 def get_smithsonian_sampled_feature_predictor() -> SampledFeaturePredictor:
-    return SMITHSONIAN_FEATURE_PREDICTOR
+    return get_smithsonian_feature_predictor()
+
+
+def get_response_encoding(request: Request, compact: bool = False) -> ResponseEncoding:
+    """
+    Negotiates the encoding of a prediction response from the Accept header: JSON, or MessagePack if the client prefers
+    application/msgpack.  compact=true encodes each prediction as a [value, confidence, stage] array.
+    """
+    return negotiate_encoding(request.headers.get("accept"), compact)
+
+
+@app.get("/health/live", name="Liveness")
+def health_live() -> dict:
+    """
+    Reports that the worker process is up and serving requests, whether or not its models are ready
+    """
+    return {"status": "alive"}
+
+
+@app.get("/health/ready", name="Readiness")
+def health_ready(response: Response) -> dict:
+    """
+    Reports whether the worker has loaded and warmed up its models, with a 503 status code until it has
+    :return: the startup state, and the seconds it took to load and warm up each model
+    """
+    if not MODEL_STARTUP.is_ready():
+        response.status_code = 503
+    return MODEL_STARTUP.status()
+
+
+@app.get("/memory", name="Worker Memory Usage")
+def memory() -> Optional[dict]:
+    """
+    Reports the memory usage of the worker process that served the request
+    :return: bytes of memory unique to the worker and shared with other processes, or None if unavailable
+    """
+    return process_memory()
+
+
+@app.get("/models", name="Model Statistics")
+def model_stats() -> dict:
+    """
+    Reports the cumulative tokenization and forward pass times of the loaded models, and for the models in cascade mode
+    the number of texts the first stage answered and the fraction escalated to the model
+    :return: dict of model name to its statistics
+    """
+    stats = {model.name: model.stats() for model in MetadataModelLoader.loaded_models()}
+    for cascade in MetadataModelLoader.loaded_cascades():
+        stats.setdefault(cascade.name, {})["cascade"] = cascade.stats()
+    return stats
+
+
+@app.get("/executors", name="Inference Executor Statistics")
+def executor_stats() -> dict:
+    """
+    Reports the queue lengths and queue wait times of the per-model inference executors
+    :return: dict of executor name to its statistics
+    """
+    return inference_executor_stats()
+
+
+@app.get("/metrics", name="Prometheus Metrics")
+def metrics() -> Response:
+    """
+    Exports request and per-stage latency histograms, rule vs. machine classification counts, cache lookups, input
+    token lengths and excluded record counts in the Prometheus text format
+    """
+    content, content_type = metrics_exposition()
+    return Response(content, media_type=content_type)
+
+
+@app.get("/cache", name="Prediction Cache Statistics")
+def cache_stats() -> dict:
+    return PREDICTION_CACHE.stats()
+
+
+async def run_model(model: str, endpoint: str, fn: Callable, *args: Any) -> Any:
+    """Runs fn(*args) on the inference executor of the model, observing the request's latency"""
+    with observe_request(model, endpoint):
+        return await get_inference_executor(model).run(fn, *args)
 
 
 class PredictParams(BaseModel):
@@ -103,8 +218,8 @@ class PredictParams(BaseModel):
     type: ISBModelType
 
 
-@app.post("/opencontext", name="OpenContext Model Invocation")
-def opencontext(
+@app.post("/opencontext", name="OpenContext Model Invocation", response_model=list[PredictionResult])
+async def opencontext(
     params: PredictParams,
     sample_type_predictor: SampleTypePredictor = Depends(
         get_opencontext_sample_type_predictor
@@ -112,11 +227,20 @@ def opencontext(
     material_type_predictor: MaterialTypePredictor = Depends(
         get_opencontext_material_type_predictor
     ),
-) -> list[PredictionResult]:
+    encoding: ResponseEncoding = Depends(get_response_encoding),
+) -> Response:
     if params.type == ISBModelType.SAMPLE:
-        return sample_type_predictor.predict_sample_type(params.source_record)
+        return encoding.response(
+            await run_model(
+                "opencontext_sample", "single", sample_type_predictor.predict_sample_type, params.source_record
+            )
+        )
     elif params.type == ISBModelType.MATERIAL:
-        return material_type_predictor.predict_material_type(params.source_record)
+        return encoding.response(
+            await run_model(
+                "opencontext_material", "single", material_type_predictor.predict_material_type, params.source_record
+            )
+        )
     else:
         raise HTTPException(
             500,
@@ -124,15 +248,413 @@ def opencontext(
         )
 
 
-@app.post("/sesar", name="SESAR Model Invocation")
-def sesar(
+class CombinedPredictParams(BaseModel):
+    source_record: dict
+    types: list[ISBModelType] = [ISBModelType.SAMPLE, ISBModelType.MATERIAL]
+
+
+@app.post(
+    "/opencontext/combined",
+    name="OpenContext Combined Model Invocation",
+    response_model=dict[str, list[PredictionResult]],
+)
+async def opencontext_combined(
+    params: CombinedPredictParams,
+    sample_type_predictor: SampleTypePredictor = Depends(
+        get_opencontext_sample_type_predictor
+    ),
+    material_type_predictor: OpenContextMaterialTypePredictor = Depends(
+        get_opencontext_material_type_predictor
+    ),
+    encoding: ResponseEncoding = Depends(get_response_encoding),
+) -> Response:
+    """
+    Predicts several types of one record in a single call.  The record is parsed once, and the models of the types
+    run concurrently on their executors.
+    :param types: The types to predict, 'sample' and/or 'material'
+    :return: dict of type to its prediction results
+    """
+    predictors = {
+        ISBModelType.SAMPLE: ("opencontext_sample", sample_type_predictor.predict_sample_type_for_input),
+        ISBModelType.MATERIAL: ("opencontext_material", material_type_predictor.predict_material_type_for_input),
+    }
+    # drop duplicate types, keeping the requested order
+    types = list(dict.fromkeys(params.types))
+    if len(types) == 0 or any(model_type not in predictors for model_type in types):
+        raise HTTPException(
+            500,
+            "Unable to serve specified model types. Valid types are 'sample' and 'material'.",
+        )
+    # the record is parsed on the executor of the first type, and its parse_thing stage recorded under that model
+    parsing_model = predictors[types[0]][0]
+    oc_input = await get_inference_executor(parsing_model).run(
+        parse_opencontext_record, parsing_model, params.source_record
+    )
+    results = await asyncio.gather(
+        *(run_model(predictors[model_type][0], "combined", predictors[model_type][1], oc_input) for model_type in types)
+    )
+    return encoding.response({model_type.value: result for model_type, result in zip(types, results)})
+
+
+class BatchPredictParams(BaseModel):
+    source_records: list[dict]
+    type: ISBModelType
+
+
+class BatchPredictionResult(BaseModel):
+    predictions: list[PredictionResult] = []
+    # Populated with the same values as the 409 response body if the record was excluded
+    exception: Optional[str] = None
+    message: Optional[str] = None
+
+
+def batch_prediction_results(
+    model: str, record_predictions: Sequence[Union[RecordPrediction, Exception]]
+) -> list[BatchPredictionResult]:
+    results = []
+    for record_prediction in record_predictions:
+        if isinstance(record_prediction, Exception):
+            if isinstance(record_prediction, MetadataException):
+                METADATA_EXCEPTIONS.labels(model, record_prediction.__class__.__name__).inc()
+            results.append(
+                BatchPredictionResult(
+                    exception=record_prediction.__class__.__name__, message=str(record_prediction)
+                )
+            )
+        else:
+            # the predictions were built by the predictors, so they're not validated again
+            results.append(BatchPredictionResult.model_construct(predictions=record_prediction))
+    return results
+
+
+@app.post(
+    "/opencontext/batch", name="OpenContext Batch Model Invocation", response_model=list[BatchPredictionResult]
+)
+async def opencontext_batch(
+    params: BatchPredictParams,
+    sample_type_predictor: SampleTypePredictor = Depends(
+        get_opencontext_sample_type_predictor
+    ),
+    material_type_predictor: MaterialTypePredictor = Depends(
+        get_opencontext_material_type_predictor
+    ),
+    encoding: ResponseEncoding = Depends(get_response_encoding),
+) -> Response:
+    if params.type == ISBModelType.SAMPLE:
+        return encoding.response(batch_prediction_results(
+            "opencontext_sample",
+            await run_model(
+                "opencontext_sample",
+                "batch",
+                predict_batch_isolating_errors,
+                sample_type_predictor.predict_sample_type_batch,
+                params.source_records,
+            ),
+        ))
+    elif params.type == ISBModelType.MATERIAL:
+        return encoding.response(batch_prediction_results(
+            "opencontext_material",
+            await run_model(
+                "opencontext_material",
+                "batch",
+                predict_batch_isolating_errors,
+                material_type_predictor.predict_material_type_batch,
+                params.source_records,
+            ),
+        ))
+    else:
+        raise HTTPException(
+            500,
+            "Unable to serve specified model type. Valid types are 'sample' and 'material'.",
+        )
+
+
+class StreamRecord(BaseModel):
+    id: Optional[Union[str, int]] = None
+    source_record: dict
+
+
+class StreamPredictionResult(BatchPredictionResult):
+    index: int
+    id: Optional[Union[str, int]] = None
+
+
+class RequestBodyStreamingResponse(StreamingResponse):
+    """StreamingResponse whose content is produced while the request body is still being read.  The stock
+    implementation listens for the client disconnecting by reading from the request, which would swallow the
+    remaining body; a disconnect instead surfaces when reading the body."""
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+class LineTooLongError(ValueError):
+    """A line of a streaming request body is longer than stream_max_line_bytes"""
+
+
+# a line of a streaming request body, or the error it's replaced with if it's too long
+StreamLine = Union[bytes, LineTooLongError]
+
+
+class NdjsonLineSplitter:
+    """Splits a byte stream into its non-empty lines, scanning each chunk once as it arrives.  A line longer than
+    max_line_bytes is discarded while it's read and replaced by a LineTooLongError, so it's never buffered whole."""
+
+    def __init__(self, max_line_bytes: int):
+        self.max_line_bytes = max_line_bytes
+        self._pieces: list[bytes] = []
+        self._size = 0
+        self._too_long = False
+
+    def _append(self, piece: bytes):
+        if self._too_long:
+            return
+        self._size += len(piece)
+        if self._size > self.max_line_bytes:
+            self._too_long = True
+            self._pieces = []
+        else:
+            self._pieces.append(piece)
+
+    def _end_line(self) -> Optional[StreamLine]:
+        line = b"".join(self._pieces)
+        too_long = self._too_long
+        self._pieces = []
+        self._size = 0
+        self._too_long = False
+        if too_long:
+            return LineTooLongError(f"The line is longer than {self.max_line_bytes} bytes")
+        return line if line.strip() else None
+
+    def feed(self, chunk: bytes) -> list[StreamLine]:
+        """Returns the lines that the chunk completes"""
+        lines = []
+        start = 0
+        end = chunk.find(b"\n")
+        while end != -1:
+            self._append(chunk[start:end])
+            line = self._end_line()
+            if line is not None:
+                lines.append(line)
+            start = end + 1
+            end = chunk.find(b"\n", start)
+        self._append(chunk[start:])
+        return lines
+
+    def finish(self) -> list[StreamLine]:
+        """Returns the last line, if the stream doesn't end with a newline"""
+        line = self._end_line()
+        return [line] if line is not None else []
+
+
+async def ndjson_lines(request: Request, max_line_bytes: int) -> AsyncIterator[StreamLine]:
+    """Yields the non-empty lines of the request body as they arrive"""
+    splitter = NdjsonLineSplitter(max_line_bytes)
+    async for chunk in request.stream():
+        for line in splitter.feed(chunk):
+            yield line
+    for line in splitter.finish():
+        yield line
+
+
+def predict_stream_batch(
+    model: str, batch_predictor: Callable[[list[dict]], list[RecordPrediction]], lines: list[tuple[int, StreamLine]]
+) -> list[StreamPredictionResult]:
+    results: dict[int, StreamPredictionResult] = {}
+    records: list[tuple[int, StreamRecord]] = []
+    for index, line in lines:
+        try:
+            if isinstance(line, LineTooLongError):
+                raise line
+            records.append((index, StreamRecord.model_validate_json(line)))
+        except (ValidationError, LineTooLongError) as e:
+            results[index] = StreamPredictionResult(index=index, exception=e.__class__.__name__, message=str(e))
+    record_predictions = batch_prediction_results(
+        model,
+        predict_batch_isolating_errors(batch_predictor, [record.source_record for _, record in records])
+    )
+    for (index, record), record_prediction in zip(records, record_predictions):
+        results[index] = StreamPredictionResult(index=index, id=record.id, **record_prediction.model_dump())
+    return [results[index] for index, _ in lines]
+
+
+async def _stream_batch_lines(
+    batch_predictor: Callable[[list[dict]], list[RecordPrediction]],
+    executor: InferenceExecutor,
+    lines: list[tuple[int, StreamLine]],
+) -> bytes:
+    # a batch's result lines are sent as one chunk, so a compressed stream is flushed once per batch
+    results = await executor.run(predict_stream_batch, executor.name, batch_predictor, lines, force=True)
+    return b"".join(result.model_dump_json().encode("utf-8") + b"\n" for result in results)
+
+
+async def stream_predictions(
+    request: Request, batch_predictor: Callable[[list[dict]], list[RecordPrediction]], executor: InferenceExecutor
+) -> AsyncIterator[bytes]:
+    """Reads NDJSON records from the request body and yields an NDJSON result line per record, running the records
+    through the model in batches of stream_batch_size and yielding each batch's lines together.  The stream was
+    admitted when it started, so its batches are never rejected by a full executor queue."""
+    settings = config.Settings()
+    batch_size = settings.stream_batch_size
+    lines: list[tuple[int, StreamLine]] = []
+    index = 0
+    with observe_request(executor.name, "stream"):
+        async for line in ndjson_lines(request, settings.stream_max_line_bytes):
+            lines.append((index, line))
+            index += 1
+            if len(lines) >= batch_size:
+                yield await _stream_batch_lines(batch_predictor, executor, lines)
+                lines = []
+        if len(lines) > 0:
+            yield await _stream_batch_lines(batch_predictor, executor, lines)
+
+
+@app.post("/opencontext/stream", name="OpenContext Streaming Model Invocation")
+async def opencontext_stream(
+    request: Request,
+    type: ISBModelType,
+    sample_type_predictor: SampleTypePredictor = Depends(
+        get_opencontext_sample_type_predictor
+    ),
+    material_type_predictor: MaterialTypePredictor = Depends(
+        get_opencontext_material_type_predictor
+    ),
+) -> StreamingResponse:
+    """
+    Streams predictions for a request body of JSON lines, each of the form {"id": ..., "source_record": {...}}.
+    Each input line gets a result line with its index and id, and either predictions or the exception.
+    """
+    batch_predictor: Callable[[list[dict]], list[RecordPrediction]]
+    if type == ISBModelType.SAMPLE:
+        batch_predictor = sample_type_predictor.predict_sample_type_batch
+        executor = get_inference_executor("opencontext_sample")
+    elif type == ISBModelType.MATERIAL:
+        batch_predictor = material_type_predictor.predict_material_type_batch
+        executor = get_inference_executor("opencontext_material")
+    else:
+        raise HTTPException(
+            500,
+            "Unable to serve specified model type. Valid types are 'sample' and 'material'.",
+        )
+    if executor.is_full():
+        raise InferenceQueueFullException(executor.name, executor.retry_after_seconds)
+    return RequestBodyStreamingResponse(
+        stream_predictions(request, batch_predictor, executor), media_type="application/x-ndjson"
+    )
+
+
+@app.post("/sesar", name="SESAR Model Invocation", response_model=list[PredictionResult])
+async def sesar(
     params: PredictParams,
     material_type_predictor: MaterialTypePredictor = Depends(
         get_sesar_material_type_predictor
     ),
-) -> list[PredictionResult]:
+    encoding: ResponseEncoding = Depends(get_response_encoding),
+) -> Response:
+    if params.type == ISBModelType.MATERIAL:
+        return encoding.response(
+            await run_model(
+                "sesar_material", "single", material_type_predictor.predict_material_type, params.source_record
+            )
+        )
+    else:
+        raise HTTPException(
+            500,
+            "Unable to serve specified model type. The only valid type is 'material'.",
+        )
+
+
+@app.post("/sesar/batch", name="SESAR Batch Model Invocation", response_model=list[BatchPredictionResult])
+async def sesar_batch(
+    params: BatchPredictParams,
+    material_type_predictor: MaterialTypePredictor = Depends(
+        get_sesar_material_type_predictor
+    ),
+    encoding: ResponseEncoding = Depends(get_response_encoding),
+) -> Response:
+    if params.type == ISBModelType.MATERIAL:
+        return encoding.response(batch_prediction_results(
+            "sesar_material",
+            await run_model(
+                "sesar_material",
+                "batch",
+                predict_batch_isolating_errors,
+                material_type_predictor.predict_material_type_batch,
+                params.source_records,
+            ),
+        ))
+    else:
+        raise HTTPException(
+            500,
+            "Unable to serve specified model type. The only valid type is 'material'.",
+        )
+
+
+class RulePredictionResult(BatchPredictionResult):
+    # Set if none of the rules apply to the record, so it has to be classified by the model
+    needs_model: bool = False
+
+
+def rule_prediction_results(rule_predictions: Sequence[RulePrediction]) -> list[RulePredictionResult]:
+    results = []
+    for rule_prediction in rule_predictions:
+        if rule_prediction is None:
+            results.append(RulePredictionResult(needs_model=True))
+        elif isinstance(rule_prediction, MetadataException):
+            METADATA_EXCEPTIONS.labels("sesar_material", rule_prediction.__class__.__name__).inc()
+            results.append(
+                RulePredictionResult(exception=rule_prediction.__class__.__name__, message=str(rule_prediction))
+            )
+        else:
+            results.append(RulePredictionResult.model_construct(predictions=rule_prediction))
+    return results
+
+
+@app.post("/sesar/rules", name="SESAR Rules-Only Classification", response_model=list[RulePredictionResult])
+async def sesar_rules(
+    params: BatchPredictParams, encoding: ResponseEncoding = Depends(get_response_encoding)
+) -> Response:
+    """
+    Classifies the records with the SESAR rules alone, without the model.  The records that none of the rules apply to
+    come back with needs_model set, for the caller to send to /sesar/batch.
+    :return: one result per record, with the rule-based predictions, needs_model, or the exception that excluded it
+    """
     if params.type == ISBModelType.MATERIAL:
-        return material_type_predictor.predict_material_type(params.source_record)
+        # the rules don't need the model, so they don't queue behind its predictions on the sesar_material executor
+        with observe_request("sesar_material", "rules"):
+            rule_predictions = await get_inference_executor("sesar_rules").run(
+                classify_sesar_by_rules, params.source_records
+            )
+        return encoding.response(rule_prediction_results(rule_predictions))
+    else:
+        raise HTTPException(
+            500,
+            "Unable to serve specified model type. The only valid type is 'material'.",
+        )
+
+
+@app.post("/sesar/stream", name="SESAR Streaming Model Invocation")
+async def sesar_stream(
+    request: Request,
+    type: ISBModelType,
+    material_type_predictor: MaterialTypePredictor = Depends(
+        get_sesar_material_type_predictor
+    ),
+) -> StreamingResponse:
+    """
+    Streams predictions for a request body of JSON lines, each of the form {"id": ..., "source_record": {...}}.
+    Each input line gets a result line with its index and id, and either predictions or the exception.
+    """
+    if type == ISBModelType.MATERIAL:
+        executor = get_inference_executor("sesar_material")
+        if executor.is_full():
+            raise InferenceQueueFullException(executor.name, executor.retry_after_seconds)
+        return RequestBodyStreamingResponse(
+            stream_predictions(request, material_type_predictor.predict_material_type_batch, executor),
+            media_type="application/x-ndjson",
+        )
     else:
         raise HTTPException(
             500,
@@ -146,7 +668,7 @@ class SampledFeatureParams(BaseModel):
 
 
 @app.post("/smithsonian", name="Smithsonian Model Invocation")
-def smithsonian(
+async def smithsonian(
     params: SampledFeatureParams,
     sampled_feature_predictor: SampledFeaturePredictor = Depends(
         get_smithsonian_sampled_feature_predictor
@@ -161,7 +683,48 @@ def smithsonian(
     if params.input is None:
         raise HTTPException(500, "Input parameter is required.")
     if params.type == ISBModelType.CONTEXT:
-        return sampled_feature_predictor.predict_sampled_feature(params.input)
+        return await run_model(
+            "smithsonian", "single", sampled_feature_predictor.predict_sampled_feature, params.input
+        )
+    else:
+        raise HTTPException(
+            500,
+            "Unable to serve specified model type. The only valid type is 'context'.",
+        )
+
+
+class SampledFeatureBatchParams(BaseModel):
+    inputs: list[list[str]]
+    type: ISBModelType
+    # the number of labels to return per input
+    top_k: int = Field(1, ge=1, le=MAX_TOP_K)
+
+
+@app.post(
+    "/smithsonian/batch", name="Smithsonian Batch Model Invocation", response_model=list[list[PredictionResult]]
+)
+async def smithsonian_batch(
+    params: SampledFeatureBatchParams,
+    sampled_feature_predictor: SampledFeaturePredictor = Depends(
+        get_smithsonian_sampled_feature_predictor
+    ),
+    encoding: ResponseEncoding = Depends(get_response_encoding),
+) -> Response:
+    """
+    Predicts the Smithsonian context values of many inputs using the FastText model, in a single call of the model
+    :param type: The type of value to predict, only valid value for Smithsonian is CONTEXT
+    :param inputs: The input parameters of each record
+    :param top_k: The number of labels to return per input
+    :return: The top_k labels of each input with their probabilities, in the order of the inputs
+    """
+    if params.type == ISBModelType.CONTEXT:
+        predictions = await run_model(
+            "smithsonian", "batch", sampled_feature_predictor.predict_sampled_features, params.inputs, params.top_k
+        )
+        return encoding.response([
+            [PredictionResult(value=label, confidence=prob) for label, prob in input_predictions]
+            for input_predictions in predictions
+        ])
     else:
         raise HTTPException(
             500,
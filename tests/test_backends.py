@@ -0,0 +1,40 @@
+import logging
+import os
+
+from benchmarks import fixtures
+from isamples_metadata.taxonomy import export_torchscript
+from isamples_metadata.taxonomy.backends import TorchBackend, source_fingerprint
+
+
+def test_source_fingerprint_ignores_the_artifacts(tmp_path):
+    config = fixtures.build_model(str(tmp_path), fixtures.SESAR_MATERIAL_CLASSES)
+    before = source_fingerprint(config)
+    export_torchscript.export_model(config)
+    assert before == source_fingerprint(config)
+    assert before != source_fingerprint({**config, "QUANTIZATION": "dynamic_int8"})
+
+
+def test_source_fingerprint_changes_with_the_file_stats(tmp_path):
+    config = fixtures.build_model(str(tmp_path), fixtures.SESAR_MATERIAL_CLASSES)
+    before = source_fingerprint(config)
+    weights_path = next(
+        os.path.join(config["FINE_TUNED_MODEL"], filename)
+        for filename in sorted(os.listdir(config["FINE_TUNED_MODEL"]))
+        if filename.endswith((".bin", ".safetensors"))
+    )
+    stat = os.stat(weights_path)
+    os.utime(weights_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert before != source_fingerprint(config)
+
+
+def test_stale_torchscript_artifact_is_ignored(tmp_path, caplog):
+    config = fixtures.build_model(str(tmp_path), fixtures.SESAR_MATERIAL_CLASSES)
+    export_torchscript.export_model(config)
+    assert TorchBackend(config).compiled
+    # replace the fine-tuned model without compiling it again
+    fixtures.build_model(str(tmp_path), fixtures.SESAR_MATERIAL_CLASSES, seed=1)
+    with caplog.at_level(logging.WARNING):
+        assert not TorchBackend(config).compiled
+    assert "export_torchscript" in caplog.text
+    export_torchscript.export_model(config)
+    assert TorchBackend(config).compiled
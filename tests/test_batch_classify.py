@@ -0,0 +1,72 @@
+import json
+
+from isamples_metadata.taxonomy import batch_classify
+from isamples_metadata.taxonomy.metadata_models import MetadataException, PredictionResult
+
+
+def fake_batch_predictor(source_records):
+    results = []
+    for source_record in source_records:
+        if source_record.get("bad"):
+            results.append(MetadataException("no text"))
+        else:
+            results.append([PredictionResult(value=source_record["text"], confidence=1.0)])
+    return results
+
+
+def write_input(path, count):
+    with open(path, "w") as input_file:
+        for index in range(count):
+            input_file.write(json.dumps({"@id": f"id{index}", "text": f"rock {index}", "bad": index % 5 == 0}) + "\n")
+
+
+def read_output(path):
+    with open(path) as output_file:
+        return [json.loads(line) for line in output_file]
+
+
+def test_classify_dump(tmp_path, monkeypatch):
+    # the pool forks, so the workers inherit the patched predictor factory
+    monkeypatch.setattr(batch_classify, "_create_batch_predictor", lambda *args: fake_batch_predictor)
+    input_path = str(tmp_path / "input.jsonl")
+    output_path = str(tmp_path / "output.jsonl")
+    write_input(input_path, 23)
+    assert 23 == batch_classify.classify_dump("sesar", "material", input_path, output_path, processes=2, chunk_size=4)
+    results = read_output(output_path)
+    assert list(range(23)) == [result["index"] for result in results]
+    assert "id1" == results[1]["id"]
+    assert [{"value": "rock 1", "confidence": 1.0, "stage": "model"}] == results[1]["predictions"]
+    assert "MetadataException" == results[0]["exception"]
+    assert {"records_done": 23, "output_position": (tmp_path / "output.jsonl").stat().st_size} == json.loads(
+        (tmp_path / "output.jsonl.checkpoint").read_text()
+    )
+
+
+def test_classify_dump_resumes_from_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_classify, "_create_batch_predictor", lambda *args: fake_batch_predictor)
+    input_path = str(tmp_path / "input.jsonl")
+    output_path = str(tmp_path / "output.jsonl")
+    write_input(input_path, 10)
+    batch_classify.classify_dump("sesar", "material", input_path, output_path, chunk_size=4)
+    expected = read_output(output_path)
+    # simulate an interruption after the first checkpoint, with a partially written chunk after it
+    with open(output_path) as output_file:
+        checkpointed = "".join(output_file.readlines()[:4])
+    (tmp_path / "output.jsonl").write_text(checkpointed + '{"index": 4, "id"')
+    batch_classify._write_checkpoint(output_path + ".checkpoint", 4, len(checkpointed.encode("utf-8")))
+    assert 10 == batch_classify.classify_dump("sesar", "material", input_path, output_path, chunk_size=4)
+    assert expected == read_output(output_path)
+
+
+def test_classify_dump_reports_malformed_lines(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_classify, "_create_batch_predictor", lambda *args: fake_batch_predictor)
+    input_path = str(tmp_path / "input.jsonl")
+    output_path = str(tmp_path / "output.jsonl")
+    (tmp_path / "input.jsonl").write_text('{"@id": "id0", "text": "rock"}\n{"@id": "id1", "te\n[1, 2]\n{"text": "mud"}\n')
+    assert 4 == batch_classify.classify_dump("sesar", "material", input_path, output_path, chunk_size=4)
+    results = read_output(output_path)
+    assert [0, 1, 2, 3] == [result["index"] for result in results]
+    assert "rock" == results[0]["predictions"][0]["value"]
+    assert ("JSONDecodeError", None, []) == (results[1]["exception"], results[1]["id"], results[1]["predictions"])
+    assert "ValueError" == results[2]["exception"]
+    assert "mud" == results[3]["predictions"][0]["value"]
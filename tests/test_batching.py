@@ -0,0 +1,110 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks import fixtures
+from isamples_metadata.taxonomy.backends import create_backend
+from isamples_metadata.taxonomy.batching import MicroBatcher, deduplicate
+from isamples_metadata.taxonomy.Model import Model
+
+
+def test_concurrent_items_are_batched():
+    batch_sizes = []
+    lock = threading.Lock()
+
+    def batch_fn(items):
+        with lock:
+            batch_sizes.append(len(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=8, max_wait_ms=200)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(batcher.predict, range(8)))
+    assert [item * 2 for item in range(8)] == results
+    assert 8 == sum(batch_sizes)
+    # the items arrived well within the wait window, so they shouldn't each get their own batch
+    assert len(batch_sizes) < 8
+    assert max(batch_sizes) <= 8
+
+
+def test_batch_exception_is_raised_to_every_caller():
+    def batch_fn(items):
+        raise ValueError("boom")
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=4, max_wait_ms=1)
+    futures = [batcher.submit(item) for item in range(3)]
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result()
+
+
+def test_missing_results_fail_every_caller():
+    batcher = MicroBatcher(lambda items: items[:-1], max_batch_size=4, max_wait_ms=50)
+    futures = [batcher.submit(item) for item in range(3)]
+    for future in futures:
+        with pytest.raises(ValueError, match="results for"):
+            future.result(timeout=5)
+
+
+def test_invalid_max_batch_size():
+    with pytest.raises(ValueError):
+        MicroBatcher(lambda items: items, max_batch_size=0, max_wait_ms=1)
+
+
+def test_deduplicate():
+    assert (["b", "a", "c"], [0, 1, 0, 2, 1]) == deduplicate(["b", "a", "b", "c", "a"])
+    assert ([], []) == deduplicate([])
+
+
+def test_model_runs_identical_texts_once(tmp_path):
+    config = fixtures.build_model(str(tmp_path), fixtures.SESAR_MATERIAL_CLASSES, max_sequence_len=32)
+    backend = create_backend(config)
+    batch_rows = []
+
+    class RecordingBackend:
+        def logits(self, input_ids, attention_mask):
+            batch_rows.append(input_ids.shape[0])
+            return backend.logits(input_ids, attention_mask)
+
+    model = Model(config, "SESAR-material", RecordingBackend())
+    predictions = model.predict_batch(["rock core", "soil", "rock core", "rock core"])
+    assert [2] == batch_rows
+    assert predictions[0] == predictions[2] == predictions[3]
+    assert predictions[1] == model.predict_batch(["soil"])[0]
+    stats = model.stats()
+    assert 3 == stats["texts"]
+    assert 2 == stats["duplicate_texts"]
+    assert 2 / 5 == stats["dedup_ratio"]
+
+
+def test_model_limits_concurrent_forward_passes(tmp_path):
+    config = fixtures.build_model(str(tmp_path), fixtures.SESAR_MATERIAL_CLASSES, max_sequence_len=32)
+    backend = create_backend(config)
+    lock = threading.Lock()
+    running = [0]
+    most_running = [0]
+
+    class CountingBackend:
+        def logits(self, input_ids, attention_mask):
+            with lock:
+                running[0] += 1
+                most_running[0] = max(most_running[0], running[0])
+            try:
+                time.sleep(0.01)
+                return backend.logits(input_ids, attention_mask)
+            finally:
+                with lock:
+                    running[0] -= 1
+
+    model = Model(config, "SESAR-material", CountingBackend(), max_concurrent_forward_passes=2)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda index: model.predict_batch([f"rock {index}"]), range(16)))
+    assert 2 == most_running[0]
+
+
+def test_invalid_max_concurrent_forward_passes(tmp_path):
+    config = fixtures.build_model(str(tmp_path), fixtures.SESAR_MATERIAL_CLASSES, max_sequence_len=32)
+    with pytest.raises(ValueError):
+        Model(config, "SESAR-material", max_concurrent_forward_passes=0)
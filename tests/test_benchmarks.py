@@ -0,0 +1,38 @@
+from benchmarks import run_benchmarks
+
+
+def test_run_benchmarks(tmp_path):
+    results = run_benchmarks.run_benchmarks(
+        iterations=3, batch_size=2, seed=0, work_directory=str(tmp_path)
+    )
+    assert set(results) == {
+        "model_predict",
+        "model_predict_batch_2",
+        "sesar_predict_material_type",
+        "opencontext_predict_material_type",
+        "opencontext_predict_sample_type",
+        "endpoint_sesar",
+        "endpoint_sesar_batch",
+        "endpoint_opencontext_material",
+        "endpoint_opencontext_sample",
+        "fasttext_predict_sampled_feature",
+        "endpoint_smithsonian",
+        "fasttext_predict_sampled_features_batch_2",
+        "endpoint_smithsonian_batch",
+    }
+    assert results["model_predict_batch_2"]["items"] == 6
+    for result in results.values():
+        assert result["throughput_per_second"] > 0
+        assert result["p50_ms"] <= result["p99_ms"]
+
+
+def test_compare():
+    baseline = {"a": {"throughput_per_second": 100.0, "p99_ms": 2.0}}
+    results = {
+        "a": {"throughput_per_second": 150.0, "p99_ms": 1.0},
+        "b": {"throughput_per_second": 10.0, "p99_ms": 1.0},
+    }
+    assert run_benchmarks.compare(results, baseline) == [
+        "a: 150.0 items/sec (+50.0%), p99 1.00 ms (was 2.00 ms)",
+        "b: not in the baseline",
+    ]
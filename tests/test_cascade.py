@@ -0,0 +1,95 @@
+import os
+
+import fasttext
+import pytest
+
+from benchmarks import fixtures
+from isamples_metadata.taxonomy.cascade import Cascade, create_cascade
+from isamples_metadata.taxonomy.metadata_models import (
+    FIRST_STAGE,
+    MODEL_STAGE,
+    RULE_STAGE,
+    OpenContextMaterialPredictor,
+    SESARMaterialPredictor,
+)
+from isamples_metadata.taxonomy.Model import Model
+from isamples_metadata.taxonomy.prediction_cache import PREDICTION_CACHE
+
+CLASS_NAMES = ["Rock", "Organic Material", "Liquid"]
+_TRAINING_WORDS = {
+    "Rock": "basalt granite shale outcrop",
+    "Organic_Material": "leather wood bone charcoal",
+    "Liquid": "water fluid brine seep",
+}
+
+
+@pytest.fixture(name="fasttext_model", scope="module")
+def fasttext_model_fixture(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("cascade")
+    training_path = os.path.join(directory, "train.txt")
+    with open(training_path, "w") as training_file:
+        for _ in range(50):
+            for label, words in _TRAINING_WORDS.items():
+                training_file.write(f"__label__{label} {words}\n")
+    model_path = os.path.join(directory, "cascade.bin")
+    fasttext.train_supervised(training_path, epoch=25, dim=8, thread=1, seed=0, verbose=0).save_model(model_path)
+    return model_path
+
+
+@pytest.fixture(name="bert_config", scope="module")
+def bert_config_fixture(tmp_path_factory):
+    return fixtures.build_model(str(tmp_path_factory.mktemp("bert")), fixtures.SESAR_MATERIAL_CLASSES)
+
+
+@pytest.fixture(autouse=True)
+def clear_prediction_cache():
+    PREDICTION_CACHE.clear()
+
+
+def test_cascade_answers_confident_texts(fasttext_model):
+    cascade = Cascade("test", fasttext.load_model(fasttext_model), CLASS_NAMES, 0.8)
+    results = cascade.classify_batch(["Leather, Wood!", "granite\nbasalt", "unrelated words"])
+    assert "Organic Material" == results[0][0][0]
+    assert results[0][0][1] >= 0.8
+    assert "Rock" == results[1][0][0]
+    assert results[2] is None
+    assert {"answered": 2, "escalated": 1, "escalated_fraction": 1 / 3, "threshold": 0.8} == cascade.stats()
+
+
+def test_cascade_escalates_labels_outside_the_class_names(fasttext_model):
+    cascade = Cascade("test", fasttext.load_model(fasttext_model), ["Rock"], 0.0)
+    results = cascade.classify_batch(["granite", "leather"])
+    assert [("Rock", results[0][0][1])] == results[0]
+    assert results[1] is None
+
+
+def test_create_cascade(fasttext_model):
+    assert create_cascade("test", {"CLASS_NAMES": CLASS_NAMES}) is None
+    cascade = create_cascade("test", {"CLASS_NAMES": CLASS_NAMES, "CASCADE_MODEL": fasttext_model})
+    assert 0.9 == cascade.threshold
+
+
+def _sesar_record(sample_type: str, description: str) -> dict:
+    return {"description": {"sampleType": sample_type, "description": description}}
+
+
+def test_sesar_predictor_records_the_answering_stage(fasttext_model, bert_config):
+    cascade = Cascade("SESAR-material", fasttext.load_model(fasttext_model), CLASS_NAMES, 0.8)
+    predictor = SESARMaterialPredictor(Model(bert_config, "SESAR-material"), cascade)
+    records = [
+        _sesar_record("CTP", "brine"),
+        _sesar_record("Individual Sample", "granite basalt"),
+        _sesar_record("Individual Sample", "unrelated words"),
+    ]
+    results = predictor.predict_material_type_batch(records)
+    assert [RULE_STAGE, FIRST_STAGE, MODEL_STAGE] == [predictions[0].stage for predictions in results]
+    # the first stage labels are mapped to the iSamples CV like the model's
+    assert "Rock" == results[1][0].value
+    assert results == [predictor.predict_material_type(record) for record in records]
+    assert 2 == cascade.stats()["escalated"]
+
+
+def test_predictor_without_cascade(bert_config):
+    predictor = OpenContextMaterialPredictor(Model(bert_config, "OPENCONTEXT-material"))
+    results = predictor.predict_material_type_batch([{"label": "granite"}])
+    assert MODEL_STAGE == results[0][0].stage
@@ -0,0 +1,69 @@
+import json
+
+from isamples_metadata.taxonomy.OpenContextClassifierInput import OpenContextClassifierInput
+from isamples_metadata.taxonomy.SESARClassifierInput import SESARClassifierInput
+
+SESAR_PATH = "./test_data/SESAR/raw/EOI00002Hjson-ld.json"
+OPENCONTEXT_PATH = "./test_data/OpenContext/raw/ark-28722-k26d5xr5z.json"
+
+
+def _load(path):
+    with open(path) as source_file:
+        return json.load(source_file)
+
+
+def test_sesar_texts():
+    sesar_input = SESARClassifierInput(_load(SESAR_PATH))
+    sesar_input.parse_thing()
+    # each text leaves out its own gold label field
+    assert (
+        "volcano , TN300 , Sampler:Fluid:GTHFS , Individual Sample , HFS gastight. Red-center-9. T=250C , GTHFS "
+        == sesar_input.get_material_text()
+    )
+    assert (
+        "volcano , TN300 , Sampler:Fluid:GTHFS , Gas , HFS gastight. Red-center-9. T=250C , GTHFS "
+        == sesar_input.get_sample_text()
+    )
+    assert "Gas" == sesar_input.get_gold_material()
+    assert "Individual Sample" == sesar_input.get_gold_sample()
+
+
+def test_sesar_texts_skip_empty_fields_and_repeat_purpose():
+    sesar_input = SESARClassifierInput(
+        {"description": {"igsnPrefix": "IEK", "description": "", "supplementMetadata": {"purpose": "study"}}}
+    )
+    sesar_input.parse_thing()
+    assert "study , study " == sesar_input.get_material_text()
+    assert {"igsnPrefix": "IEK", "description": "", "supplementMetadata_purpose": "study"} == (
+        sesar_input.get_description_map()
+    )
+
+
+def test_opencontext_texts():
+    oc_input = OpenContextClassifierInput(_load(OPENCONTEXT_PATH))
+    oc_input.parse_thing()
+    assert (
+        "-200.0 , 360.0 , Petra Great Temple Excavations , Architectural Element , Jordan , Petra Great Temple , "
+        "Upper Temenos , Trench 105-106 , Locus 22 "
+        == oc_input.get_material_text()
+    )
+    assert oc_input.get_material_text() == oc_input.get_sample_text()
+
+
+def test_empty_record_has_empty_texts():
+    oc_input = OpenContextClassifierInput({})
+    oc_input.parse_thing()
+    assert "" == oc_input.get_material_text()
+    assert "" == oc_input.get_sample_text()
+
+
+def test_extract_texts_matches_parse_thing():
+    for input_class, path in [(SESARClassifierInput, SESAR_PATH), (OpenContextClassifierInput, OPENCONTEXT_PATH)]:
+        things = [_load(path), _load(path)]
+        texts = input_class.extract_texts(things)
+        for index, thing in enumerate(things):
+            classifier_input = input_class(thing)
+            classifier_input.parse_thing()
+            assert classifier_input.get_material_text() == texts["material"][index]
+            assert classifier_input.get_sample_text() == texts["sample"][index]
+        assert ["sample"] == list(input_class.extract_texts(things, ("sample",)))
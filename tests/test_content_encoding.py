@@ -0,0 +1,158 @@
+import gzip
+
+import pytest
+import zstandard
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from isamples_metadata.http_compression import (
+    DECOMPRESSED_CHUNK_SIZE,
+    CompressionMiddleware,
+    negotiate_content_coding,
+)
+
+
+async def echo(request: Request) -> Response:
+    chunk_sizes = [len(chunk) async for chunk in request.stream() if chunk]
+    return Response(
+        f"{sum(chunk_sizes)} {max(chunk_sizes, default=0)} {request.headers.get('content-encoding')}",
+        media_type="text/plain",
+    )
+
+
+async def stream(request: Request) -> StreamingResponse:
+    async def lines():
+        for index in range(3):
+            yield f"line {index}\n".encode("utf-8")
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+async def large(request: Request) -> Response:
+    return Response(b"x" * 2000, media_type="text/plain")
+
+
+@pytest.fixture(name="client")
+def client_fixture():
+    app = Starlette(routes=[
+        Route("/echo", echo, methods=["POST"]),
+        Route("/stream", stream),
+        Route("/large", large),
+    ])
+    app.add_middleware(CompressionMiddleware, minimum_size=1000)
+    return TestClient(app)
+
+
+@pytest.mark.parametrize(
+    "accept_encoding,expected",
+    [
+        (None, None),
+        ("", None),
+        ("gzip", "gzip"),
+        ("deflate, gzip;q=0.5", "gzip"),
+        ("gzip, zstd", "zstd"),
+        ("gzip, zstd;q=0.5", "gzip"),
+        ("gzip;q=0", None),
+        ("*", "zstd"),
+        ("*, zstd;q=0", "gzip"),
+        ("br, identity", None),
+    ],
+)
+def test_negotiate_content_coding(accept_encoding, expected):
+    assert expected == negotiate_content_coding(accept_encoding)
+
+
+def test_gzip_request_is_decompressed_in_bounded_chunks(client: TestClient):
+    body = b"0123456789" * 100000
+    response = client.post("/echo", content=gzip.compress(body), headers={"Content-Encoding": "gzip"})
+    assert response.status_code == 200
+    # the app sees neither the content coding nor a chunk larger than the bound
+    assert f"{len(body)} {DECOMPRESSED_CHUNK_SIZE} None" == response.text
+
+
+def test_identity_request_is_passed_through(client: TestClient):
+    response = client.post("/echo", content=b"plain", headers={"Content-Encoding": "identity"})
+    assert "5 5 identity" == response.text
+
+
+def test_unsupported_request_coding_returns_415(client: TestClient):
+    response = client.post("/echo", content=b"body", headers={"Content-Encoding": "br"})
+    assert response.status_code == 415
+    assert "br" in response.json()["detail"]
+
+
+def test_corrupt_gzip_request_returns_400():
+    app = Starlette(routes=[Route("/echo", echo, methods=["POST"])])
+    app.add_middleware(CompressionMiddleware)
+    response = TestClient(app, raise_server_exceptions=False).post(
+        "/echo", content=b"not gzip at all", headers={"Content-Encoding": "gzip"}
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "content_coding,compressed",
+    [
+        ("gzip", gzip.compress(b"0123456789" * 1000)[:-20]),
+        ("gzip", gzip.compress(b"first") + b"trailing"),
+        ("zstd", zstandard.ZstdCompressor().compress(b"0123456789" * 1000)[:-4]),
+        ("zstd", zstandard.ZstdCompressor().compress(b"first") + b"trailing"),
+    ],
+)
+def test_incomplete_request_returns_400(client: TestClient, content_coding, compressed):
+    response = client.post("/echo", content=compressed, headers={"Content-Encoding": content_coding})
+    assert response.status_code == 400
+
+
+def test_small_responses_are_not_compressed(client: TestClient):
+    response = client.post("/echo", content=b"plain", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+
+def test_response_is_compressed(client: TestClient):
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert "gzip" == response.headers["content-encoding"]
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert int(response.headers["content-length"]) < 2000
+    assert b"x" * 2000 == response.content
+    response = client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+
+
+def test_streaming_response_is_compressed(client: TestClient):
+    with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+        assert "gzip" == response.headers["content-encoding"]
+        assert "content-length" not in response.headers
+        compressed = b"".join(response.iter_raw())
+    # the stream ends with the gzip trailer
+    assert b"line 0\nline 1\nline 2\n" == gzip.decompress(compressed)
+
+
+def test_zstd_request_is_decompressed_in_bounded_chunks(client: TestClient):
+    # a few KiB that decompress to 64 MiB all fit in a single request message
+    body = b"\0" * (64 * 1024 * 1024)
+    response = client.post(
+        "/echo", content=zstandard.ZstdCompressor().compress(body), headers={"Content-Encoding": "zstd"}
+    )
+    assert response.status_code == 200
+    assert f"{len(body)} {DECOMPRESSED_CHUNK_SIZE} None" == response.text
+
+
+@pytest.mark.parametrize("message_size", [1, 5, 1000])
+def test_zstd_request_split_across_messages(client: TestClient, message_size):
+    body = b"".join(b'{"id": %d, "description": "basalt"}\n' % index for index in range(5000))
+    compressed = zstandard.ZstdCompressor(write_checksum=True, write_content_size=False).compress(body)
+    messages = [compressed[start:start + message_size] for start in range(0, len(compressed), message_size)]
+    response = client.post("/echo", content=iter(messages), headers={"Content-Encoding": "zstd"})
+    assert response.status_code == 200
+    assert f"{len(body)} {DECOMPRESSED_CHUNK_SIZE} None" == response.text
+
+
+def test_zstd_response(client: TestClient):
+    with client.stream("GET", "/large", headers={"Accept-Encoding": "gzip, zstd"}) as response:
+        assert "zstd" == response.headers["content-encoding"]
+        compressed = b"".join(response.iter_raw())
+    assert b"x" * 2000 == zstandard.ZstdDecompressor().decompressobj().decompress(compressed)
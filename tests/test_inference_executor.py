@@ -0,0 +1,57 @@
+import asyncio
+import threading
+
+import pytest
+
+from isamples_metadata.taxonomy.inference_executor import InferenceExecutor, InferenceQueueFullException
+
+
+def test_run_returns_the_result():
+    executor = InferenceExecutor("test", max_workers=2, max_queue_depth=4)
+    assert 6 == asyncio.run(executor.run(lambda a, b: a * b, 2, 3))
+    stats = executor.stats()
+    assert 1 == stats["submitted"]
+    assert 1 == stats["completed"]
+    assert 0 == stats["pending"]
+
+
+def test_exception_is_raised_to_the_caller():
+    def fail():
+        raise ValueError("boom")
+
+    executor = InferenceExecutor("test", max_workers=1, max_queue_depth=1)
+    with pytest.raises(ValueError):
+        asyncio.run(executor.run(fail))
+    assert 0 == executor.stats()["pending"]
+
+
+def test_full_queue_rejects_calls():
+    release = threading.Event()
+    executor = InferenceExecutor("test", max_workers=1, max_queue_depth=2, retry_after_seconds=3)
+
+    async def overload():
+        blocked = [asyncio.ensure_future(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert executor.is_full()
+        assert 1 == executor.stats()["queued"]
+        with pytest.raises(InferenceQueueFullException) as exc_info:
+            await executor.run(release.wait)
+        assert 3 == exc_info.value.retry_after_seconds
+        # forced calls are admitted regardless
+        forced = asyncio.ensure_future(executor.run(release.wait, force=True))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(*blocked, forced)
+
+    asyncio.run(overload())
+    stats = executor.stats()
+    assert 1 == stats["rejected"]
+    assert 3 == stats["completed"]
+    assert 0 == stats["pending"]
+    # the queued calls waited for the blocked one
+    assert stats["max_wait_seconds"] > 0
+
+
+def test_invalid_queue_depth():
+    with pytest.raises(ValueError):
+        InferenceExecutor("test", max_workers=4, max_queue_depth=2)
@@ -0,0 +1,132 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from isamples_metadata.taxonomy.inference_workers import parse_core_sets, serve, split_cores
+from isamples_metadata.taxonomy.remote_model import RemoteInferenceException, RemoteModel
+
+
+class UppercaseModel:
+    name = "SESAR-material"
+
+    def predict(self, text):
+        return self.predict_batch([text])[0]
+
+    def predict_batch(self, texts):
+        if "fail" in texts:
+            raise ValueError("boom")
+        return [[(text.upper(), 0.75), ("Material", 0.25)] for text in texts]
+
+
+@pytest.fixture(name="socket_path")
+def inference_worker_fixture(tmp_path):
+    socket_path = str(tmp_path / "inference.sock")
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(8)
+    model = UppercaseModel()
+    threading.Thread(target=serve, args=(listener, {model.name: model}), daemon=True).start()
+    yield socket_path
+    listener.close()
+
+
+def test_remote_predictions(socket_path):
+    model = RemoteModel("SESAR-material", socket_path, "fingerprint")
+    assert [("ROCK", 0.75), ("Material", 0.25)] == model.predict("rock")
+    assert [[("ROCK", 0.75), ("Material", 0.25)], [("SOIL", 0.75), ("Material", 0.25)]] == model.predict_batch(
+        ["rock", "soil"]
+    )
+    assert [] == model.predict_batch([])
+    stats = model.stats()
+    assert 2 == stats["requests"]
+    assert 3 == stats["texts"]
+
+
+def test_remote_predictions_send_identical_texts_once(socket_path):
+    model = RemoteModel("SESAR-material", socket_path, "fingerprint")
+    predictions = model.predict_batch(["rock", "soil", "rock"])
+    assert [("ROCK", 0.75), ("Material", 0.25)] == predictions[0] == predictions[2]
+    assert [("SOIL", 0.75), ("Material", 0.25)] == predictions[1]
+    stats = model.stats()
+    assert 2 == stats["texts"]
+    assert 1 == stats["duplicate_texts"]
+    assert 1 / 3 == stats["dedup_ratio"]
+
+
+def test_remote_predictions_from_threads(socket_path):
+    model = RemoteModel("SESAR-material", socket_path, "fingerprint")
+    results = {}
+
+    def predict(text):
+        results[text] = model.predict(text)
+
+    threads = [threading.Thread(target=predict, args=(f"text {index}",)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert {f"text {index}": [(f"TEXT {index}", 0.75), ("Material", 0.25)] for index in range(8)} == results
+
+
+def test_remote_errors(socket_path):
+    model = RemoteModel("SESAR-material", socket_path, "fingerprint")
+    with pytest.raises(RemoteInferenceException):
+        model.predict_batch(["rock", "fail"])
+    unknown_model = RemoteModel("unknown", socket_path, "fingerprint")
+    with pytest.raises(RemoteInferenceException):
+        unknown_model.predict("rock")
+    # the connection is still usable after an error
+    assert [("ROCK", 0.75), ("Material", 0.25)] == model.predict("rock")
+    assert 1 == model.stats()["errors"]
+
+
+def _serve_later(socket_path: str, delay_seconds: float):
+    time.sleep(delay_seconds)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(8)
+    model = UppercaseModel()
+    serve(listener, {model.name: model})
+
+
+def test_warm_up_waits_for_the_workers_to_start(tmp_path):
+    socket_path = str(tmp_path / "inference.sock")
+    threading.Thread(target=_serve_later, args=(socket_path, 0.3), daemon=True).start()
+    model = RemoteModel("SESAR-material", socket_path, "fingerprint", connect_timeout_seconds=10.0)
+    model.warm_up([1])
+    assert 1 == model.stats()["requests"]
+
+
+def test_warm_up_gives_up_after_the_timeout(tmp_path):
+    model = RemoteModel("SESAR-material", str(tmp_path / "missing.sock"), "fingerprint", connect_timeout_seconds=0.2)
+    with pytest.raises(FileNotFoundError):
+        model.warm_up([1])
+
+
+def test_prediction_times_out_when_the_worker_hangs(tmp_path):
+    socket_path = str(tmp_path / "hung.sock")
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen()
+    model = RemoteModel("SESAR-material", socket_path, "fingerprint", request_timeout_seconds=0.2)
+    try:
+        with pytest.raises(RemoteInferenceException):
+            model.predict("some text")
+        assert getattr(model._local, "connection", None) is None
+        assert 1 == model.stats()["errors"]
+    finally:
+        listener.close()
+
+
+def test_parse_core_sets():
+    assert [[0, 1, 2, 3], [4, 6]] == parse_core_sets("0-3;4,6")
+    assert [[2]] == parse_core_sets("2;")
+
+
+def test_split_cores():
+    assert [[0, 1, 2], [3, 4, 5, 6]] == split_cores(list(range(7)), 2)
+    assert [[0], [1]] == split_cores([0, 1], 2)
+    with pytest.raises(ValueError):
+        split_cores([0], 2)
@@ -1,15 +1,22 @@
+import gzip
 import json
-from typing import List
+from typing import List, Tuple
 
+import msgpack
 import pytest
 from httpx import Response
 from starlette.testclient import TestClient
 
+import main
+from isamples_metadata.metadata_exceptions import SESARSampleTypeException
+from isamples_metadata.taxonomy.inference_executor import InferenceExecutor
+from isamples_metadata.taxonomy.model_startup import ModelStartup
 from isamples_metadata.taxonomy.metadata_models import (
     SampleTypePredictor,
     PredictionResult,
-    MaterialTypePredictor, SampledFeaturePredictor,
+    MaterialTypePredictor, SampledFeaturePredictor, RecordPrediction, OpenContextMaterialTypePredictor,
 )
+from isamples_metadata.taxonomy.OpenContextClassifierInput import OpenContextClassifierInput
 from main import (
     app,
     get_opencontext_sample_type_predictor,
@@ -22,17 +29,37 @@ from main import (
 def sample_type_fixture():
     class MockSampleTypePredictor(SampleTypePredictor):
         def predict_sample_type(self, source_record: dict) -> List[PredictionResult]:
+            if "malformed" in source_record:
+                raise KeyError("item_category")
             return [PredictionResult(value="sample", confidence=0.5)]
 
+        def predict_sample_type_for_input(self, oc_input: OpenContextClassifierInput) -> List[PredictionResult]:
+            return [PredictionResult(value=f"sample of {oc_input.get_sample_text()}", confidence=0.5)]
+
+        def predict_sample_type_batch(self, source_records: List[dict]) -> List[RecordPrediction]:
+            return [self.predict_sample_type(source_record) for source_record in source_records]
+
     return MockSampleTypePredictor()
 
 
 @pytest.fixture(name="material_type_predictor")
 def material_type_fixture():
-    class MockMaterialTypePredictor(MaterialTypePredictor):
+    class MockMaterialTypePredictor(OpenContextMaterialTypePredictor):
         def predict_material_type(self, source_record: dict) -> List[PredictionResult]:
+            if "malformed" in source_record:
+                raise KeyError("description")
             return [PredictionResult(value="material", confidence=0.5)]
 
+        def predict_material_type_for_input(self, oc_input: OpenContextClassifierInput) -> List[PredictionResult]:
+            return [PredictionResult(value=f"material of {oc_input.get_material_text()}", confidence=0.5)]
+
+        def predict_material_type_batch(self, source_records: List[dict]) -> List[RecordPrediction]:
+            return [
+                SESARSampleTypeException("excluded") if "excluded" in source_record
+                else self.predict_material_type(source_record)
+                for source_record in source_records
+            ]
+
     return MockMaterialTypePredictor()
 
 
@@ -42,6 +69,9 @@ def sampled_feature_fixture():
         def predict_sampled_feature(self, context: List[str]) -> str:
             return "sampled feature"
 
+        def predict_sampled_features(self, contexts: List[List[str]], k: int = 1) -> List[List[Tuple[str, float]]]:
+            return [[(f"feature of {' '.join(context)}", 0.5)] * k for context in contexts]
+
     return MockSampledFeaturePredictor()
 
 
@@ -100,12 +130,299 @@ def test_getopencontext_sample_type(client: TestClient):
     _post_to_modelserver(client, data_dict, "sample", "/opencontext")
 
 
+def test_opencontext_combined(client: TestClient):
+    data_dict = {"source_record": {"item category": "Coin", "project label": "Fort"}, "types": ["material", "sample"]}
+    response = client.post("/opencontext/combined", json=data_dict)
+    assert response.status_code == 200
+    response_data = response.json()
+    assert ["material", "sample"] == list(response_data)
+    assert "material of Fort , Coin " == response_data["material"][0]["value"]
+    assert "sample of Fort , Coin " == response_data["sample"][0]["value"]
+    # the record is parsed under the label of the first requested model
+    metrics = client.get("/metrics").text
+    assert 'isamples_prediction_stage_seconds_count{model="opencontext_material",stage="parse_thing"}' in metrics
+    assert 'model="opencontext",' not in metrics
+
+
+def test_opencontext_combined_single_type(client: TestClient):
+    data_dict = {"source_record": {"item category": "Coin"}, "types": ["sample", "sample"]}
+    response = client.post("/opencontext/combined", json=data_dict)
+    assert response.status_code == 200
+    assert ["sample"] == list(response.json())
+
+
+def test_opencontext_combined_rejects_context(client: TestClient):
+    data_dict = {"source_record": {"item category": "Coin"}, "types": ["context"]}
+    response = client.post("/opencontext/combined", json=data_dict)
+    assert response.status_code == 500
+
+
 def test_sesar_material_type(client: TestClient):
     data_dict = {"source_record": {"foo": "bar"}, "type": "material"}
     _post_to_modelserver(client, data_dict, "material", "/sesar")
 
 
+def _post_batch_to_modelserver(client, data_dict, handler) -> list:
+    post_data = json.dumps(data_dict).encode("utf-8")
+    response = client.post(handler, data=post_data)
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_opencontext_batch_sample_type(client: TestClient):
+    data_dict = {"source_records": [{"foo": "bar"}, {"foo": "baz"}], "type": "sample"}
+    response_data = _post_batch_to_modelserver(client, data_dict, "/opencontext/batch")
+    assert 2 == len(response_data)
+    for record_result in response_data:
+        assert record_result["exception"] is None
+        assert "sample" == record_result["predictions"][0]["value"]
+
+
+def test_sesar_batch_material_type(client: TestClient):
+    data_dict = {"source_records": [{"foo": "bar"}, {"excluded": "true"}], "type": "material"}
+    response_data = _post_batch_to_modelserver(client, data_dict, "/sesar/batch")
+    assert 2 == len(response_data)
+    assert "material" == response_data[0]["predictions"][0]["value"]
+    assert 0.5 == response_data[0]["predictions"][0]["confidence"]
+    assert "SESARSampleTypeException" == response_data[1]["exception"]
+    assert "excluded" == response_data[1]["message"]
+    assert [] == response_data[1]["predictions"]
+
+
+def test_sesar_batch_isolates_malformed_records(client: TestClient):
+    data_dict = {"source_records": [{"foo": "bar"}, {"malformed": "true"}, {"foo": "baz"}], "type": "material"}
+    response_data = _post_batch_to_modelserver(client, data_dict, "/sesar/batch")
+    assert ["material", None, "material"] == [
+        result["predictions"][0]["value"] if result["predictions"] else None for result in response_data
+    ]
+    assert "KeyError" == response_data[1]["exception"]
+    assert "description" in response_data[1]["message"]
+
+
+def test_opencontext_batch_isolates_malformed_records(client: TestClient):
+    for label_type in ("sample", "material"):
+        data_dict = {"source_records": [{"malformed": "true"}, {"foo": "bar"}], "type": label_type}
+        response_data = _post_batch_to_modelserver(client, data_dict, "/opencontext/batch")
+        assert "KeyError" == response_data[0]["exception"]
+        assert label_type == response_data[1]["predictions"][0]["value"]
+
+
+def test_sesar_batch_compact(client: TestClient):
+    data_dict = {"source_records": [{"foo": "bar"}, {"excluded": "true"}], "type": "material"}
+    response = client.post("/sesar/batch?compact=true", json=data_dict)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    response_data = response.json()
+    assert [["material", 0.5, "model"]] == response_data[0]["predictions"]
+    assert "SESARSampleTypeException" == response_data[1]["exception"]
+
+
+def test_sesar_batch_msgpack(client: TestClient):
+    data_dict = {"source_records": [{"foo": "bar"}], "type": "material"}
+    response = client.post("/sesar/batch", json=data_dict, headers={"Accept": "application/msgpack"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/msgpack"
+    assert "material" == msgpack.unpackb(response.content)[0]["predictions"][0]["value"]
+
+
+def test_sesar_rules(client: TestClient):
+    data_dict = {
+        "source_records": [
+            {"description": {"sampleType": "CTP"}},
+            {"description": {"sampleType": "Individual Sample", "description": "basalt"}},
+            {"description": {"sampleType": "Hole"}},
+        ],
+        "type": "material",
+    }
+    response_data = _post_batch_to_modelserver(client, data_dict, "/sesar/rules")
+    assert 3 == len(response_data)
+    assert "Liquid water" == response_data[0]["predictions"][0]["value"]
+    assert not response_data[0]["needs_model"]
+    assert response_data[1]["needs_model"]
+    assert [] == response_data[1]["predictions"]
+    assert "SESARSampleTypeException" == response_data[2]["exception"]
+    assert not response_data[2]["needs_model"]
+
+
+def test_sesar_rules_rejects_sample_type(client: TestClient):
+    response = client.post("/sesar/rules", json={"source_records": [], "type": "sample"})
+    assert response.status_code == 500
+
+
+def test_sesar_stream_material_type(client: TestClient):
+    lines = [
+        json.dumps({"id": "first", "source_record": {"foo": "bar"}}),
+        "",
+        json.dumps({"id": 2, "source_record": {"excluded": "true"}}),
+        "not json",
+        json.dumps({"source_record": {"foo": "baz"}}),
+    ]
+    response = client.post("/sesar/stream?type=material", content="\n".join(lines).encode("utf-8"))
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [0, 1, 2, 3] == [result["index"] for result in results]
+    assert "first" == results[0]["id"]
+    assert "material" == results[0]["predictions"][0]["value"]
+    assert 2 == results[1]["id"]
+    assert "SESARSampleTypeException" == results[1]["exception"]
+    assert "ValidationError" == results[2]["exception"]
+    assert results[3]["id"] is None
+    assert "material" == results[3]["predictions"][0]["value"]
+
+
+def test_opencontext_stream_sample_type(client: TestClient):
+    lines = [json.dumps({"id": index, "source_record": {"foo": index}}) for index in range(100)]
+    response = client.post("/opencontext/stream?type=sample", content="\n".join(lines).encode("utf-8"))
+    assert response.status_code == 200
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert list(range(100)) == [result["id"] for result in results]
+    for result in results:
+        assert "sample" == result["predictions"][0]["value"]
+
+
+def test_ndjson_line_splitter():
+    splitter = main.NdjsonLineSplitter(max_line_bytes=8)
+    lines = splitter.feed(b"first\n\nsec") + splitter.feed(b"ond\n" + b"x" * 5) + splitter.feed(b"x" * 5 + b"\nlast")
+    lines += splitter.finish()
+    assert [b"first", b"second", "LineTooLongError", b"last"] == [
+        line if isinstance(line, bytes) else line.__class__.__name__ for line in lines
+    ]
+
+
+def test_stream_reports_too_long_lines(client: TestClient, monkeypatch):
+    monkeypatch.setenv("STREAM_MAX_LINE_BYTES", "100")
+    lines = [
+        json.dumps({"id": 0, "source_record": {"foo": "bar"}}),
+        json.dumps({"id": 1, "source_record": {"foo": "x" * 200}}),
+        json.dumps({"id": 2, "source_record": {"foo": "baz"}}),
+    ]
+    response = client.post("/sesar/stream?type=material", content="\n".join(lines).encode("utf-8"))
+    assert response.status_code == 200
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [0, 1, 2] == [result["index"] for result in results]
+    assert "LineTooLongError" == results[1]["exception"]
+    assert [0, None, 2] == [result["id"] for result in results]
+    assert "material" == results[2]["predictions"][0]["value"]
+
+
+def test_gzip_stream(client: TestClient):
+    lines = [json.dumps({"id": index, "source_record": {"foo": index}}) for index in range(100)]
+    with client.stream(
+        "POST",
+        "/opencontext/stream?type=sample",
+        content=gzip.compress("\n".join(lines).encode("utf-8")),
+        headers={"Content-Encoding": "gzip", "Accept-Encoding": "gzip"},
+    ) as response:
+        assert response.status_code == 200
+        assert "gzip" == response.headers["content-encoding"]
+        body = gzip.decompress(b"".join(response.iter_raw()))
+    results = [json.loads(line) for line in body.splitlines()]
+    assert list(range(100)) == [result["id"] for result in results]
+
+
+def test_cache_stats(client: TestClient):
+    response = client.get("/cache")
+    assert response.status_code == 200
+    stats = response.json()
+    for key in ["size", "max_size", "hits", "misses", "evictions", "expirations", "hit_rate"]:
+        assert key in stats
+
+
+def test_model_stats(client: TestClient):
+    response = client.get("/models")
+    assert response.status_code == 200
+    assert type(response.json()) is dict
+
+
+def test_executor_stats(client: TestClient):
+    _post_to_modelserver(client, {"type": "material", "source_record": {}}, "material", "/sesar")
+    response = client.get("/executors")
+    assert response.status_code == 200
+    stats = response.json()["sesar_material"]
+    assert stats["completed"] >= 1
+    for key in ["pending", "queued", "rejected", "mean_wait_seconds", "max_wait_seconds"]:
+        assert key in stats
+
+
+def test_full_executor_queue_returns_503(client: TestClient, monkeypatch):
+    executor = InferenceExecutor("sesar_material", max_workers=1, max_queue_depth=1, retry_after_seconds=2)
+    # occupy the only queue slot
+    executor._admit(force=False)
+    monkeypatch.setattr(main, "get_inference_executor", lambda name: executor)
+    post_data = json.dumps({"type": "material", "source_record": {}}).encode("utf-8")
+    for handler in ["/sesar", "/sesar/stream?type=material"]:
+        response = client.post(handler, content=post_data)
+        assert response.status_code == 503
+        assert "2" == response.headers["retry-after"]
+        assert "InferenceQueueFullException" == response.json()["exception"]
+
+
+def test_sesar_rules_runs_while_the_model_is_overloaded(client: TestClient, monkeypatch):
+    full_executor = InferenceExecutor("sesar_material", max_workers=1, max_queue_depth=1)
+    full_executor._admit(force=False)
+    get_inference_executor = main.get_inference_executor
+    monkeypatch.setattr(
+        main,
+        "get_inference_executor",
+        lambda name: full_executor if name == "sesar_material" else get_inference_executor(name),
+    )
+    assert 503 == client.post("/sesar", json={"type": "material", "source_record": {}}).status_code
+    response = client.post(
+        "/sesar/rules", json={"type": "material", "source_records": [{"description": {"sampleType": "CTP"}}]}
+    )
+    assert response.status_code == 200
+    assert "Liquid water" == response.json()[0]["predictions"][0]["value"]
+
+
+def test_health_live(client: TestClient):
+    response = client.get("/health/live")
+    assert response.status_code == 200
+    assert "alive" == response.json()["status"]
+
+
+def test_health_ready(client: TestClient, monkeypatch):
+    startup = ModelStartup(loaders={})
+    monkeypatch.setattr(main, "MODEL_STARTUP", startup)
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert "starting" == response.json()["status"]
+    startup.state = ModelStartup.READY
+    startup.load_seconds = {"SESAR-material": 1.5}
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert "ready" == response.json()["status"]
+    assert {"SESAR-material": 1.5} == response.json()["load_seconds"]
+
+
+def test_metrics(client: TestClient):
+    _post_to_modelserver(client, {"type": "material", "source_record": {}}, "material", "/sesar")
+    _post_batch_to_modelserver(
+        client, {"type": "material", "source_records": [{}, {"excluded": True}]}, "/sesar/batch"
+    )
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'isamples_request_seconds_count{endpoint="single",model="sesar_material"}' in response.text
+    assert 'isamples_metadata_exceptions_total{exception="SESARSampleTypeException",model="sesar_material"}' in response.text
+
+
 def test_smithsonian_sampled_feature(client: TestClient):
     data_dict = {"type": "context", "input": ["foo"]}
     response = _post_to_modelserver(client, data_dict, "sampled feature", "/smithsonian", False)
     assert response.text == "\"sampled feature\""
+
+
+def test_smithsonian_batch(client: TestClient):
+    data_dict = {"type": "context", "inputs": [["foo"], ["bar", "baz"]], "top_k": 2}
+    response = client.post("/smithsonian/batch", json=data_dict)
+    assert response.status_code == 200
+    response_data = response.json()
+    assert [2, 2] == [len(predictions) for predictions in response_data]
+    assert "feature of bar baz" == response_data[1][0]["value"]
+    assert 0.5 == response_data[1][0]["confidence"]
+
+
+def test_smithsonian_batch_rejects_invalid_top_k(client: TestClient):
+    response = client.post("/smithsonian/batch", json={"type": "context", "inputs": [["foo"]], "top_k": 0})
+    assert response.status_code == 422
@@ -0,0 +1,45 @@
+import fasttext
+import pytest
+
+from benchmarks import fixtures
+from isamples_metadata.taxonomy.isamplesfasttext import NOT_PROVIDED, SampledFeaturePredictor, format_input
+
+
+@pytest.fixture(name="fasttext_model", scope="module")
+def fasttext_model_fixture(tmp_path_factory):
+    model_path = str(tmp_path_factory.mktemp("fasttext") / "sampled_feature.bin")
+    fixtures.build_fasttext_model(model_path)
+    return fasttext.load_model(model_path)
+
+
+def test_format_input():
+    assert "marine waterbody\nsea" == format_input("Marine, water-body!\nSea")
+
+
+def test_predict_sampled_features(fasttext_model):
+    predictor = SampledFeaturePredictor("Smithsonian", fasttext_model)
+    contexts = [["Marine water body", "rock"], ["Subsurface\ncore", "ash"]]
+    results = predictor.predict_sampled_features(contexts, 3)
+    assert [3, 3] == [len(predictions) for predictions in results]
+    for predictions in results:
+        probabilities = [prob for _, prob in predictions]
+        assert probabilities == sorted(probabilities, reverse=True)
+        assert all(0 <= prob <= 1 for prob in probabilities)
+        assert all("_" not in label for label, _ in predictions)
+    assert results[0][0][0] == predictor.predict_sampled_feature(contexts[0])
+
+
+def test_predict_sampled_features_caches_formatted_inputs(fasttext_model):
+    predictor = SampledFeaturePredictor("Smithsonian", fasttext_model, cache_size=10)
+    first = predictor.predict_sampled_features([["Marine water body"]], 2)
+    # formats the same as the first input
+    assert first == predictor.predict_sampled_features([["marine, Water body!"]], 2)
+    assert 1 == predictor._cache.hits
+    # the number of labels is part of the key
+    assert 1 == len(predictor.predict_sampled_features([["Marine water body"]], 1)[0])
+
+
+def test_predict_sampled_features_without_model():
+    predictor = SampledFeaturePredictor("Smithsonian", None)
+    assert [[(NOT_PROVIDED, 0.0)], [(NOT_PROVIDED, 0.0)]] == predictor.predict_sampled_features([["a"], ["b"]])
+    assert NOT_PROVIDED == predictor.predict_sampled_feature(["a"])
@@ -1,3 +1,9 @@
+from transformers import BertTokenizer
+
+from isamples_metadata.taxonomy.Model import Model
+from isamples_metadata.taxonomy.export_onnx import export_model
+from isamples_metadata.taxonomy import export_torchscript
+from isamples_metadata.taxonomy.SESARClassifierInput import SESARClassifierInput
 from isamples_metadata.taxonomy.metadata_models import (
     MetadataModelLoader,
     SESARMaterialPredictor,
@@ -6,6 +12,7 @@ from isamples_metadata.taxonomy.metadata_models import (
 )
 import pytest
 import json
+import torch
 
 SESAR_test_values = [
     "./test_data/SESAR/raw/EOI00002Hjson-ld.json",
@@ -13,39 +20,143 @@ SESAR_test_values = [
     "./test_data/SESAR/raw/IE22301MWjson-ld.json",
 ]
 
+# dummy model config
+SESAR_CONFIG = {
+    "BERT_MODEL": "distilbert-base-uncased",
+    "FINE_TUNED_MODEL": "distilbert-base-uncased",
+    "CLASS_NAMES": [
+        "Biology",
+        "EarthMaterial",
+        "Gas",
+        "Ice",
+        "Liquid",
+        "Material",
+        "Mineral",
+        "NotApplicable",
+        "Organic Material",
+        "Other",
+        "Particulate",
+        "Rock",
+        "Sediment",
+        "Soil",
+        "experimentalMaterial",
+    ],
+    "MAX_SEQUENCE_LEN": 256,
+}
+
 
 @pytest.mark.parametrize("sesar_source_path", SESAR_test_values)
 def test_sesar_prediction_equal(sesar_source_path):
     _test_sesar_material_model(sesar_source_path)
 
 
+def test_sesar_batch_prediction_equal():
+    sesar_source_records = []
+    for sesar_source_path in SESAR_test_values:
+        with open(sesar_source_path) as source_file:
+            sesar_source_records.append(json.load(source_file))
+    smp = SESARMaterialPredictor(MetadataModelLoader.get_sesar_material_model(SESAR_CONFIG))
+    batch_results = smp.predict_material_type_batch(sesar_source_records)
+    assert len(sesar_source_records) == len(batch_results)
+    for sesar_source_record, batch_result in zip(sesar_source_records, batch_results):
+        single_result = smp.predict_material_type(sesar_source_record)
+        assert [result.value for result in single_result] == [result.value for result in batch_result]
+        for single, batched in zip(single_result, batch_result):
+            assert single.confidence == pytest.approx(batched.confidence, abs=1e-5)
+
+
+def _sesar_material_texts():
+    texts = []
+    for sesar_source_path in SESAR_test_values:
+        with open(sesar_source_path) as source_file:
+            sesar_input = SESARClassifierInput(json.load(source_file))
+        sesar_input.parse_thing()
+        texts.append(sesar_input.get_material_text())
+    return texts
+
+
+@pytest.mark.parametrize("padding", ["longest", "bucket"])
+def test_dynamic_padding_matches_max_length_padding(padding):
+    texts = _sesar_material_texts()
+    model = Model(SESAR_CONFIG)
+    max_length_predictions = model.predict_batch(texts)
+    model.padding = padding
+    dynamic_predictions = model.predict_batch(texts)
+    single_predictions = [model.predict(text) for text in texts]
+    for expected, *actuals in zip(max_length_predictions, dynamic_predictions, single_predictions):
+        for actual in actuals:
+            assert [label for label, _ in expected] == [label for label, _ in actual]
+            assert [prob for _, prob in expected] == pytest.approx([prob for _, prob in actual], abs=1e-5)
+
+
+def test_fast_tokenizer_matches_slow_tokenizer():
+    texts = _sesar_material_texts()
+    model = Model({**SESAR_CONFIG, "PADDING": "longest"})
+    slow_tokenizer = BertTokenizer.from_pretrained(SESAR_CONFIG["BERT_MODEL"])
+    expected = slow_tokenizer.batch_encode_plus(
+        texts, max_length=SESAR_CONFIG["MAX_SEQUENCE_LEN"], padding="longest", truncation=True, return_tensors="pt"
+    )
+    # the second encode is served by the token ids cache
+    for _ in range(2):
+        input_ids, attention_mask = model.encode(texts)
+        assert torch.equal(expected["input_ids"], input_ids)
+        assert torch.equal(expected["attention_mask"], attention_mask)
+    assert len(texts) == model.stats()["tokenization_cache"]["hits"]
+
+
+def test_dynamic_int8_quantization_agrees_with_fp32():
+    texts = _sesar_material_texts()
+    # seed so that both models initialize the same classification head
+    torch.manual_seed(0)
+    fp32_model = Model(SESAR_CONFIG)
+    torch.manual_seed(0)
+    int8_model = Model({**SESAR_CONFIG, "QUANTIZATION": "dynamic_int8"})
+    assert isinstance(int8_model.backend.classifier.classifier, torch.ao.nn.quantized.dynamic.Linear)
+    # the dummy config isn't fine-tuned, so labels may be near ties; compare the top confidences instead
+    for fp32_predictions, int8_predictions in zip(fp32_model.predict_batch(texts), int8_model.predict_batch(texts)):
+        assert [prob for _, prob in fp32_predictions] == pytest.approx([prob for _, prob in int8_predictions], abs=0.05)
+
+
+def test_onnxruntime_backend_matches_torch_backend(tmp_path):
+    pytest.importorskip("onnxruntime")
+    texts = _sesar_material_texts()
+    onnx_config = {**SESAR_CONFIG, "BACKEND": "onnxruntime", "ONNX_MODEL": str(tmp_path / "model.onnx")}
+    # seed so that the exported and the torch model initialize the same classification head
+    torch.manual_seed(0)
+    export_model(onnx_config)
+    torch.manual_seed(0)
+    torch_model = Model(SESAR_CONFIG)
+    onnx_model = Model({**onnx_config, "PADDING": "longest"})
+    for torch_predictions, onnx_predictions in zip(torch_model.predict_batch(texts), onnx_model.predict_batch(texts)):
+        assert [label for label, _ in torch_predictions] == [label for label, _ in onnx_predictions]
+        assert [prob for _, prob in torch_predictions] == pytest.approx([prob for _, prob in onnx_predictions], abs=1e-4)
+
+
+def test_torchscript_artifact_matches_torch_backend(tmp_path):
+    texts = _sesar_material_texts()
+    torchscript_config = {**SESAR_CONFIG, "TORCHSCRIPT_MODEL": str(tmp_path / "model.torchscript.pt")}
+    torch.manual_seed(0)
+    torch_model = Model(torchscript_config)
+    assert not torch_model.backend.compiled
+    # seed so that the compiled and the torch model initialize the same classification head
+    torch.manual_seed(0)
+    export_torchscript.export_model(torchscript_config)
+    compiled_model = Model({**torchscript_config, "PADDING": "longest"})
+    assert compiled_model.backend.compiled
+    assert torch_model.fingerprint != compiled_model.fingerprint
+    for torch_predictions, compiled_predictions in zip(
+        torch_model.predict_batch(texts), compiled_model.predict_batch(texts)
+    ):
+        assert [label for label, _ in torch_predictions] == [label for label, _ in compiled_predictions]
+        assert [prob for _, prob in torch_predictions] == pytest.approx(
+            [prob for _, prob in compiled_predictions], abs=1e-4
+        )
+
+
 def _test_sesar_material_model(sesar_source_path):
     with open(sesar_source_path) as source_file:
         sesar_source_record = json.load(source_file)
-    # set dummy model config
-    sesar_config = {
-        "BERT_MODEL": "distilbert-base-uncased",
-        "FINE_TUNED_MODEL": "distilbert-base-uncased",
-        "CLASS_NAMES": [
-            "Biology",
-            "EarthMaterial",
-            "Gas",
-            "Ice",
-            "Liquid",
-            "Material",
-            "Mineral",
-            "NotApplicable",
-            "Organic Material",
-            "Other",
-            "Particulate",
-            "Rock",
-            "Sediment",
-            "Soil",
-            "experimentalMaterial",
-        ],
-        "MAX_SEQUENCE_LEN": 256,
-    }
-    sesar_model = MetadataModelLoader.get_sesar_material_model(sesar_config)
+    sesar_model = MetadataModelLoader.get_sesar_material_model(SESAR_CONFIG)
     # load the model predictor
     smp = SESARMaterialPredictor(sesar_model)
     assert smp is not None
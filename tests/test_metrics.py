@@ -0,0 +1,41 @@
+import pytest
+from prometheus_client import REGISTRY
+
+from isamples_metadata.metadata_exceptions import TestRecordException
+from isamples_metadata.taxonomy.metrics import count_cache_lookups, model_label, observe_request, timed_stage
+
+
+def sample(name, labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_model_label():
+    assert "sesar_material" == model_label("SESAR-material")
+    assert "smithsonian" == model_label("Smithsonian")
+
+
+def test_timed_stage():
+    labels = {"model": "test_stage", "stage": "parse_thing"}
+    before = sample("isamples_prediction_stage_seconds_count", labels)
+    with timed_stage("test_stage", "parse_thing"):
+        pass
+    assert before + 1 == sample("isamples_prediction_stage_seconds_count", labels)
+
+
+def test_observe_request_counts_metadata_exceptions():
+    with pytest.raises(TestRecordException):
+        with observe_request("test_request", "single"):
+            raise TestRecordException("test record")
+    with observe_request("test_request", "single"):
+        pass
+    assert 2 == sample("isamples_request_seconds_count", {"model": "test_request", "endpoint": "single"})
+    assert 1 == sample(
+        "isamples_metadata_exceptions_total", {"model": "test_request", "exception": "TestRecordException"}
+    )
+
+
+def test_count_cache_lookups():
+    count_cache_lookups("test_cache", "memory", 3, 1)
+    count_cache_lookups("test_cache", "memory", 0, 0)
+    assert 3 == sample("isamples_cache_lookups_total", {"model": "test_cache", "cache": "memory", "result": "hit"})
+    assert 1 == sample("isamples_cache_lookups_total", {"model": "test_cache", "cache": "memory", "result": "miss"})
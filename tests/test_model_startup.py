@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+import torch
+
+from benchmarks import fixtures
+from isamples_metadata.taxonomy import model_startup
+from isamples_metadata.taxonomy.Model import Model
+from isamples_metadata.taxonomy.backends import InferenceBackend
+from isamples_metadata.taxonomy.metadata_models import MetadataModelLoader
+from isamples_metadata.taxonomy.model_startup import ModelStartup, load_models, parse_batch_sizes
+
+
+class RecordingBackend(InferenceBackend):
+    def __init__(self, class_count):
+        self.class_count = class_count
+        self.shapes = []
+
+    def logits(self, input_ids, attention_mask):
+        self.shapes.append(tuple(input_ids.shape))
+        return torch.zeros((input_ids.shape[0], self.class_count))
+
+
+class WarmUpRecorder:
+    name = "recorder"
+
+    def __init__(self):
+        self.batch_sizes = None
+
+    def warm_up(self, batch_sizes):
+        self.batch_sizes = list(batch_sizes)
+
+
+def test_parse_batch_sizes():
+    assert [1, 16, 64] == parse_batch_sizes("1, 16,64")
+    assert [] == parse_batch_sizes("")
+
+
+def test_load_models_runs_concurrently():
+    # each loader waits for all the others, which only completes if they run at the same time
+    barrier = threading.Barrier(3, timeout=10)
+    load_seconds = load_models({name: barrier.wait for name in ["a", "b", "c"]})
+    assert ["a", "b", "c"] == sorted(load_seconds)
+
+
+def test_load_models_raises_the_failure():
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        load_models({"ok": lambda: None, "broken": fail})
+
+
+def test_model_warm_up_covers_the_batch_sizes_and_buckets(tmp_path):
+    config = fixtures.build_model(str(tmp_path), fixtures.SESAR_MATERIAL_CLASSES, max_sequence_len=64)
+    config["PADDING"] = "bucket"
+    config["PADDING_BUCKETS"] = [16, 32]
+    backend = RecordingBackend(len(config["CLASS_NAMES"]))
+    model = Model(config, "SESAR-material", backend)
+    model.warm_up([1, 4])
+    assert [(1, 16), (1, 32), (1, 64), (4, 16), (4, 32), (4, 64)] == backend.shapes
+    # the warm-up isn't counted as predictions
+    assert 0 == model.stats()["batches"]
+
+
+def test_startup_becomes_ready_after_the_warm_up(monkeypatch):
+    recorder = WarmUpRecorder()
+    monkeypatch.setattr(MetadataModelLoader, "loaded_models", staticmethod(lambda: [recorder]))
+    monkeypatch.setattr(model_startup, "parse_batch_sizes", lambda batch_sizes: [1, 8])
+    startup = ModelStartup(loaders={"recorder": lambda: None})
+    assert not startup.is_ready()
+    startup.start()
+    startup.join(timeout=10)
+    assert startup.is_ready()
+    assert [1, 8] == recorder.batch_sizes
+    status = startup.status()
+    assert ["recorder"] == list(status["load_seconds"])
+    assert ["recorder"] == list(status["warmup_seconds"])
+
+
+def test_startup_reports_a_failed_load():
+    def fail():
+        raise ValueError("boom")
+
+    startup = ModelStartup(loaders={"broken": fail})
+    startup.start()
+    startup.join(timeout=10)
+    assert not startup.is_ready()
+    assert ModelStartup.FAILED == startup.status()["status"]
+    assert "ValueError: boom" == startup.status()["error"]
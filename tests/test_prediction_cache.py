@@ -0,0 +1,131 @@
+import sqlite3
+import time
+
+from isamples_metadata.taxonomy.prediction_cache import PredictionCache, PersistentPredictionCache
+
+
+class CountingModel:
+    def __init__(self, identity: str, fingerprint: str = "fingerprint"):
+        self.identity = identity
+        self.name = "counting"
+        self.fingerprint = fingerprint
+        self.predicted_texts: list[str] = []
+
+    def predict(self, text):
+        return self.predict_batch([text])[0]
+
+    def predict_batch(self, texts):
+        self.predicted_texts.extend(texts)
+        return [[(f"{self.identity}:{text}", 1.0)] for text in texts]
+
+
+def test_cache_is_shared_by_model_identity():
+    cache = PredictionCache(max_size=10, ttl_seconds=0)
+    model = CountingModel("a")
+    other_model = CountingModel("b")
+    assert [("a:rock", 1.0)] == cache.predict(model, "rock")
+    assert [("a:rock", 1.0)] == cache.predict(model, "rock")
+    assert [("b:rock", 1.0)] == cache.predict(other_model, "rock")
+    assert ["rock"] == model.predicted_texts
+    stats = cache.stats()
+    assert 1 == stats["hits"]
+    assert 2 == stats["misses"]
+    assert 2 == stats["size"]
+
+
+def test_predict_batch_only_sends_misses_to_model():
+    cache = PredictionCache(max_size=10, ttl_seconds=0)
+    model = CountingModel("a")
+    cache.predict(model, "rock")
+    results = cache.predict_batch(model, ["soil", "rock", "water"])
+    assert [[("a:soil", 1.0)], [("a:rock", 1.0)], [("a:water", 1.0)]] == results
+    assert ["rock", "soil", "water"] == model.predicted_texts
+
+
+def test_size_eviction():
+    cache = PredictionCache(max_size=2, ttl_seconds=0)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    # touch "a" so that "b" is the least recently used entry
+    assert 1 == cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert 1 == cache.get("a")
+    assert 3 == cache.get("c")
+    assert 1 == cache.stats()["evictions"]
+
+
+def test_ttl_expiry():
+    cache = PredictionCache(max_size=2, ttl_seconds=0.01)
+    cache.put("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert 1 == stats["expirations"]
+    assert 0 == stats["size"]
+
+
+def test_disabled_cache():
+    cache = PredictionCache(max_size=0, ttl_seconds=0)
+    model = CountingModel("a")
+    cache.predict(model, "rock")
+    cache.predict(model, "rock")
+    assert ["rock", "rock"] == model.predicted_texts
+
+
+def test_persistent_cache_is_shared_across_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    model = CountingModel("a")
+    PredictionCache(10, 0, PersistentPredictionCache(path)).predict_batch(model, ["rock", "soil"])
+    # a fresh in-memory cache and model, as in another worker process or after a restart
+    restarted_model = CountingModel("b")
+    restarted_cache = PredictionCache(10, 0, PersistentPredictionCache(path))
+    assert [("a:rock", 1.0)] == restarted_cache.predict(restarted_model, "rock")
+    assert [[("a:rock", 1.0)], [("a:soil", 1.0)]] == restarted_cache.predict_batch(restarted_model, ["rock", "soil"])
+    assert [] == restarted_model.predicted_texts
+    assert 3 == restarted_cache.stats()["persistent"]["hits"] + restarted_cache.stats()["hits"]
+
+
+def test_persistent_cache_invalidated_by_fingerprint_change(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    PredictionCache(10, 0, PersistentPredictionCache(path)).predict(CountingModel("a", "v1"), "rock")
+    updated_model = CountingModel("b", "v2")
+    assert [("b:rock", 1.0)] == PredictionCache(10, 0, PersistentPredictionCache(path)).predict(updated_model, "rock")
+    assert ["rock"] == updated_model.predicted_texts
+    # the entries of the previous fingerprint are gone
+    assert {} == PersistentPredictionCache(path).get_many("v1", ["rock"])
+
+
+def test_persistent_cache_prunes_the_oldest_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(PersistentPredictionCache, "PRUNE_INTERVAL_ROWS", 0)
+    persistent = PersistentPredictionCache(str(tmp_path / "cache.sqlite3"), max_rows=2)
+    for text in ["rock", "soil", "water"]:
+        persistent.put_many("v1", [(text, [["label", 1.0]])])
+        # distinct timestamps, so the insertion order decides which rows are the oldest
+        time.sleep(0.01)
+    assert {"soil", "water"} == set(persistent.get_many("v1", ["rock", "soil", "water"]))
+    assert 1 == persistent.stats()["pruned"]
+
+
+def test_persistent_cache_expiry(tmp_path):
+    persistent = PersistentPredictionCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=0.01)
+    persistent.put_many("v1", [("rock", [["label", 1.0]])])
+    time.sleep(0.02)
+    # expired entries are ignored before they're pruned
+    assert {} == persistent.get_many("v1", ["rock"])
+    persistent.prune()
+    assert 1 == persistent.stats()["pruned"]
+
+
+def test_persistent_cache_timestamps_an_existing_database(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute(
+            "CREATE TABLE predictions (fingerprint TEXT NOT NULL, text_hash TEXT NOT NULL, "
+            "predictions TEXT NOT NULL, PRIMARY KEY (fingerprint, text_hash))"
+        )
+    connection.close()
+    persistent = PersistentPredictionCache(path)
+    persistent.put_many("v1", [("rock", [["label", 1.0]])])
+    assert {"rock": [("label", 1.0)]} == persistent.get_many("v1", ["rock"])
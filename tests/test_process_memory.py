@@ -0,0 +1,26 @@
+from isamples_metadata.process_memory import process_memory
+
+SMAPS_ROLLUP = """00400000-7ffd4a3f1000 ---p 00000000 00:00 0                          [rollup]
+Rss:              300000 kB
+Pss:              120000 kB
+Shared_Clean:     250000 kB
+Shared_Dirty:      30000 kB
+Private_Clean:      5000 kB
+Private_Dirty:     15000 kB
+Referenced:       300000 kB
+"""
+
+
+def test_process_memory(tmp_path):
+    smaps_rollup_path = tmp_path / "smaps_rollup"
+    smaps_rollup_path.write_text(SMAPS_ROLLUP)
+    memory = process_memory(str(smaps_rollup_path))
+    assert memory is not None
+    assert 300000 * 1024 == memory["rss"]
+    assert 120000 * 1024 == memory["pss"]
+    assert 280000 * 1024 == memory["shared"]
+    assert 20000 * 1024 == memory["unique"]
+
+
+def test_process_memory_unavailable(tmp_path):
+    assert process_memory(str(tmp_path / "missing")) is None
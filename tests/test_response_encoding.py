@@ -0,0 +1,60 @@
+import json
+
+import msgpack
+import pytest
+
+from isamples_metadata.response_encoding import (
+    JSON_MEDIA_TYPE,
+    MSGPACK_MEDIA_TYPE,
+    ResponseEncoding,
+    negotiate_media_type,
+    parse_accept,
+)
+from isamples_metadata.taxonomy.metadata_models import PredictionResult, RULE_STAGE
+from main import BatchPredictionResult
+
+CONTENT = [
+    BatchPredictionResult(predictions=[PredictionResult(value="Rock", confidence=0.75)]),
+    BatchPredictionResult(exception="SESARSampleTypeException", message="excluded"),
+    BatchPredictionResult(predictions=[PredictionResult(value="Liquid water", confidence=1.0, stage=RULE_STAGE)]),
+]
+
+
+def test_parse_accept():
+    assert [("application/msgpack", 1.0), ("application/json", 0.5), ("*/*", 0.0)] == parse_accept(
+        "application/msgpack, Application/JSON;q=0.5, */*;q=x"
+    )
+    assert [] == parse_accept(None)
+
+
+@pytest.mark.parametrize(
+    "accept,expected",
+    [
+        (None, JSON_MEDIA_TYPE),
+        ("*/*", JSON_MEDIA_TYPE),
+        ("text/html", JSON_MEDIA_TYPE),
+        ("application/msgpack", MSGPACK_MEDIA_TYPE),
+        ("application/x-msgpack, application/json;q=0.9", MSGPACK_MEDIA_TYPE),
+        ("application/msgpack;q=0.5, application/json", JSON_MEDIA_TYPE),
+    ],
+)
+def test_negotiate_media_type(accept, expected):
+    assert expected == negotiate_media_type(accept)
+
+
+def test_encode_json_matches_pydantic():
+    expected = [result.model_dump() for result in CONTENT]
+    assert expected == json.loads(ResponseEncoding().encode(CONTENT))
+
+
+def test_encode_compact():
+    assert [
+        {"predictions": [["Rock", 0.75, "model"]], "exception": None, "message": None},
+        {"predictions": [], "exception": "SESARSampleTypeException", "message": "excluded"},
+        {"predictions": [["Liquid water", 1.0, "rule"]], "exception": None, "message": None},
+    ] == json.loads(ResponseEncoding(compact=True).encode(CONTENT))
+
+
+def test_encode_msgpack():
+    encoded = ResponseEncoding(MSGPACK_MEDIA_TYPE, compact=True).encode(CONTENT)
+    assert ["Rock", 0.75, "model"] == msgpack.unpackb(encoded)[0]["predictions"][0]
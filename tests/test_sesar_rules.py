@@ -0,0 +1,103 @@
+import pytest
+
+from isamples_metadata.metadata_exceptions import SESARSampleTypeException, TestRecordException
+from isamples_metadata.taxonomy.metadata_models import (
+    RULE_BASED_CONFIDENCE,
+    SESARMaterialPredictor,
+    classify_sesar_by_rules,
+)
+from isamples_metadata.taxonomy.sesar_rules import SESAR_RULES, MultiPatternMatcher
+
+
+def _description_map(**fields) -> dict:
+    description_map = {"sampleType": "Individual Sample", "description": "basalt"}
+    description_map.update(fields)
+    return description_map
+
+
+def test_multi_pattern_matcher_prunes_redundant_patterns():
+    matcher = MultiPatternMatcher(["IEK", "IEKTS", "IEK", "XYZ"])
+    assert ("IEK", "IEKTS", "XYZ") == matcher.patterns
+    assert matcher.contains_any("IEKCM")
+    assert matcher.contains_any("AXYZ")
+    assert not matcher.contains_any("IE")
+
+
+@pytest.mark.parametrize(
+    "fields,expected",
+    [
+        ({"sampleType": "Core Section", "supplementMetadata_cruiseFieldPrgrm": "IODP 344"}, "Mixed soil, sediment, rock"),
+        ({"supplementMetadata_cruiseFieldPrgrm": "ODP 101"}, "Natural Solid Material"),
+        ({"sampleType": "Grab", "supplementMetadata_cruiseFieldPrgrm": "ODP", "description": "Macrofossil"}, "Rock"),
+        ({"sampleType": "Dredge"}, "Natural Solid Material"),
+        ({"sampleType": "Core", "supplementMetadata_primaryLocationType": "wetland"}, "Material"),
+        ({"sampleType": "U-channel"}, "Sediment"),
+        ({"sampleType": "CTP"}, "Liquid water"),
+        ({"sampleType": "Individual Sample>Cylinder"}, "Material"),
+        ({}, None),
+        ({"sampleType": "Core", "supplementMetadata_primaryLocationType": "outcrop"}, None),
+    ],
+)
+def test_classify(fields, expected):
+    assert expected == SESAR_RULES.classify("text", _description_map(**fields))
+
+
+def test_classify_uses_the_first_matching_rule():
+    # both the ODP core rule and the dredge rule apply
+    fields = {"sampleType": "Dredge Core", "supplementMetadata_cruiseFieldPrgrm": "ODP"}
+    assert "Mixed soil, sediment, rock" == SESAR_RULES.classify("text", _description_map(**fields))
+
+
+def test_excluded_records_raise():
+    with pytest.raises(SESARSampleTypeException):
+        SESAR_RULES.classify("text", _description_map(sampleType="Hole"))
+    with pytest.raises(TestRecordException):
+        SESAR_RULES.classify("text", _description_map(igsnPrefix="IEKTS"))
+
+
+def test_uninformative_record_is_labeled_material():
+    description_map = {"sampleType": "Rock chip", "description": ""}
+    assert not SESAR_RULES.is_informative("Rock chip", description_map)
+    assert "Material" == SESAR_RULES.classify("Rock chip", description_map)
+    assert SESAR_RULES.is_informative("Rock chip", {"sampleType": "Rock chip", "description": "chip"})
+
+
+def test_classify_sesar_by_rules():
+    results = classify_sesar_by_rules([
+        {"description": {"sampleType": "CTP"}},
+        {"description": {"sampleType": "Individual Sample", "description": "basalt"}},
+        {"description": {"sampleType": "Site"}},
+    ])
+    assert "Liquid water" == results[0][0].value
+    assert RULE_BASED_CONFIDENCE == results[0][0].confidence
+    assert results[1] is None
+    assert isinstance(results[2], SESARSampleTypeException)
+
+
+class UnusedModel:
+    name = "SESAR-material"
+
+    def predict_batch(self, texts):
+        raise AssertionError("the rules should have labelled the records")
+
+
+def test_predictor_labels_ctp_records_by_rule():
+    # the rule label used to be mapped to the controlled vocabulary twice, which raised a KeyError for CTP records
+    predictor = SESARMaterialPredictor(UnusedModel())
+    predictions = predictor.predict_material_type({"description": {"sampleType": "CTP"}})
+    assert [("Liquid water", RULE_BASED_CONFIDENCE)] == [
+        (prediction.value, prediction.confidence) for prediction in predictions
+    ]
+    assert "Liquid water" == predictor.predict_material_type_batch([{"description": {"sampleType": "CTP"}}])[0][0].value
+
+
+def test_deprecated_predictor_rule_methods_delegate_to_the_rules():
+    predictor = SESARMaterialPredictor(UnusedModel())
+    with pytest.deprecated_call():
+        assert "Liquid" == predictor.classify_by_sample_type({"sampleType": "CTP"})
+    with pytest.deprecated_call():
+        assert not predictor.check_invalid({"sampleType": "Individual Sample"})
+    with pytest.deprecated_call(), pytest.raises(SESARSampleTypeException):
+        predictor.check_invalid({"sampleType": "Hole"})
+    with pytest.deprecated_call():
+        assert not predictor.check_informative("Rock chip", {"sampleType": "Rock chip", "description": ""})